@@ -0,0 +1,93 @@
+"""
+Mide el rendimiento de generar_libro de principio a fin, sin red ni coste.
+
+Arranca el servidor de benchmarks/openai_stub.py en un hilo, apunta
+OPENAI_BASE_URL y DUCKDUCKGO_SEARCH_URL a él y genera --books libros
+seguidos con la caché de respuestas desactivada (--research activa la
+investigación previa y --hedge las llamadas duplicadas). Para cada libro muestra la duración y el tiempo
+acumulado de las etapas principales según su run_report.json, y al final el
+rendimiento en libros por minuto. Con la misma semilla y las mismas opciones,
+las respuestas, latencias y errores simulados son idénticos entre ejecuciones.
+
+Uso:
+    python benchmarks/bench_end_to_end.py [--books 3] [--formats epub] [--chat-latency lognormal:1.5,0.4]
+        [--image-latency lognormal:8,0.3] [--error-rate 0.02] [--replay cassettes/libro]
+        [--research --search-latency lognormal:0.2,0.5] [--hedge]
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from openai_stub import add_arguments, settings_from_args, start_in_thread
+
+# Etapas del informe que se muestran por libro
+REPORT_STAGES = ("content", "first_chapter", "search", "image", "download", "render", "export_epub", "export_pdf")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extremo a extremo con la API simulada")
+    parser.add_argument("--books", type=int, default=3, help="Libros que se generan")
+    parser.add_argument("--formats", default="epub", help="Formatos de salida separados por comas")
+    parser.add_argument("--research", action="store_true", help="Documentar los capítulos con búsquedas (en /search del servidor)")
+    parser.add_argument("--hedge", action="store_true", help="Duplicar las llamadas más lentas que el p95 reciente")
+    parser.add_argument("--title", default="El ciclo del agua", help="Título de los libros")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_in_thread(settings_from_args(args))
+    # La configuración lee OPENAI_BASE_URL al importarse: fijarla antes de importar main
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["DUCKDUCKGO_SEARCH_URL"] = base_url[:-len("/v1")] + "/search?q={}&format=json"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    from main import generar_libro
+    from modules.cache import configure_cache
+    from modules.openai_api import configure_hedging
+
+    configure_cache(enabled=False)
+    configure_hedging(args.hedge)
+    logging.getLogger().setLevel(logging.WARNING)
+    print(f"API simulada en {base_url}")
+
+    durations = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for n in range(1, args.books + 1):
+            book_dir = os.path.join(output_dir, f"libro_{n}")
+            started = time.perf_counter()
+            generar_libro(
+                titulo=f"{args.title} {n}", tema=args.title, publico="Niños", edad="8-10",
+                nivel_academico="básico", enfoque="práctico", formato_idioma="casual",
+                paginas_deseadas="40", profundidad="medio",
+                ruta_salida=os.path.join(book_dir, "libro.epub"), formatos=args.formats,
+                investigar=args.research
+            )
+            elapsed = time.perf_counter() - started
+            durations.append(elapsed)
+
+            with open(os.path.join(book_dir, "run_report.json"), "r", encoding="utf-8") as f:
+                report = json.load(f)
+            stages = ", ".join(
+                f"{stage} {report['stages'][stage]['seconds']:.2f} s"
+                for stage in REPORT_STAGES if stage in report["stages"]
+            )
+            retries = sum(v for k, v in report["counters"].items() if k.endswith("_retries"))
+            hedged = sum(v for k, v in report["counters"].items() if k.endswith("_hedged"))
+            print(f"Libro {n}: {elapsed:6.2f} s ({stages}; reintentos {retries}, duplicadas {hedged})")
+
+    server.shutdown()
+    total = sum(durations)
+    ordered = sorted(durations)
+    print(f"\n{len(durations)} libros en {total:.2f} s: {len(durations) / total * 60:.1f} libros/min, "
+          f"mediana {ordered[len(ordered) // 2]:.2f} s, máximo {ordered[-1]:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compara el rendimiento en serie y en paralelo del servicio de imágenes.
+
+Recodifica las ilustraciones de `images/` con los ajustes de capítulo de
+IMAGE_OPTIMIZATION, primero con un solo proceso y después con el pool.
+
+Uso:
+    python benchmarks/bench_image_service.py [--images images] [--workers N] [--repeat 1]
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.config import IMAGE_OPTIMIZATION
+from modules.image_optimizer import FORMAT_EXTENSIONS, transcode_image
+from modules.image_service import ImageProcessingService
+
+
+def run(service, sources, dest_dir, settings):
+    """Recodifica todas las imágenes y devuelve los segundos empleados."""
+    ext = FORMAT_EXTENSIONS[settings["format"]]
+    started = time.perf_counter()
+    futures = [
+        service.submit(transcode_image, src, os.path.join(dest_dir, f"{i}{ext}"), settings)
+        for i, src in enumerate(sources)
+    ]
+    for future in futures:
+        future.result()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del servicio de imágenes")
+    parser.add_argument("--images", default="images", help="Directorio con las imágenes de prueba")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos del modo paralelo")
+    parser.add_argument("--repeat", type=int, default=1, help="Veces que se repite el conjunto de imágenes")
+    args = parser.parse_args()
+
+    sources = sorted(glob.glob(os.path.join(args.images, "*.png"))) * args.repeat
+    if not sources:
+        sys.exit(f"No hay imágenes PNG en {args.images}")
+    settings = IMAGE_OPTIMIZATION["chapter"]
+
+    results = {}
+    for label, workers in (("serie", 1), ("paralelo", args.workers)):
+        service = ImageProcessingService(workers)
+        with tempfile.TemporaryDirectory() as dest_dir:
+            # Calentar el pool para no medir el arranque de los procesos
+            if workers > 1:
+                service.map(abs, range(workers))
+            elapsed = run(service, sources, dest_dir, settings)
+        service.shutdown()
+        results[label] = elapsed
+        print(f"{label:>9}: {len(sources)} imágenes en {elapsed:.2f} s "
+              f"({len(sources) / elapsed:.1f} img/s, {workers} procesos)")
+
+    print(f"  speedup: {results['serie'] / results['paralelo']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
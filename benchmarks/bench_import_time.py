@@ -0,0 +1,121 @@
+"""
+Control de regresiones en el tiempo de arranque.
+
+Importa `interfaz` y `main` en procesos nuevos con `python -X importtime`,
+muestra los módulos que más tardan y falla si:
+
+- el tiempo de importación supera el presupuesto (--budget-ms),
+- alguna dependencia pesada (openai, ebooklib, reportlab...) se carga al
+  importar, en lugar de hacerlo en el primer uso,
+- la ventana de la interfaz tarda en aparecer más que --window-budget-ms
+  (solo si hay pantalla disponible).
+
+Uso:
+    python benchmarks/bench_import_time.py [--budget-ms 300] [--window-budget-ms 1500] [--top 10]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencias que solo deben cargarse cuando se usan
+HEAVY_MODULES = ("openai", "httpx", "pydantic", "ebooklib", "bs4", "lxml", "requests", "PIL", "reportlab")
+
+FIRST_WINDOW_SNIPPET = """
+import time
+started = time.perf_counter()
+import tkinter as tk
+import interfaz
+root = tk.Tk()
+app = interfaz.GeneradorLibrosApp(root)
+root.update()
+print(time.perf_counter() - started)
+root.destroy()
+"""
+
+
+def import_profile(module):
+    """
+    Importa `module` en un proceso nuevo con -X importtime.
+
+    Returns:
+        tuple: (microsegundos totales, lista de (acumulado, nombre) de todos los módulos)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{result.stderr[-2000:]}")
+
+    entries = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        cumulative = int(cumulative)
+        entries.append((cumulative, name.strip()))
+        if not name.startswith("  "):  # Módulo de primer nivel
+            total += cumulative
+    return total, entries
+
+
+def first_window_time():
+    """Segundos hasta que la ventana de la interfaz está dibujada, o None sin pantalla."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_WINDOW_SNIPPET],
+        cwd=ROOT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        if "TclError" in result.stderr or "No module named 'tkinter'" in result.stderr:
+            return None
+        raise RuntimeError(f"No se pudo abrir la ventana:\n{result.stderr[-2000:]}")
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del tiempo de importación")
+    parser.add_argument("--budget-ms", type=float, default=300, help="Tiempo máximo de importación de cada módulo")
+    parser.add_argument("--window-budget-ms", type=float, default=1500, help="Tiempo máximo hasta la primera ventana")
+    parser.add_argument("--top", type=int, default=10, help="Módulos más lentos que se muestran")
+    args = parser.parse_args()
+
+    failures = []
+    for module in ("interfaz", "main"):
+        total, entries = import_profile(module)
+        loaded = {name.split(".")[0] for _, name in entries}
+        heavy = sorted(loaded.intersection(HEAVY_MODULES))
+
+        print(f"\nimport {module}: {total / 1000:.1f} ms")
+        for cumulative, name in sorted(entries, reverse=True)[:args.top]:
+            print(f"  {cumulative / 1000:8.1f} ms  {name.strip()}")
+
+        if total / 1000 > args.budget_ms:
+            failures.append(f"import {module} tarda {total / 1000:.1f} ms (presupuesto {args.budget_ms:.0f} ms)")
+        if heavy:
+            failures.append(f"import {module} carga dependencias pesadas: {', '.join(heavy)}")
+
+    window = first_window_time()
+    if window is None:
+        print("\nPrimera ventana: sin pantalla disponible, se omite")
+    else:
+        print(f"\nPrimera ventana: {window * 1000:.0f} ms (incluye el arranque del intérprete)")
+        if window * 1000 > args.window_budget_ms:
+            failures.append(f"la ventana tarda {window * 1000:.0f} ms (presupuesto {args.window_budget_ms:.0f} ms)")
+
+    if failures:
+        print()
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print("✅ Dentro del presupuesto")
+
+
+if __name__ == "__main__":
+    main()
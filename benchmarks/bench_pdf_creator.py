@@ -0,0 +1,101 @@
+"""
+Mide cómo escala el generador de PDF con la longitud del libro.
+
+Genera libros sintéticos de tamaño creciente (por defecto hasta unas 300
+páginas), los renderiza con assemble_pdf y muestra tiempo, memoria máxima
+(tracemalloc) y coste por página. Con un motor lineal, los segundos y los
+KB por página se mantienen aproximadamente constantes.
+
+Uso:
+    python benchmarks/bench_pdf_creator.py [--pages 300] [--steps 3] [--images images]
+"""
+
+import argparse
+import glob
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.pdf_creator import assemble_pdf
+
+WORDS = (
+    "la oruga come hojas verdes en el jardín y crece cada día hasta formar un capullo "
+    "donde duerme tranquila mientras su cuerpo cambia para convertirse en mariposa "
+    "de alas brillantes que vuela entre las flores buscando néctar y luz del sol"
+).split()
+
+PARAGRAPHS_PER_PAGE = 5.5  # Párrafos de ~90 palabras que caben en una página A4
+
+
+def synthetic_book(pages, image_paths=(), seed=1):
+    """Crea un book_content con ~`pages` páginas de texto y, si hay, imágenes."""
+    rng = random.Random(seed)
+    chapters = max(1, pages // 10)
+    paragraphs_per_chapter = max(1, int(pages * PARAGRAPHS_PER_PAGE // chapters))
+
+    def paragraph():
+        return " ".join(rng.choice(WORDS) for _ in range(90)).capitalize() + "."
+
+    book_content = {
+        "title": f"Libro sintético de {pages} páginas",
+        "description": "Libro generado para medir el rendimiento del PDF.",
+        "toc": {f"Capítulo {n}": f"Página {n * 10}" for n in range(1, chapters + 1)},
+        "introduction": "\n\n".join(paragraph() for _ in range(3)),
+        "chapters": [
+            {"title": f"Capítulo {n}", "content": "\n\n".join(paragraph() for _ in range(paragraphs_per_chapter))}
+            for n in range(1, chapters + 1)
+        ],
+        "exercises": [{"title": f"Ejercicio {n}", "description": paragraph()} for n in range(1, 6)],
+        "conclusion": "\n\n".join(paragraph() for _ in range(3)),
+        "bibliography": [f"Autor {n}. Obra {n}. Editorial, 2024." for n in range(1, 11)],
+    }
+    images = {}
+    if image_paths:
+        images["cover"] = [{"path": image_paths[0], "description": "Portada"}]
+        for n in range(1, chapters + 1):
+            path = image_paths[n % len(image_paths)]
+            images[f"chapter_{n}"] = [{"path": path, "description": f"Ilustración {n}"}]
+    return book_content, images
+
+
+def measure(pages, image_paths, output_dir):
+    """Renderiza un libro sintético y devuelve (páginas reales, segundos, MB máximos)."""
+    book_content, images = synthetic_book(pages, image_paths)
+    output_pdf = os.path.join(output_dir, f"bench_{pages}.pdf")
+    tracemalloc.start()
+    started = time.perf_counter()
+    assemble_pdf(book_content, images, output_pdf)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with open(output_pdf, "rb") as f:
+        real_pages = f.read().count(b"/Type /Page\n")
+    return real_pages, elapsed, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del generador de PDF")
+    parser.add_argument("--pages", type=int, default=300, help="Páginas del libro más largo")
+    parser.add_argument("--steps", type=int, default=3, help="Tamaños intermedios a medir")
+    parser.add_argument("--images", default=None, help="Directorio con imágenes JPEG/PNG para ilustrar los capítulos")
+    args = parser.parse_args()
+
+    image_paths = []
+    if args.images:
+        image_paths = sorted(glob.glob(os.path.join(args.images, "*.jp*g")) + glob.glob(os.path.join(args.images, "*.png")))
+
+    sizes = [args.pages * step // args.steps for step in range(1, args.steps + 1)]
+    with tempfile.TemporaryDirectory() as output_dir:
+        for pages in sizes:
+            real_pages, elapsed, peak_mb = measure(pages, image_paths, output_dir)
+            print(f"{real_pages:>5} páginas: {elapsed:6.2f} s ({elapsed / real_pages * 1000:5.1f} ms/página), "
+                  f"memoria máx. {peak_mb:6.1f} MB ({peak_mb * 1024 / real_pages:5.1f} KB/página)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Compara el renderizador XHTML con plantillas frente al recorrido anterior
+f-string -> BeautifulSoup -> str, y comprueba que ambos producen lo mismo.
+
+La comprobación de paridad extrae de cada página el texto visible (con los
+espacios normalizados) y la secuencia de imágenes, y exige que coincidan.
+Después mide el tiempo medio por página de cada implementación.
+
+La versión anterior necesita beautifulsoup4, que ya no es dependencia del
+proyecto (ver benchmarks/requirements.txt); sin él solo se mide el
+renderizador con plantillas.
+
+Uso:
+    python benchmarks/bench_xhtml_renderer.py [--book book_content.json] [--repeat 200]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from html.parser import HTMLParser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.book_model import build_book
+from modules.xhtml_renderer import render_page, render_section_body
+
+
+class _VisibleContent(HTMLParser):
+    """Recoge el texto visible del <body> y las imágenes en orden."""
+
+    def __init__(self):
+        super().__init__()
+        self.in_body = False
+        self.text = []
+        self.images = []
+
+    def handle_starttag(self, tag, attrs):
+        # Los límites de bloque cuentan como espacio, igual que un salto de línea
+        self.text.append(" ")
+        if tag == "body":
+            self.in_body = True
+        elif tag == "img" and self.in_body:
+            attrs = dict(attrs)
+            self.images.append((attrs.get("src"), attrs.get("alt")))
+
+    handle_startendtag = handle_starttag
+
+    def handle_endtag(self, tag):
+        self.text.append(" ")
+        if tag == "body":
+            self.in_body = False
+
+    def handle_data(self, data):
+        if self.in_body:
+            self.text.append(data)
+
+
+def visible_content(html):
+    """Devuelve (texto visible normalizado, imágenes) de una página."""
+    parser = _VisibleContent()
+    parser.feed(html)
+    parser.close()
+    return " ".join("".join(parser.text).split()), parser.images
+
+
+def legacy_pages(book_content, images):
+    """Genera las páginas como lo hacía la versión anterior (solo para comparar)."""
+    from bs4 import BeautifulSoup
+
+    def page(title, body):
+        html = f"""<!DOCTYPE html>
+    <html>
+    <head>
+        <title>{title}</title>
+        <link rel="stylesheet" type="text/css" href="style.css" />
+    </head>
+    <body>
+        {body}
+    </body>
+    </html>"""
+        return str(BeautifulSoup(html, "lxml"))
+
+    title = book_content["title"]
+    pages = [
+        page(title, f'<div class="cover"><h1>{title}</h1><p>{book_content["description"]}</p></div>'),
+        page(f"Índice - {title}", '<h1 class="toc-title">Índice</h1>\n' + "".join(
+            f'<div class="toc-entry">{n}. {chapter_title} - {p}</div>\n'
+            for n, (chapter_title, p) in enumerate(book_content["toc"].items(), 1)
+        )),
+        page(f"Introducción - {title}", f'<h1>Introducción</h1><div>{book_content["introduction"]}</div>'),
+    ]
+    for number, chapter in enumerate(book_content["chapters"], 1):
+        content = chapter["content"]
+        for img_idx, img_info in enumerate(images.get(f"chapter_{number}", [])):
+            img_tag = f'<img src="{os.path.basename(img_info["path"])}" alt="{img_info["description"]}" />'
+            paragraphs = content.split("\n\n")
+            if len(paragraphs) > (img_idx + 1) * 2:
+                paragraphs.insert((img_idx + 1) * 2, img_tag)
+            else:
+                paragraphs.append(img_tag)
+            content = "\n\n".join(paragraphs)
+        pages.append(page(f"Capítulo {number} - {title}", f'<h1>{chapter["title"]}</h1><div>{content}</div>'))
+    pages += [
+        page(f"Ejercicios - {title}", "<h1>Ejercicios y Actividades</h1>\n" + "".join(
+            f'<div class="exercise"><h3>Ejercicio {idx}: {ex["title"]}</h3><p>{ex["description"]}</p></div>'
+            for idx, ex in enumerate(book_content["exercises"], 1)
+        )),
+        page(f"Conclusión - {title}", f'<h1>Conclusión</h1><div>{book_content["conclusion"]}</div>'),
+        page(f"Bibliografía - {title}", '<h1>Bibliografía</h1><div class="bibliography">' + "".join(
+            f'<p class="bibliography-item">{idx}. {ref}</p>\n'
+            for idx, ref in enumerate(book_content["bibliography"], 1)
+        ) + "</div>"),
+    ]
+    return pages
+
+
+def template_pages(book_content, images):
+    """Genera las páginas con el modelo del libro y el renderizador de plantillas."""
+    book = build_book(book_content, images)
+    return [render_page(section.title, render_section_body(section)) for section in book.sections]
+
+
+def load_book(path):
+    """Carga un book_content.json, adaptando el formato antiguo si hace falta."""
+    with open(path, "r", encoding="utf-8") as f:
+        book_content = json.load(f)
+    book_content.setdefault("description", "")
+    if "toc" not in book_content:
+        book_content["toc"] = {
+            chapter["title"]: f"Página {n * 10}" for n, chapter in enumerate(book_content["chapters"], 1)
+        }
+    if isinstance(book_content.get("exercises"), str):
+        lines = [line.strip() for line in book_content["exercises"].splitlines() if line.strip()]
+        book_content["exercises"] = [{"title": line[:40], "description": line} for line in lines]
+    # Dos ilustraciones por capítulo para ejercitar la inserción de imágenes
+    images = {
+        f"chapter_{n}": [
+            {"path": f"chapter_{n}_{i}.png", "description": f"Ilustración {i} del capítulo {n}"}
+            for i in (1, 2)
+        ]
+        for n in range(1, len(book_content["chapters"]) + 1)
+    }
+    return book_content, images
+
+
+def timed(render, book_content, images, repeat):
+    """Devuelve los segundos medios por página de `render`."""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        pages = render(book_content, images)
+    return (time.perf_counter() - started) / (repeat * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del renderizador XHTML")
+    parser.add_argument("--book", default="book_content.json", help="Contenido del libro a renderizar")
+    parser.add_argument("--repeat", type=int, default=200, help="Veces que se renderiza el libro completo")
+    args = parser.parse_args()
+
+    book_content, images = load_book(args.book)
+    current = template_pages(book_content, images)
+    if importlib.util.find_spec("bs4") is None:
+        print("⚠️ beautifulsoup4 no está instalado (pip install -r benchmarks/requirements.txt): "
+              "se omiten la comprobación de paridad y la comparación con la versión anterior")
+        template_time = timed(template_pages, book_content, images, args.repeat)
+        print(f"   Plantillas: {template_time * 1e6:8.1f} µs/página")
+        return
+
+    legacy = legacy_pages(book_content, images)
+
+    mismatches = 0
+    for number, (old, new) in enumerate(zip(legacy, current), 1):
+        if visible_content(old) != visible_content(new):
+            mismatches += 1
+            print(f"❌ Página {number}: el texto visible o las imágenes no coinciden")
+    if mismatches or len(legacy) != len(current):
+        sys.exit(f"Paridad fallida en {mismatches} páginas")
+    print(f"✅ Paridad: {len(current)} páginas con el mismo texto visible e imágenes")
+
+    legacy_time = timed(legacy_pages, book_content, images, args.repeat)
+    template_time = timed(template_pages, book_content, images, args.repeat)
+    print(f"BeautifulSoup: {legacy_time * 1e6:8.1f} µs/página")
+    print(f"   Plantillas: {template_time * 1e6:8.1f} µs/página")
+    print(f"      speedup: {legacy_time / template_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,508 @@
+"""
+Servidor local que sustituye a la API de OpenAI en benchmarks y pruebas.
+
+Atiende los dos endpoints que usa el generador (chat/completions e
+images/generations) y sirve las imágenes por HTTP, así que basta con apuntar
+OPENAI_BASE_URL a él para ejecutar generar_libro sin red y sin coste. También
+imita la API de DuckDuckGo en /search para la investigación previa
+(DUCKDUCKGO_SEARCH_URL=http://127.0.0.1:8765/search?q={}).
+
+Modos:
+    sintético (por defecto)  Respuestas generadas con una semilla fija: un
+                             esquema de --chapters capítulos, capítulos de
+                             --chapter-words palabras e imágenes tomadas de
+                             --images (o PNG de color liso si no hay).
+    --record DIR             Reenvía cada solicitud a --upstream (la API real)
+                             y guarda la respuesta y las imágenes en DIR.
+    --replay DIR             Responde solo con lo grabado; una solicitud no
+                             grabada devuelve 404.
+
+La latencia (--chat-latency, --image-latency) se indica como "fixed:0.5",
+"uniform:0.2,1.5" o "lognormal:MEDIANA,SIGMA", y --error-rate /
+--rate-limit-rate inyectan errores 500 y 429 (con retry-after-ms);
+--truncate-rate corta esquemas como si se hubiera alcanzado max_tokens. Latencia
+y errores se deciden con la semilla, el contenido de la solicitud y el número
+de intento, de modo que dos ejecuciones iguales ven exactamente lo mismo.
+Con "stream": true el chat responde con eventos SSE: el primer trozo llega
+tras STREAM_FIRST_TOKEN de la latencia y el resto se reparte entre los demás
+(también al grabar o reproducir, que guardan la respuesta completa).
+
+Uso:
+    python benchmarks/openai_stub.py [--port 8765] [--images images] [--chat-latency lognormal:1.5,0.4]
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python main.py
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "el agua recorre la tierra y el cielo formando nubes que viajan con el viento "
+    "hasta caer como lluvia sobre los bosques los ríos y las ciudades donde las "
+    "personas la usan para beber cultivar alimentos y cuidar la vida de todos"
+).split()
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+# Fracción de la latencia del chat hasta el primer trozo de una respuesta por streaming
+STREAM_FIRST_TOKEN = 0.1
+# Caracteres de cada trozo de una respuesta por streaming
+STREAM_CHUNK_CHARS = 48
+
+# Cabeceras de la respuesta real que se reenvían al cliente al grabar
+FORWARDED_HEADERS = ("retry-after", "retry-after-ms")
+
+
+class LatencyModel:
+    """Distribución de latencias en segundos: fixed, uniform o lognormal."""
+
+    def __init__(self, kind="fixed", params=(0.0,)):
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec):
+        kind, _, values = spec.partition(":")
+        params = tuple(float(v) for v in values.split(",")) if values else (0.0,)
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(params) != expected[kind]:
+            raise ValueError(f"Latencia no válida: {spec} (p. ej. fixed:0.5, uniform:0.2,1.5, lognormal:1.0,0.4)")
+        return cls(kind, params)
+
+    def sample(self, rng):
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        median, sigma = self.params
+        return math.exp(rng.gauss(math.log(max(median, 1e-6)), sigma)) if median > 0 else 0.0
+
+
+class Cassette:
+    """Respuestas grabadas: DIR/index.jsonl y las imágenes en DIR/files."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files_dir = os.path.join(directory, "files")
+        self.index_path = os.path.join(directory, "index.jsonl")
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, entry):
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self.entries[entry["key"]] = entry
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def save_file(self, name, data):
+        os.makedirs(self.files_dir, exist_ok=True)
+        with open(os.path.join(self.files_dir, name), "wb") as f:
+            f.write(data)
+
+
+class StubSettings:
+    """Configuración del servidor; los valores por defecto no añaden latencia ni errores."""
+
+    def __init__(self, seed=1, chapters=8, chapter_words=600, images_dir=None, image_size=512,
+                 chat_latency=None, image_latency=None, search_latency=None, error_rate=0.0, rate_limit_rate=0.0,
+                 truncate_rate=0.0, requests_per_minute=5000, record_dir=None, replay_dir=None, upstream=None):
+        self.seed = seed
+        self.chapters = chapters
+        self.chapter_words = chapter_words
+        self.image_size = image_size
+        self.chat_latency = chat_latency or LatencyModel()
+        self.image_latency = image_latency or LatencyModel()
+        self.search_latency = search_latency or LatencyModel()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.truncate_rate = truncate_rate
+        self.requests_per_minute = requests_per_minute
+        self.upstream = (upstream or "https://api.openai.com/v1").rstrip("/")
+        self.images = sorted(
+            os.path.join(images_dir, name) for name in os.listdir(images_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        ) if images_dir and os.path.isdir(images_dir) else []
+        self.record = Cassette(record_dir) if record_dir else None
+        self.replay = Cassette(replay_dir) if replay_dir else None
+        self.attempts = {}
+        self.window = [time.monotonic(), 0]
+        self.lock = threading.Lock()
+
+
+def request_key(endpoint, body):
+    """Clave estable de una solicitud: endpoint y cuerpo JSON canónico (con o sin streaming)."""
+    body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+    canonical = json.dumps(body, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{endpoint}\n{canonical}".encode("utf-8")).hexdigest()
+
+
+def solid_png(size, rgb):
+    """PNG de color liso, sin depender de Pillow."""
+    row = b"\x00" + bytes(rgb) * size
+    raw = row * size
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+def synthetic_search(query, rng):
+    """Respuesta con el formato de la API instantánea de DuckDuckGo."""
+    def sentence():
+        return " ".join(rng.choice(WORDS) for _ in range(rng.randint(12, 25))).capitalize() + "."
+
+    return {
+        "Abstract": f"{query}: {sentence()}",
+        "Definition": "",
+        "RelatedTopics": [{"Text": sentence()} for _ in range(4)] + [{"Topics": [{"Text": sentence()} for _ in range(3)]}],
+    }
+
+
+def _paragraphs(rng, words):
+    paragraphs = []
+    while words > 0:
+        length = min(words, rng.randint(60, 110))
+        paragraphs.append(" ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + ".")
+        words -= length
+    return "\n\n".join(paragraphs)
+
+
+def synthetic_chat(settings, body, rng):
+    """
+    Devuelve (contenido JSON, tokens de la respuesta, finish_reason) imitando al modelo.
+
+    En la continuación de un esquema cortado solo se generan los capítulos
+    que faltan; con --truncate-rate el esquema puede llegar cortado ("length").
+    """
+    prompt = body.get("messages", [{}])[-1].get("content", "")
+    if '"chapters"' in prompt:
+        title = re.search(r"titulado '(.+?)'", prompt)
+        title = title.group(1) if title else "Libro de prueba"
+        first = re.search(r"empezando por el capítulo (\d+)", prompt)
+        first = int(first.group(1)) if first else 1
+        data = {
+            "title": title,
+            "description": f"Libro sintético sobre {title}.",
+            "chapters": [{"title": f"Capítulo {n}: {rng.choice(WORDS).capitalize()}", "summary": _paragraphs(rng, 30)}
+                         for n in range(first, settings.chapters + 1)],
+            "toc": {f"Capítulo {n}": f"página {n * 5}" for n in range(1, settings.chapters + 1)},
+            "introduction": _paragraphs(rng, 250),
+            "exercises": [{"title": f"Ejercicio {n}", "description": _paragraphs(rng, 40)} for n in range(1, 6)],
+            "conclusion": _paragraphs(rng, 250),
+            "bibliography": [f"Autor {n}. Obra {n}. Editorial, 2024." for n in range(1, 6)],
+        }
+    else:
+        data = {"content": _paragraphs(rng, settings.chapter_words)}
+    content = json.dumps(data, ensure_ascii=False)
+    finish_reason = "stop"
+    if '"chapters"' in prompt and rng.random() < settings.truncate_rate:
+        content = content[:int(len(content) * rng.uniform(0.3, 0.9))]
+        finish_reason = "length"
+    return content, len(content) // 4, finish_reason
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Atiende /v1/chat/completions, /v1/images/generations y /files/..."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "OpenAIStub/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def _base_url(self):
+        return f"http://{self.headers.get('Host', '%s:%s' % self.server.server_address[:2])}"
+
+    def _send(self, status, payload=b"", content_type="application/json", headers=None):
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, payload, duration=0.0, include_usage=False, headers=None):
+        """Envía una respuesta de chat como eventos SSE, repartiendo `duration` segundos entre los trozos."""
+        content = payload["choices"][0]["message"]["content"] or ""
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        def event(data):
+            line = f"data: {data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)}\n\n"
+            encoded = line.encode("utf-8")
+            self.wfile.write(f"{len(encoded):x}\r\n".encode("ascii") + encoded + b"\r\n")
+            self.wfile.flush()
+
+        base = {"id": payload.get("id", "chatcmpl-stub"), "object": "chat.completion.chunk",
+                "created": payload.get("created", int(time.time())), "model": payload.get("model", "gpt-4o")}
+        event({**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]})
+        for piece in pieces:
+            if duration:
+                time.sleep(duration / len(pieces))
+            event({**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+        finish_reason = payload["choices"][0].get("finish_reason") or "stop"
+        event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]})
+        if include_usage and payload.get("usage"):
+            event({**base, "choices": [], "usage": payload["usage"]})
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _rate_headers(self):
+        """Cabeceras x-ratelimit-* con una ventana de un minuto."""
+        settings = self.settings
+        with settings.lock:
+            now = time.monotonic()
+            if now - settings.window[0] >= 60:
+                settings.window = [now, 0]
+            settings.window[1] += 1
+            remaining = max(0, settings.requests_per_minute - settings.window[1])
+            reset_ms = int((60 - (now - settings.window[0])) * 1000)
+        return {
+            "x-ratelimit-limit-requests": str(settings.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(remaining),
+            "x-ratelimit-reset-requests": f"{reset_ms}ms",
+        }
+
+    def _rng(self, key):
+        """Generador determinista por solicitud e intento."""
+        with self.settings.lock:
+            attempt = self.settings.attempts.get(key, 0)
+            self.settings.attempts[key] = attempt + 1
+        return random.Random(f"{self.settings.seed}:{key}:{attempt}")
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path == "/search":
+            terms = urllib.parse.parse_qs(query).get("q", [""])[0]
+            rng = self._rng(request_key("search", {"q": terms}))
+            time.sleep(self.settings.search_latency.sample(rng))
+            return self._send(200, synthetic_search(terms, rng))
+        if path.startswith("/files/cassette/"):
+            cassette = self.settings.replay or self.settings.record
+            file_path = os.path.join(cassette.files_dir, os.path.basename(path)) if cassette else None
+        elif path.startswith("/files/local/"):
+            file_path = os.path.join(os.path.dirname(self.settings.images[0]), os.path.basename(path)) \
+                if self.settings.images else None
+        elif path.startswith("/files/synthetic/"):
+            color = bytes.fromhex(os.path.splitext(os.path.basename(path))[0][:6].ljust(6, "0"))
+            return self._send(200, solid_png(self.settings.image_size, color), "image/png")
+        else:
+            file_path = None
+        if not file_path or not os.path.isfile(file_path):
+            return self._send(404, {"error": {"message": "Archivo no encontrado"}})
+        with open(file_path, "rb") as f:
+            data = f.read()
+        content_type = "image/png" if file_path.endswith(".png") else "image/jpeg"
+        self._send(200, data, content_type)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        endpoint = self.path.split("?")[0].rstrip("/")
+        if endpoint.endswith("/chat/completions"):
+            kind = "chat"
+        elif endpoint.endswith("/images/generations"):
+            kind = "image"
+        else:
+            return self._send(404, {"error": {"message": f"Endpoint no soportado: {endpoint}"}})
+
+        key = request_key(kind, body)
+        settings = self.settings
+        stream = kind == "chat" and bool(body.get("stream"))
+        if settings.record:
+            return self._record(kind, body, key, stream)
+
+        rng = self._rng(key)
+        latency = (settings.chat_latency if kind == "chat" else settings.image_latency).sample(rng)
+        roll = rng.random()
+        # Por streaming solo se espera al primer trozo; el resto de la latencia se reparte al enviar
+        wait = latency * STREAM_FIRST_TOKEN if stream else latency
+        if wait:
+            time.sleep(wait)
+        if roll < settings.rate_limit_rate:
+            return self._send(429, {"error": {"message": "Rate limit reached (stub)", "type": "requests"}},
+                              headers={"retry-after-ms": "250", **self._rate_headers()})
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            return self._send(500, {"error": {"message": "Internal error (stub)", "type": "server_error"}})
+
+        if settings.replay:
+            entry = settings.replay.get(key)
+            if entry is None:
+                return self._send(404, {"error": {"message": "Solicitud no grabada en el cassette"}})
+            if stream:
+                return self._send_stream(entry["body"], latency - wait, self._include_usage(body), self._rate_headers())
+            payload = json.dumps(entry["body"], ensure_ascii=False).replace("cassette://", f"{self._base_url()}/files/cassette/")
+            return self._send(entry["status"], payload.encode("utf-8"), headers=self._rate_headers())
+
+        if kind == "chat":
+            content, completion_tokens, finish_reason = synthetic_chat(settings, body, rng)
+            prompt_tokens = sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4
+            payload = {
+                "id": f"chatcmpl-{key[:12]}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "gpt-4o"),
+                "choices": [{"index": 0, "finish_reason": finish_reason,
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                          "total_tokens": prompt_tokens + completion_tokens},
+            }
+            if stream:
+                return self._send_stream(payload, latency - wait, self._include_usage(body), self._rate_headers())
+        else:
+            if settings.images:
+                url = f"{self._base_url()}/files/local/{os.path.basename(settings.images[int(key, 16) % len(settings.images)])}"
+            else:
+                url = f"{self._base_url()}/files/synthetic/{key[:6]}.png"
+            payload = {"created": int(time.time()), "data": [{"url": url, "revised_prompt": body.get("prompt", "")}]}
+        self._send(200, payload, headers=self._rate_headers())
+
+    @staticmethod
+    def _include_usage(body):
+        return bool((body.get("stream_options") or {}).get("include_usage"))
+
+    def _record(self, kind, body, key, stream=False):
+        """
+        Reenvía la solicitud a la API real y guarda la respuesta (y sus imágenes).
+
+        Las solicitudes por streaming se reenvían sin él, para grabar la
+        respuesta completa, y se devuelven al cliente como eventos SSE.
+        """
+        settings = self.settings
+        suffix = "/chat/completions" if kind == "chat" else "/images/generations"
+        upstream_body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+        request = urllib.request.Request(
+            settings.upstream + suffix, data=json.dumps(upstream_body).encode("utf-8"), method="POST",
+            headers={"Content-Type": "application/json", "Authorization": self.headers.get("Authorization", "")}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=600) as response:
+                status, raw, headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, raw, headers = e.code, e.read(), e.headers
+        forwarded = {name: headers[name] for name in headers if name.lower().startswith("x-ratelimit-")}
+        forwarded.update({name: headers[name] for name in FORWARDED_HEADERS if headers.get(name)})
+        if status != 200:
+            # Los errores se devuelven al cliente pero no se graban
+            return self._send(status, raw, headers=forwarded)
+
+        payload = json.loads(raw)
+        if kind == "image":
+            for i, item in enumerate(payload.get("data", [])):
+                if item.get("url"):
+                    with urllib.request.urlopen(item["url"], timeout=120) as image:
+                        name = f"{key[:16]}_{i}.png"
+                        settings.record.save_file(name, image.read())
+                    item["url"] = f"cassette://{name}"
+        settings.record.put({"key": key, "kind": kind, "status": status, "body": payload})
+        if stream:
+            return self._send_stream(payload, include_usage=self._include_usage(body), headers=forwarded)
+        text = json.dumps(payload, ensure_ascii=False).replace("cassette://", f"{self._base_url()}/files/cassette/")
+        self._send(status, text.encode("utf-8"), headers=forwarded)
+
+
+def make_server(settings, host="127.0.0.1", port=0):
+    """Crea el servidor (port=0 elige un puerto libre); devuelve (servidor, base_url)."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.settings = settings
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def start_in_thread(settings, host="127.0.0.1", port=0):
+    """Arranca el servidor en un hilo de fondo; devuelve (servidor, base_url)."""
+    server, base_url = make_server(settings, host, port)
+    threading.Thread(target=server.serve_forever, name="openai-stub", daemon=True).start()
+    return server, base_url
+
+
+def add_arguments(parser):
+    """Opciones del servidor, compartidas con los benchmarks que lo arrancan."""
+    parser.add_argument("--seed", type=int, default=1, help="Semilla de las respuestas, latencias y errores")
+    parser.add_argument("--chapters", type=int, default=8, help="Capítulos del esquema sintético")
+    parser.add_argument("--chapter-words", type=int, default=600, help="Palabras de cada capítulo sintético")
+    parser.add_argument("--images", default=None, help="Directorio con imágenes para las respuestas de DALL-E")
+    parser.add_argument("--image-size", type=int, default=512, help="Lado de los PNG sintéticos si no hay --images")
+    parser.add_argument("--chat-latency", default="fixed:0", help="Latencia del chat, p. ej. lognormal:1.5,0.4")
+    parser.add_argument("--image-latency", default="fixed:0", help="Latencia de las imágenes, p. ej. lognormal:8,0.3")
+    parser.add_argument("--search-latency", default="fixed:0", help="Latencia de /search, p. ej. lognormal:0.2,0.5")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fracción de respuestas 429")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="Fracción de esquemas cortados por max_tokens")
+    parser.add_argument("--rpm", type=int, default=5000, help="Cuota anunciada en x-ratelimit-limit-requests")
+    parser.add_argument("--record", default=None, help="Grabar las respuestas de la API real en este directorio")
+    parser.add_argument("--replay", default=None, help="Responder con lo grabado en este directorio")
+    parser.add_argument("--upstream", default=None, help="URL de la API real al grabar")
+
+
+def settings_from_args(args):
+    return StubSettings(
+        seed=args.seed, chapters=args.chapters, chapter_words=args.chapter_words,
+        images_dir=args.images, image_size=args.image_size,
+        chat_latency=LatencyModel.parse(args.chat_latency), image_latency=LatencyModel.parse(args.image_latency),
+        search_latency=LatencyModel.parse(args.search_latency),
+        error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate, truncate_rate=args.truncate_rate,
+        requests_per_minute=args.rpm,
+        record_dir=args.record, replay_dir=args.replay, upstream=args.upstream,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que imita la API de OpenAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = make_server(settings_from_args(args), args.host, args.port)
+    mode = "grabando" if args.record else "reproduciendo" if args.replay else "sintético"
+    print(f"Servidor OpenAI local ({mode}) en {base_url}")
+    print(f"Usa: OPENAI_BASE_URL={base_url} OPENAI_API_KEY=stub python main.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
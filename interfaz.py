@@ -1,8 +1,39 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import os, sys
-from PIL import Image, ImageTk
-from main import generar_libro
+import os, sys, multiprocessing, queue, threading
+
+# Cada cuánto se revisa la cola de eventos del hilo de generación (~60 fps)
+INTERVALO_SONDEO_MS = 16
+# Segundos que se espera a que se detenga la generación al cerrar la ventana
+ESPERA_CIERRE_S = 5
+
+NOMBRES_ETAPAS = {
+    "content": "Contenido",
+    "images": "Imágenes",
+    "render": "Maquetación",
+    "export": "Exportación",
+    "done": "Listo",
+}
+
+def _formatear_bytes(n):
+    for unidad in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unidad}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+def _formatear_evento(evento):
+    texto = NOMBRES_ETAPAS.get(evento["stage"], evento["stage"])
+    if evento.get("total"):
+        texto += f" {evento['done']}/{evento['total']}"
+    if evento.get("eta"):
+        minutos, segundos = divmod(int(evento["eta"]), 60)
+        texto += f" · faltan {minutos}:{segundos:02d}"
+    if evento.get("bytes"):
+        texto += f" · {_formatear_bytes(evento['bytes'])}"
+    if evento.get("message"):
+        texto += f"\n{evento['message']}"
+    return texto
 
 class GeneradorLibrosApp:
     def __init__(self, root):
@@ -12,6 +43,9 @@ class GeneradorLibrosApp:
         self.root.resizable(False, False)
         self.root.configure(bg="#f5f5f5")
         self.ruta_pdf = None
+        self.cola_eventos = queue.Queue()
+        self.cancelacion = None
+        self.hilo = None
 
         # Icono (solo si existe)
         try:
@@ -21,6 +55,7 @@ class GeneradorLibrosApp:
             pass
 
         self._crear_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self._on_cerrar)
 
     def _ruta_recurso(self, rel):
         if getattr(sys, "frozen", False):
@@ -30,20 +65,12 @@ class GeneradorLibrosApp:
         return os.path.join(base, rel)
 
     def _crear_ui(self):
-        # Banner
-        frame_banner = ttk.Frame(self.root)
-        frame_banner.pack(pady=20)
-        try:
-            logo = Image.open(self._ruta_recurso("assets/logo_tei.png"))
-            logo = logo.resize((60,60), Image.LANCZOS)
-            img = ImageTk.PhotoImage(logo)
-            lbl = tk.Label(frame_banner, image=img, bg="#f5f5f5")
-            lbl.image = img
-            lbl.pack(side=tk.LEFT, padx=10)
-        except:
-            pass
-        tk.Label(frame_banner, text="Generador TEI",
+        # Banner (el logo se carga cuando la ventana ya está visible)
+        self.frame_banner = ttk.Frame(self.root)
+        self.frame_banner.pack(pady=20)
+        tk.Label(self.frame_banner, text="Generador TEI",
                  font=("Segoe UI", 18, "bold"), bg="#f5f5f5").pack(side=tk.LEFT)
+        self.root.after_idle(self._cargar_logo)
 
         # Formulario
         form = ttk.LabelFrame(self.root, text="Detalles del libro", padding=15)
@@ -73,18 +100,36 @@ class GeneradorLibrosApp:
         self.entry_ruta = ttk.Entry(self.frame_ruta); self.entry_ruta.pack(side=tk.LEFT,expand=True,fill=tk.X)
         ttk.Button(self.frame_ruta, text="Examinar…", command=self._sel_ruta).pack(side=tk.RIGHT)
 
-        # Estado y botones
-        self.lbl_estado = ttk.Label(self.root, text="", font=("Segoe UI",9,"italic"), background="#f5f5f5")
+        # Progreso, estado y botones
+        self.barra = ttk.Progressbar(self.root, mode="determinate", length=440)
+        self.barra.pack(padx=20, pady=(0,5))
+        self.lbl_estado = ttk.Label(self.root, text="", font=("Segoe UI",9,"italic"), background="#f5f5f5",
+                                    justify=tk.CENTER)
         self.lbl_estado.pack(pady=(0,10))
         btn_frame = ttk.Frame(self.root); btn_frame.pack(pady=10)
         style = ttk.Style(); style.configure("Accent.TButton", font=("Segoe UI",10,"bold"))
         self.btn_gen = ttk.Button(btn_frame, text="Generar Libro",
                                   style="Accent.TButton", command=self._on_generar)
         self.btn_gen.pack(side=tk.LEFT, padx=5, ipadx=10, ipady=5)
+        self.btn_cancelar = ttk.Button(btn_frame, text="Cancelar", state=tk.DISABLED,
+                                       command=self._on_cancelar)
+        self.btn_cancelar.pack(side=tk.LEFT, padx=5, ipadx=10, ipady=5)
         self.btn_open = ttk.Button(btn_frame, text="Abrir PDF", state=tk.DISABLED,
                                    command=self._on_abrir)
         self.btn_open.pack(side=tk.LEFT, padx=5, ipadx=10, ipady=5)
 
+    def _cargar_logo(self):
+        try:
+            from PIL import Image, ImageTk
+            logo = Image.open(self._ruta_recurso("assets/logo_tei.png"))
+            logo = logo.resize((60,60), Image.LANCZOS)
+            img = ImageTk.PhotoImage(logo)
+            lbl = tk.Label(self.frame_banner, image=img, bg="#f5f5f5")
+            lbl.image = img
+            lbl.pack(side=tk.LEFT, padx=10, before=self.frame_banner.winfo_children()[0])
+        except:
+            pass
+
     def _toggle_ruta(self):
         if self.var_guardar.get():
             self.frame_ruta.grid()
@@ -104,16 +149,98 @@ class GeneradorLibrosApp:
             messagebox.showerror("Error","Título y edad obligatorios."); return
         ruta = self.entry_ruta.get().strip() if self.var_guardar.get() else None
 
-        self.lbl_estado.config(text="Generando…"); self.btn_gen.config(state=tk.DISABLED); self.root.update()
+        # Importación diferida: main carga el pipeline y sus dependencias
+        from modules.progress import CancellationToken
+        self.cancelacion = CancellationToken()
+        self.lbl_estado.config(text="Generando…")
+        self.barra.config(mode="indeterminate"); self.barra.start(INTERVALO_SONDEO_MS)
+        self.btn_gen.config(state=tk.DISABLED); self.btn_open.config(state=tk.DISABLED)
+        self.btn_cancelar.config(state=tk.NORMAL)
+
+        # La generación corre en un hilo aparte; la interfaz solo lee la cola
+        self.hilo = threading.Thread(target=self._generar_en_segundo_plano,
+                                     args=(tit, pub, ed, ruta, self.cancelacion), daemon=True)
+        self.hilo.start()
+        self.root.after(INTERVALO_SONDEO_MS, self._revisar_cola)
+
+    def _generar_en_segundo_plano(self, tit, pub, ed, ruta, cancelacion):
+        """Se ejecuta en el hilo de trabajo: nunca toca los widgets, solo la cola."""
+        from main import generar_libro
+        from modules.batch import JOB_DEFAULTS
+        from modules.progress import GenerationCancelled
         try:
-            self.ruta_pdf = generar_libro(tit, pub, ed, ruta)
+            ruta_pdf = generar_libro(
+                titulo=tit, tema=tit, publico=pub, edad=ed, **JOB_DEFAULTS,
+                ruta_salida=ruta, formatos="pdf,epub",
+                progreso=lambda evento: self.cola_eventos.put(("progreso", evento)),
+                cancelar=cancelacion
+            )
+            self.cola_eventos.put(("fin", ruta_pdf))
+        except GenerationCancelled:
+            self.cola_eventos.put(("cancelado", None))
+        except Exception as e:
+            self.cola_eventos.put(("error", str(e)))
+
+    def _revisar_cola(self):
+        """Vacía la cola de eventos y actualiza la interfaz con el más reciente."""
+        ultimo_progreso, final = None, None
+        while True:
+            try:
+                tipo, dato = self.cola_eventos.get_nowait()
+            except queue.Empty:
+                break
+            if tipo == "progreso":
+                ultimo_progreso = dato
+            else:
+                final = (tipo, dato)
+
+        if ultimo_progreso:
+            self._mostrar_progreso(ultimo_progreso)
+        if final:
+            self._terminar(*final)
+        else:
+            self.root.after(INTERVALO_SONDEO_MS, self._revisar_cola)
+
+    def _mostrar_progreso(self, evento):
+        if evento.get("total"):
+            if str(self.barra.cget("mode")) != "determinate":
+                self.barra.stop(); self.barra.config(mode="determinate")
+            self.barra.config(maximum=evento["total"], value=evento["done"])
+        self.lbl_estado.config(text=_formatear_evento(evento))
+
+    def _terminar(self, tipo, dato):
+        self.barra.stop(); self.barra.config(mode="determinate", value=0)
+        self.btn_gen.config(state=tk.NORMAL); self.btn_cancelar.config(state=tk.DISABLED)
+        self.hilo = None
+        if tipo == "fin":
+            self.ruta_pdf = dato
+            self.barra.config(maximum=1, value=1)
             self.lbl_estado.config(text=f"Generado: {os.path.basename(self.ruta_pdf)}")
             self.btn_open.config(state=tk.NORMAL)
             messagebox.showinfo("Listo","¡Libro generado correctamente!")
-        except Exception as e:
-            self.lbl_estado.config(text="Error."); messagebox.showerror("Error",str(e))
-        finally:
-            self.btn_gen.config(state=tk.NORMAL)
+        elif tipo == "cancelado":
+            self.lbl_estado.config(text="Generación cancelada.")
+        else:
+            self.lbl_estado.config(text="Error."); messagebox.showerror("Error",dato)
+
+    def _on_cancelar(self):
+        if self.cancelacion:
+            self.cancelacion.cancel()
+            self.btn_cancelar.config(state=tk.DISABLED)
+            self.lbl_estado.config(text="Cancelando…")
+
+    def _on_cerrar(self):
+        if self.hilo and self.hilo.is_alive():
+            if not messagebox.askyesno("Salir","Hay una generación en curso. ¿Cancelarla y salir?"):
+                return
+            self.cancelacion.cancel()
+            self.lbl_estado.config(text="Cancelando…"); self.root.update_idletasks()
+            # Las llamadas en curso se abortan al cancelar; la exportación, si ya empezó, termina su archivo
+            self.hilo.join(ESPERA_CIERRE_S)
+            if self.hilo.is_alive():
+                messagebox.showwarning("Salir", "La generación no se detuvo a tiempo: la carpeta de "
+                                                "salida puede quedar incompleta.")
+        self.root.destroy()
 
     def _on_abrir(self):
         if self.ruta_pdf and os.path.exists(self.ruta_pdf):
@@ -126,6 +253,7 @@ class GeneradorLibrosApp:
             messagebox.showerror("Error","No se encontró el PDF.")
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = GeneradorLibrosApp(root)
     root.mainloop()
\ No newline at end of file
@@ -2,10 +2,21 @@ import os
 import logging
 import argparse
 import json
+import multiprocessing
+from functools import partial
 from modules.parser import parse_user_prompt
-from modules.content_builder import generate_book_content
-from modules.image_generator import generate_book_images
-from modules.epub_creator import assemble_epub  # Cambiado de pdf_creator a epub_creator
+from modules.pipeline import run_book_pipeline
+from modules.exporter import export_book, parse_formats
+from modules.cache import configure_cache
+from modules.openai_api import configure_hedging
+from modules.checkpoint import GenerationManifest
+from modules.progress import ProgressTracker, GenerationCancelled
+from modules.metrics import RunMetrics
+from modules.batch import run_batch
+from modules.config import (
+    BATCH_MAX_WORKERS, OUTPUT_DIR, EXPORT_FORMATS, RUN_REPORT_NAME, METRICS_TEXTFILE, RESEARCH_ENABLED,
+    HEDGE_ENABLED, DRAFT_SUFFIX, ensure_dirs
+)
 
 # Configuración del logger
 logging.basicConfig(
@@ -45,10 +56,38 @@ def obtener_parametros():
 def limpiar_nombre_archivo(nombre):
     return nombre.lower().replace(" ", "_").replace(":", "").replace("¿", "").replace("?", "").replace("¡", "").replace("!", "")
 
-def generar_libro(titulo, tema, publico, edad, nivel_academico, enfoque, formato_idioma, paginas_deseadas, profundidad, ruta_salida=None):
+def guardar_json(path, data, ensure_ascii=False):
+    """Guarda datos en JSON de forma atómica para no dejar archivos a medias."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=ensure_ascii)
+    os.replace(tmp_path, path)
+
+def guardar_metricas(metricas, directorio, archivo_prometheus=None, borrador=False):
+    """
+    Escribe el informe de la ejecución y, si se pide, el archivo de Prometheus.
+
+    Un borrador guarda su informe con DRAFT_SUFFIX para no pisar el del libro
+    real y no se exporta a Prometheus, para no mezclar sus tiempos con los de
+    las generaciones reales.
+    """
+    try:
+        if directorio:
+            base, extension = os.path.splitext(RUN_REPORT_NAME)
+            nombre = f"{base}{DRAFT_SUFFIX}{extension}" if borrador else RUN_REPORT_NAME
+            metricas.write_report(os.path.join(directorio, nombre))
+        if archivo_prometheus and not borrador:
+            metricas.write_prometheus(archivo_prometheus)
+    except OSError as e:
+        logger.warning(f"⚠️ No se pudieron guardar las métricas: {str(e)}")
+
+def generar_libro(titulo, tema, publico, edad, nivel_academico, enfoque, formato_idioma, paginas_deseadas, profundidad, ruta_salida=None, guardar_temporales=True, reanudar=False, optimizar_imagenes=True, formatos=None, progreso=None, cancelar=None, archivo_metricas=METRICS_TEXTFILE, investigar=RESEARCH_ENABLED, borrador=False):
     """
     Función para generar un libro desde la interfaz gráfica
     
+    El contenido, las imágenes y el XHTML de cada capítulo se generan en un
+    pipeline por etapas, de modo que cada capítulo avanza en cuanto está listo.
+    
     Args:
         titulo (str): Título del libro
         tema (str): Tema principal del libro
@@ -59,12 +98,37 @@ def generar_libro(titulo, tema, publico, edad, nivel_academico, enfoque, formato
         formato_idioma (str): Formato del lenguaje
         paginas_deseadas (str): Número aproximado de páginas
         profundidad (str): Nivel de profundidad
-        ruta_salida (str, optional): Ruta personalizada para guardar el EPUB
+        ruta_salida (str, optional): Ruta personalizada para guardar el libro;
+            la extensión se sustituye por la de cada formato
+        guardar_temporales (bool): Guardar book_content.json e images_info.json
+        reanudar (bool): Reutilizar el contenido y las imágenes válidas del
+            manifiesto de una ejecución anterior en el mismo directorio
+        optimizar_imagenes (bool): Reducir y recodificar las imágenes antes de empaquetarlas
+        formatos (str | list, optional): Formatos de salida, p. ej. "epub,pdf"
+            (por defecto EXPORT_FORMATS); cada uno se renderiza en su propio proceso
+        progreso (callable, optional): Recibe los eventos de avance de cada etapa
+            (ver modules.progress); se llama desde los hilos de trabajo
+        cancelar (CancellationToken, optional): Permite detener la generación
+            desde otro hilo; en ese caso se lanza GenerationCancelled
+        archivo_metricas (str, optional): Archivo .prom donde exportar las
+            métricas para Prometheus; el informe JSON de la ejecución se
+            guarda siempre junto a book_content.json
+        investigar (bool): Documentar cada capítulo con búsquedas web antes de
+            redactarlo (ver modules.web_search)
+        borrador (bool): Prueba de maquetación sin conexión: contenido de
+            relleno e ilustraciones dibujadas en local, sin llamadas a la API.
+            Se guarda con el sufijo DRAFT_SUFFIX para no pisar el libro real
         
     Returns:
-        str: Ruta del archivo EPUB generado
+        str: Ruta del archivo generado en el primer formato pedido
     """
+    metricas = RunMetrics()
+    output_dir = None
     try:
+        formatos = parse_formats(formatos)
+        tracker = ProgressTracker(progreso, cancelar)
+        metricas.set_info(title=titulo, formats=formatos, status="running", draft=borrador)
+
         # 1. Crear parámetros del libro
         book_params = {
             "title": titulo,
@@ -80,92 +144,154 @@ def generar_libro(titulo, tema, publico, edad, nivel_academico, enfoque, formato
 
         # 2. Definir nombre de salida
         if ruta_salida:
-            output_epub = ruta_salida
+            output_base = ruta_salida
         else:
-            output_epub = f"{limpiar_nombre_archivo(book_params['title'])}.epub"
+            output_base = f"{limpiar_nombre_archivo(book_params['title'])}.epub"
+        if borrador:
+            base, extension = os.path.splitext(output_base)
+            output_base = f"{base}{DRAFT_SUFFIX}{extension}"
         
-        output_dir = os.path.dirname(output_epub) or "."
+        output_dir = os.path.dirname(output_base) or "."
         os.makedirs(output_dir, exist_ok=True)
 
-        # 3. Generar contenido del libro (estructura base)
-        logger.info("🧠 Generando contenido del libro...")
-        book_content = generate_book_content(book_params)
-
-        # Guardar contenido temporal
+        # 3. Cargar puntos de control de una ejecución anterior
+        checkpoints = guardar_temporales or reanudar
+        manifest = GenerationManifest(output_dir, book_params)
         content_path = os.path.join(output_dir, "book_content.json")
-        with open(content_path, "w", encoding="utf-8") as f:
-            json.dump(book_content, f, indent=2, ensure_ascii=False)
-        logger.info(f"📄 Contenido guardado en: {content_path}")
+        images_path = os.path.join(output_dir, "images_info.json")
+        book_content = None
+        images = None
+        if reanudar:
+            manifest.load()
+            if manifest.stage_done("content"):
+                with open(content_path, "r", encoding="utf-8") as f:
+                    book_content = json.load(f)
+                logger.info(f"⏭️ Reanudando con el contenido guardado en: {content_path}")
+            # Las ilustraciones de borrador no se registran en el manifiesto
+            images = None if borrador else manifest.valid_images()
+            if images:
+                logger.info(f"⏭️ Reanudando con {len(images)} imágenes ya generadas")
 
-        # 4. Generar imágenes del libro
-        logger.info("🖼️ Generando imágenes del libro...")
-        images_dir = os.path.join(output_dir, "images")
-        images = generate_book_images(book_content, book_params, images_dir)
+        def guardar_contenido(content):
+            if checkpoints:
+                guardar_json(content_path, content)
+                manifest.mark_stage("content", content_path)
+                logger.info(f"📄 Contenido guardado en: {content_path}")
 
-        # Guardar información de imágenes
-        images_path = os.path.join(output_dir, "images_info.json")
-        with open(images_path, "w", encoding="utf-8") as f:
-            json.dump(images, f, indent=2)
-        logger.info(f"🗂️ Info de imágenes guardada en: {images_path}")
-
-        # 5. Crear EPUB
-        logger.info("📦 Ensamblando EPUB final...")
-        epub_path = assemble_epub(book_content, images, output_epub)
-        logger.info(f"✅ ¡Libro generado exitosamente! EPUB en: {epub_path}")
+        def guardar_imagen(key, key_images):
+            if checkpoints and not borrador:
+                manifest.mark_images(key, key_images)
+
+        # 4. Generar contenido, imágenes y capítulos en paralelo
+        logger.info("🧠 Generando contenido e imágenes del libro...")
+        images_dir = os.path.join(output_dir, "images_draft" if borrador else "images")
+        book_content, images, rendered_chapters = run_book_pipeline(
+            book_params, images_dir,
+            book_content=book_content,
+            images=images,
+            on_content=None if borrador else guardar_contenido,
+            on_image=guardar_imagen,
+            optimize_images=optimizar_imagenes and not borrador,
+            progress=tracker,
+            metrics=metricas,
+            research=investigar,
+            draft=borrador
+        )
+
+        if guardar_temporales and not borrador:
+            guardar_json(images_path, images, ensure_ascii=True)
+            logger.info(f"🗂️ Info de imágenes guardada en: {images_path}")
+
+        # 5. Exportar los formatos pedidos
+        tracker.check()
+        logger.info("📦 Ensamblando el libro final...")
+        tracker.set_total("export", len(formatos))
+        tracker.emit("export", f"Exportando {', '.join(f.upper() for f in formatos)}...")
+        output_paths = export_book(book_content, images, output_base, formatos, rendered_chapters, metrics=metricas)
+        for fmt, path in output_paths.items():
+            if checkpoints and not borrador:
+                manifest.mark_stage(fmt, path)
+            logger.info(f"✅ ¡Libro generado exitosamente! {fmt.upper()} en: {path}")
+            tracker.advance("export", f"{fmt.upper()} listo", bytes_written=os.path.getsize(path))
         
-        return epub_path
+        metricas.set_info(status="ok", outputs=output_paths)
+        tracker.emit("done", "¡Libro generado!", paths=output_paths)
+        return output_paths[formatos[0]]
 
+    except GenerationCancelled:
+        metricas.set_info(status="cancelled")
+        logger.warning("⏹️ Generación cancelada")
+        raise
     except Exception as e:
+        metricas.set_info(status="error", error=str(e))
         logger.exception("❌ Error en la generación del libro:")
         raise
+    finally:
+        guardar_metricas(metricas, output_dir, archivo_metricas, borrador)
 
 def main():
     parser = argparse.ArgumentParser(description="Generador de Libros Digitales TEI en formato EPUB")
     parser.add_argument("--output", "-o", type=str, help="Ruta para guardar el EPUB final")
     parser.add_argument("--no-temp", action="store_true", help="No guardar archivos temporales")
+    parser.add_argument("--cache-dir", type=str, help="Directorio de la caché de respuestas de la API")
+    parser.add_argument("--no-cache", action="store_true", help="No usar la caché de respuestas de la API")
+    parser.add_argument("--resume", action="store_true", help="Reanudar una generación anterior en el mismo directorio")
+    parser.add_argument("--no-optimize-images", action="store_true", help="Empaquetar las imágenes originales sin optimizar")
+    parser.add_argument("--metrics-textfile", type=str, default=METRICS_TEXTFILE, help="Archivo .prom para exportar las métricas a Prometheus")
+    parser.add_argument("--research", action="store_true", default=RESEARCH_ENABLED, help="Documentar los capítulos con búsquedas web")
+    parser.add_argument("--hedge", action="store_true", default=HEDGE_ENABLED, help="Duplicar las llamadas a la API más lentas que el p95 reciente")
+    parser.add_argument("--draft", action="store_true", help="Prueba de maquetación sin conexión: texto de relleno e ilustraciones locales")
+    parser.add_argument("--formats", type=str, default=",".join(EXPORT_FORMATS), help="Formatos de salida separados por comas (epub, pdf)")
+
+    subparsers = parser.add_subparsers(dest="comando")
+    batch_parser = subparsers.add_parser("batch", help="Generar libros en lote desde un archivo JSONL")
+    batch_parser.add_argument("jobs", type=str, help="Archivo JSONL con un trabajo (parámetros de generar_libro) por línea")
+    batch_parser.add_argument("--workers", "-w", type=int, default=BATCH_MAX_WORKERS, help="Libros que se generan a la vez")
+    batch_parser.add_argument("--results", type=str, help="Archivo JSONL de resultados (por defecto <jobs>.results.jsonl)")
+    batch_parser.add_argument("--output-dir", type=str, default=OUTPUT_DIR, help="Directorio base de los libros generados")
     args = parser.parse_args()
 
     try:
-        # 1. Obtener parámetros del libro
-        book_params = obtener_parametros()
+        formatos = parse_formats(args.formats)
+    except ValueError as e:
+        parser.error(str(e))
+    ensure_dirs()
+    configure_cache(args.cache_dir, enabled=not args.no_cache)
+    configure_hedging(args.hedge)
 
-        # 2. Definir nombre de salida
-        if args.output:
-            output_epub = args.output
-        else:
-            output_epub = f"{limpiar_nombre_archivo(book_params['title'])}.epub"
-        output_dir = os.path.dirname(output_epub) or "."
-        os.makedirs(output_dir, exist_ok=True)
-
-        # 3. Generar contenido del libro (estructura base)
-        logger.info("🧠 Generando contenido del libro...")
-        book_content = generate_book_content(book_params)
-
-        if not args.no_temp:
-            content_path = os.path.join(output_dir, "book_content.json")
-            with open(content_path, "w", encoding="utf-8") as f:
-                json.dump(book_content, f, indent=2, ensure_ascii=False)
-            logger.info(f"📄 Contenido guardado en: {content_path}")
-
-        # 4. Generar imágenes del libro
-        logger.info("🖼️ Generando imágenes del libro...")
-        images_dir = os.path.join(output_dir, "images")
-        images = generate_book_images(book_content, book_params, images_dir)
-
-        if not args.no_temp:
-            images_path = os.path.join(output_dir, "images_info.json")
-            with open(images_path, "w", encoding="utf-8") as f:
-                json.dump(images, f, indent=2)
-            logger.info(f"🗂️ Info de imágenes guardada en: {images_path}")
+    if args.comando == "batch":
+        generar = partial(generar_libro, guardar_temporales=not args.no_temp, reanudar=args.resume,
+                          optimizar_imagenes=not args.no_optimize_images, formatos=formatos,
+                          archivo_metricas=args.metrics_textfile, investigar=args.research,
+                          borrador=args.draft)
+        run_batch(args.jobs, generar, results_path=args.results, workers=args.workers, output_dir=args.output_dir)
+        return
 
-        # 5. Crear EPUB
-        logger.info("📦 Ensamblando EPUB final...")
-        epub_path = assemble_epub(book_content, images, output_epub)
-        logger.info(f"✅ ¡Libro generado exitosamente! EPUB en: {epub_path}")
+    # 1. Obtener parámetros del libro
+    book_params = obtener_parametros()
 
-    except Exception as e:
-        logger.exception("❌ Error en la generación del libro:")
-        raise
+    # 2. Generar el libro (los errores ya quedan registrados en generar_libro)
+    generar_libro(
+        titulo=book_params["title"],
+        tema=book_params["tema"],
+        publico=book_params["publico"],
+        edad=book_params["edad"],
+        nivel_academico=book_params["nivel_academico"],
+        enfoque=book_params["enfoque"],
+        formato_idioma=book_params["formato_idioma"],
+        paginas_deseadas=book_params["paginas_deseadas"],
+        profundidad=book_params["profundidad"],
+        ruta_salida=args.output,
+        guardar_temporales=not args.no_temp,
+        reanudar=args.resume,
+        optimizar_imagenes=not args.no_optimize_images,
+        formatos=formatos,
+        archivo_metricas=args.metrics_textfile,
+        investigar=args.research,
+        borrador=args.draft
+    )
 
 if __name__ == "__main__":
+    # Necesario para el pool de procesos de imágenes en los ejecutables de PyInstaller
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
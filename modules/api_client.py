@@ -0,0 +1,241 @@
+"""
+Cliente de OpenAI compartido por todo el proceso y cortacircuitos por tipo de llamada.
+
+`get_client()` crea una sola vez el cliente, con un pool httpx de conexiones
+persistentes de API_POOL_SIZE conexiones: el esquema, los capítulos, las
+imágenes y los libros de un lote reutilizan las mismas conexiones en vez de
+abrir un cliente por etapa. Los tiempos de espera y los reintentos de cada
+tipo de llamada están en API_ENDPOINTS y los aplica call_api.
+
+Cancelar una generación no cierra el cliente, que comparten todos los libros
+de un lote: `abort_on_cancel(token)` apunta las conexiones que usa el hilo
+actual dentro del bloque y, si se cancela el token, corta solo esas (ver
+http_transport), de modo que la llamada en curso falla al instante.
+
+`CircuitBreaker` cuenta los fallos seguidos del servicio (5xx o errores de
+conexión). Tras CIRCUIT_FAILURE_THRESHOLD se abre y las llamadas fallan al
+instante con `CircuitOpenError`, de modo que el contenido y las imágenes
+pasan a su camino alternativo sin esperar a cada reintento. Pasados
+CIRCUIT_RESET_TIMEOUT segundos deja pasar una llamada de prueba: si responde,
+se cierra; si falla, vuelve a abrirse.
+"""
+
+import logging
+import os
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from modules.config import (
+    OPENAI_BASE_URL, API_POOL_SIZE, API_ENDPOINTS, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: la llamada no se intenta."""
+
+
+class CircuitBreaker:
+    """
+    Cortacircuitos de un tipo de llamada a la API.
+
+    Args:
+        name (str): Nombre de la llamada ("chat", "image")
+        failure_threshold (int): Fallos seguidos que abren el circuito
+        reset_timeout (float): Segundos abierto antes de dejar pasar una prueba
+        clock (callable): Reloj monótono (inyectable para pruebas)
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Autoriza una llamada.
+
+        Raises:
+            CircuitOpenError: Si el circuito está abierto o ya hay una prueba en curso
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_timeout - (self.clock() - self._opened_at)
+                if remaining > 0:
+                    raise CircuitOpenError(f"API {self.name} no disponible, nuevo intento en {remaining:.0f} s")
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    raise CircuitOpenError(f"API {self.name} no disponible, comprobando si se ha recuperado")
+                self._probing = True
+
+    def record_success(self):
+        """El servicio respondió (aunque sea con un error del cliente): se cierra el circuito."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"🔌 API {self.name} recuperada, circuito cerrado")
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """El servicio falló (5xx o conexión); al llegar al umbral se abre el circuito."""
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and
+                                                self._failures >= self.failure_threshold):
+                logger.warning(f"🔌 Circuito de la API {self.name} abierto tras {self._failures} fallos seguidos; "
+                               f"se usará el camino alternativo durante {self.reset_timeout:.0f} s")
+                self.state = self.OPEN
+                self._opened_at = self.clock()
+            self._probing = False
+
+    def abandon(self):
+        """La llamada terminó sin veredicto (p. ej. por cancelación): libera la prueba si la había."""
+        with self._lock:
+            self._probing = False
+
+
+_client = None
+_client_lock = threading.Lock()
+_breakers = {}
+
+
+def get_client():
+    """
+    Devuelve el cliente de OpenAI compartido, creándolo la primera vez.
+
+    Los reintentos no los hace el cliente (`max_retries=0`) sino call_api. Si
+    hay un proxy configurado en el entorno se usa el transporte estándar de
+    httpx, cuyas solicitudes en curso no se pueden abortar al cancelar.
+
+    Raises:
+        ValueError: Si no está definida la variable de entorno OPENAI_API_KEY
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_key = os.environ.get('OPENAI_API_KEY')
+            if not api_key:
+                raise ValueError("No se encontró la clave API de OpenAI en las variables de entorno")
+            import httpx
+            import openai  # Importación diferida: openai tarda en cargar
+
+            limits = httpx.Limits(max_connections=API_POOL_SIZE, max_keepalive_connections=API_POOL_SIZE)
+            if urllib.request.getproxies():
+                logger.info("🌐 Proxy configurado: las llamadas en curso no se abortarán al cancelar")
+                http_client = openai.DefaultHttpxClient(limits=limits, timeout=endpoint_timeout("chat"))
+            else:
+                from modules.http_transport import AbortableTransport
+
+                http_client = openai.DefaultHttpxClient(transport=AbortableTransport(limits),
+                                                        timeout=endpoint_timeout("chat"))
+            _client = openai.OpenAI(api_key=api_key, base_url=OPENAI_BASE_URL, max_retries=0,
+                                    http_client=http_client)
+        return _client
+
+
+def close_client():
+    """
+    Cierra el cliente compartido y su pool de conexiones.
+
+    No aborta las solicitudes en curso ni debe usarse para cancelar una
+    generación (ver abort_on_cancel); la siguiente llamada a get_client crea
+    un cliente nuevo.
+    """
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+class _AbortScope:
+    """Conexiones que usa una solicitud mientras está en curso."""
+
+    def __init__(self):
+        self._streams = set()
+        self._aborted = False
+        self._lock = threading.Lock()
+
+    def track(self, stream):
+        """Apunta una conexión que va a usarse; devuelve False si la solicitud ya se abortó."""
+        with self._lock:
+            if self._aborted:
+                return False
+            self._streams.add(stream)
+            return True
+
+    def abort(self):
+        """Corta las conexiones apuntadas y hace fallar las siguientes lecturas."""
+        with self._lock:
+            self._aborted = True
+            streams, self._streams = self._streams, set()
+        for stream in streams:
+            stream.shutdown()
+
+    def finish(self):
+        """La solicitud terminó: sus conexiones vuelven al pool y ya no se cortan."""
+        with self._lock:
+            self._streams.clear()
+
+
+_local = threading.local()
+
+
+def current_abort_scope():
+    """Solicitud abortable en curso en el hilo actual, o None."""
+    return getattr(_local, "scope", None)
+
+
+@contextmanager
+def abort_on_cancel(cancel_token):
+    """
+    Corta las conexiones que use el hilo actual dentro del bloque si se cancela `cancel_token`.
+
+    Solo afecta a las conexiones del cliente de get_client y a las lecturas
+    hechas en este hilo mientras dura el bloque, incluidas las de una
+    respuesta por streaming si se recorre dentro de él.
+
+    Args:
+        cancel_token (CancellationToken, optional): Sin token, el bloque se ejecuta sin más
+    """
+    if cancel_token is None:
+        yield
+        return
+    scope, previous = _AbortScope(), current_abort_scope()
+    _local.scope = scope
+    cancel_token.on_cancel(scope.abort)
+    try:
+        yield
+    finally:
+        cancel_token.remove_callback(scope.abort)
+        _local.scope = previous
+        scope.finish()
+
+
+def endpoint_timeout(name):
+    """Tiempo de espera (openai.Timeout) de las llamadas `name` según API_ENDPOINTS."""
+    import openai
+
+    settings = API_ENDPOINTS[name]
+    return openai.Timeout(settings["read_timeout"], connect=settings["connect_timeout"])
+
+
+def get_circuit_breaker(name):
+    """Devuelve el cortacircuitos compartido de las llamadas `name`."""
+    with _client_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
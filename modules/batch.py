@@ -0,0 +1,135 @@
+"""
+Generación de libros en lote a partir de un archivo JSONL de trabajos.
+
+Cada línea del archivo es un objeto JSON con los mismos parámetros que
+`generar_libro` (titulo, tema, publico, edad, ...). Los trabajos se reparten
+entre un grupo de hilos que comparten los limitadores de tasa de la API, y el
+resultado de cada trabajo se añade a un archivo JSONL de resultados.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from modules.config import BATCH_MAX_WORKERS, OUTPUT_DIR
+from modules.parser import parse_user_prompt
+
+logger = logging.getLogger(__name__)
+
+# Parámetros obligatorios de cada trabajo
+JOB_REQUIRED_FIELDS = ["titulo", "tema", "publico", "edad"]
+
+# Valores por defecto para los parámetros opcionales de generar_libro
+JOB_DEFAULTS = {
+    "nivel_academico": "básico",
+    "enfoque": "práctico",
+    "formato_idioma": "casual",
+    "paginas_deseadas": "50",
+    "profundidad": "medio",
+}
+
+JOB_ALLOWED_FIELDS = set(JOB_REQUIRED_FIELDS) | set(JOB_DEFAULTS) | {"ruta_salida", "formatos"}
+
+
+def _slug(text):
+    """Convierte un título en un nombre de archivo seguro."""
+    slug = re.sub(r"[^\w]+", "_", text.lower(), flags=re.UNICODE).strip("_")
+    return slug or "libro"
+
+
+def load_jobs(jobs_path, output_dir=OUTPUT_DIR):
+    """
+    Lee y valida los trabajos de un archivo JSONL.
+
+    Args:
+        jobs_path (str): Ruta del archivo de trabajos
+        output_dir (str): Directorio base para los trabajos sin ruta_salida
+
+    Returns:
+        list: Tuplas (número de línea, parámetros o None, error o None)
+    """
+    jobs = []
+    with open(jobs_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                params = parse_user_prompt(line, required_fields=JOB_REQUIRED_FIELDS)
+                unknown = set(params) - JOB_ALLOWED_FIELDS
+                if unknown:
+                    raise ValueError(f"❌ Campos desconocidos: {', '.join(sorted(unknown))}")
+            except Exception as e:
+                jobs.append((line_number, None, str(e)))
+                continue
+
+            job = dict(JOB_DEFAULTS, **params)
+            if not job.get("ruta_salida"):
+                # Cada trabajo necesita su propio directorio (contenido, imágenes y manifiesto)
+                slug = _slug(job["titulo"])
+                job["ruta_salida"] = os.path.join(output_dir, f"{line_number:04d}_{slug}", f"{slug}.epub")
+            jobs.append((line_number, job, None))
+    return jobs
+
+
+def run_batch(jobs_path, generate_fn, results_path=None, workers=BATCH_MAX_WORKERS, output_dir=OUTPUT_DIR):
+    """
+    Genera todos los libros de un archivo de trabajos con un grupo de hilos.
+
+    Args:
+        jobs_path (str): Ruta del archivo JSONL de trabajos
+        generate_fn (callable): Función que genera un libro (p. ej. generar_libro)
+        results_path (str, optional): Archivo JSONL de resultados
+            (por defecto junto al de trabajos, con sufijo .results.jsonl)
+        workers (int): Libros que se generan a la vez
+        output_dir (str): Directorio base para los trabajos sin ruta_salida
+
+    Returns:
+        list: Resultado de cada trabajo, en el orden del archivo
+    """
+    if results_path is None:
+        results_path = os.path.splitext(jobs_path)[0] + ".results.jsonl"
+    jobs = load_jobs(jobs_path, output_dir)
+    logger.info(f"📚 {len(jobs)} trabajos leídos de {jobs_path}")
+
+    results_lock = threading.Lock()
+    results_file = open(results_path, "a", encoding="utf-8")
+
+    def record(result):
+        with results_lock:
+            results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            results_file.flush()
+        return result
+
+    def run_job(line_number, job, error):
+        result = {"line": line_number, "titulo": job["titulo"] if job else None}
+        if job is None:
+            logger.error(f"❌ Trabajo de la línea {line_number} inválido: {error}")
+            return record(dict(result, status="invalid", error=error))
+
+        started = time.perf_counter()
+        result["started_at"] = datetime.now().isoformat(timespec="seconds")
+        try:
+            output = generate_fn(**job)
+            result.update(status="ok", output=output)
+            logger.info(f"✅ Trabajo de la línea {line_number} completado: {output}")
+        except Exception as e:
+            result.update(status="error", output=job["ruta_salida"], error=str(e))
+            logger.error(f"❌ Trabajo de la línea {line_number} fallido: {str(e)}")
+        result["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+        return record(result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            futures = [executor.submit(run_job, *job) for job in jobs]
+            results = [future.result() for future in futures]
+    finally:
+        results_file.close()
+
+    ok = sum(1 for result in results if result["status"] == "ok")
+    logger.info(f"📊 Lote terminado: {ok}/{len(results)} libros generados. Resultados en: {results_path}")
+    return results
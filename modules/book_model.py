@@ -0,0 +1,292 @@
+"""
+Modelo intermedio del libro, compartido por los generadores de EPUB y PDF.
+
+`build_book` interpreta una sola vez el contenido generado (book_content.json)
+y la información de imágenes, y devuelve un árbol libro -> secciones ->
+bloques (párrafo, encabezado, imagen, ejercicio) con la posición de cada
+imagen ya resuelta. Acepta las variantes de formato que han ido apareciendo:
+imágenes como diccionario por clave o como lista de {"type", "path"},
+ejercicios como lista de diccionarios, lista de cadenas o texto, índice como
+"toc" o ausente, e introducción como texto o como {"content": ...}.
+
+Los nodos usan __slots__ para que un libro largo no cargue con un
+diccionario por cada párrafo.
+"""
+
+import os
+
+# Separador de párrafos en el texto que devuelve el modelo
+PARAGRAPH_SEPARATOR = "\n\n"
+
+
+class Paragraph:
+    """Párrafo de texto plano; `style` indica su papel (entrada del índice, referencia...)."""
+
+    __slots__ = ("text", "style")
+
+    def __init__(self, text, style=None):
+        self.text = text
+        self.style = style
+
+
+class Heading:
+    """Encabezado de nivel `level` (1 = título de sección)."""
+
+    __slots__ = ("text", "level")
+
+    def __init__(self, text, level=2):
+        self.text = text
+        self.level = level
+
+
+class Image:
+    """Ilustración del libro."""
+
+    __slots__ = ("path", "description", "role")
+
+    def __init__(self, path, description="", role="chapter"):
+        self.path = path
+        self.description = description
+        self.role = role
+
+    @property
+    def file_name(self):
+        return os.path.basename(self.path)
+
+
+class Exercise:
+    """Ejercicio numerado."""
+
+    __slots__ = ("number", "title", "description")
+
+    def __init__(self, number, title, description):
+        self.number = number
+        self.title = title
+        self.description = description
+
+
+class Section:
+    """
+    Página lógica del libro.
+
+    Args:
+        kind (str): "cover", "toc", "introduction", "chapter", "exercises",
+            "conclusion" o "bibliography"
+        file_name (str): Nombre de la página dentro del EPUB
+        title (str): Título para la navegación
+        heading (str): Título visible de la sección
+        blocks (list): Bloques de la sección en orden de lectura
+        number (int, optional): Número de capítulo
+    """
+
+    __slots__ = ("kind", "file_name", "title", "heading", "blocks", "number")
+
+    def __init__(self, kind, file_name, title, heading, blocks=None, number=None):
+        self.kind = kind
+        self.file_name = file_name
+        self.title = title
+        self.heading = heading
+        self.blocks = blocks if blocks is not None else []
+        self.number = number
+
+
+class Book:
+    """Libro completo: metadatos, portada y secciones en orden de lectura."""
+
+    __slots__ = ("title", "description", "cover_image", "sections", "metadata")
+
+    def __init__(self, title, description="", cover_image=None, sections=None, metadata=None):
+        self.title = title
+        self.description = description
+        self.cover_image = cover_image
+        self.sections = sections if sections is not None else []
+        self.metadata = metadata if metadata is not None else []
+
+    def images(self):
+        """Devuelve las imágenes del libro sin repetir, empezando por la portada."""
+        seen = set()
+        collected = []
+        candidates = [self.cover_image] if self.cover_image else []
+        for section in self.sections:
+            candidates.extend(block for block in section.blocks if isinstance(block, Image))
+        for image in candidates:
+            if image.file_name not in seen:
+                seen.add(image.file_name)
+                collected.append(image)
+        return collected
+
+    def chapters(self):
+        """Devuelve las secciones de capítulo."""
+        return [section for section in self.sections if section.kind == "chapter"]
+
+
+def normalize_images(images):
+    """
+    Convierte la información de imágenes al formato por clave.
+
+    Acepta el diccionario {"cover": [...], "chapter_1": [...]} que genera
+    image_generator o la lista antigua [{"type": "cover", "path": ...}, ...],
+    en la que las imágenes de capítulo van en orden.
+
+    Returns:
+        dict: Clave -> lista de diccionarios de imagen
+    """
+    if not images:
+        return {}
+    if isinstance(images, dict):
+        return images
+    normalized = {}
+    chapter_number = 0
+    for img_info in images:
+        kind = img_info.get("type", "chapter")
+        if kind == "chapter":
+            chapter_number += 1
+            key = f"chapter_{chapter_number}"
+        else:
+            key = kind
+        # Las rutas antiguas se guardaron con separadores de Windows
+        path = img_info["path"].replace("\\", os.sep)
+        normalized.setdefault(key, []).append({**img_info, "path": path})
+    return normalized
+
+
+def _image_nodes(images, key, role):
+    return [
+        Image(img_info["path"], img_info.get("description", ""), role)
+        for img_info in images.get(key, [])
+    ]
+
+
+def _text_value(value):
+    """Texto de un campo que puede venir como cadena o como {"content": ...}."""
+    if isinstance(value, dict):
+        return str(value.get("content", ""))
+    return str(value or "")
+
+
+def paragraphs(text, style=None):
+    """
+    Divide texto plano en párrafos.
+
+    Los bloques vacíos se conservan como None para que las posiciones de las
+    imágenes coincidan con la numeración de párrafos del texto original.
+    """
+    return [
+        Paragraph(block.strip(), style) if block.strip() else None
+        for block in str(text).split(PARAGRAPH_SEPARATOR)
+    ]
+
+
+def place_images(blocks, chapter_images):
+    """
+    Intercala las imágenes de un capítulo entre sus párrafos.
+
+    Cada imagen se coloca después de cada segundo párrafo o, si no hay
+    párrafos suficientes, al final.
+    """
+    for img_idx, image in enumerate(chapter_images):
+        insert_point = (img_idx + 1) * 2  # Insertar después de cada segundo párrafo
+        if len(blocks) > insert_point:
+            blocks.insert(insert_point, image)
+        else:
+            blocks.append(image)  # Añadir al final si no hay suficientes párrafos
+    return [block for block in blocks if block is not None]
+
+
+def build_chapter_section(chapter, number, images=None):
+    """
+    Construye la sección de un capítulo con sus imágenes ya colocadas.
+
+    Args:
+        chapter (dict): Capítulo con "title", "content" y opcionalmente "sections"
+        number (int): Número del capítulo (1-based)
+        images (dict | list, optional): Información sobre las imágenes generadas
+
+    Returns:
+        Section: Sección del capítulo
+    """
+    images = normalize_images(images)
+    blocks = paragraphs(chapter.get("content", ""))
+    blocks = place_images(blocks, _image_nodes(images, f"chapter_{number}", "chapter"))
+    for sub in chapter.get("sections", []):
+        blocks.append(Heading(sub.get("title", ""), 2))
+        blocks.extend(block for block in paragraphs(sub.get("content", "")) if block is not None)
+    chapter_title = chapter.get("title", "")
+    return Section("chapter", f"chapter_{number}.xhtml", chapter_title, chapter_title, blocks, number)
+
+
+def _exercises(raw):
+    """Normaliza los ejercicios a una lista de Exercise."""
+    if isinstance(raw, str):
+        raw = [raw] if raw.strip() else []
+    exercises = []
+    for number, exercise in enumerate(raw or [], 1):
+        if isinstance(exercise, dict):
+            exercises.append(Exercise(number, exercise.get("title", ""), exercise.get("description", "")))
+        else:
+            exercises.append(Exercise(number, "", str(exercise)))
+    return exercises
+
+
+def _toc_entries(book_content):
+    toc = book_content.get("toc")
+    if isinstance(toc, dict) and toc:
+        return [f"{n}. {title} - {page}" for n, (title, page) in enumerate(toc.items(), 1)]
+    return [f"{n}. {chapter.get('title', '')}" for n, chapter in enumerate(book_content.get("chapters", []), 1)]
+
+
+def build_book(book_content, images=None):
+    """
+    Construye el modelo intermedio del libro.
+
+    Args:
+        book_content (dict): Contenido del libro en formato JSON
+        images (dict | list, optional): Información sobre las imágenes generadas
+
+    Returns:
+        Book: Libro con secciones y bloques listos para renderizar
+    """
+    images = normalize_images(images)
+    title = book_content.get("title", "Sin título")
+    description = book_content.get("description", "")
+
+    metadata = []
+    if "publico" in book_content:
+        metadata.append(("audience", book_content["publico"]))
+    if "tema" in book_content:
+        metadata.append(("subject", book_content["tema"]))
+
+    cover_images = _image_nodes(images, "cover", "cover")
+    book = Book(title, description, cover_images[0] if cover_images else None, metadata=metadata)
+
+    book.sections.append(Section("cover", "cover.xhtml", "Portada", title, [Paragraph(description)]))
+    book.sections.append(Section(
+        "toc", "toc.xhtml", "Índice", "Índice",
+        [Paragraph(entry, "toc-entry") for entry in _toc_entries(book_content)]
+    ))
+    book.sections.append(Section(
+        "introduction", "introduction.xhtml", "Introducción", "Introducción",
+        [block for block in paragraphs(_text_value(book_content.get("introduction"))) if block is not None]
+    ))
+
+    for number, chapter in enumerate(book_content.get("chapters", []), 1):
+        book.sections.append(build_chapter_section(chapter, number, images))
+
+    book.sections.append(Section(
+        "exercises", "exercises.xhtml", "Ejercicios", "Ejercicios y Actividades",
+        _exercises(book_content.get("exercises")) + _image_nodes(images, "exercises", "chapter")
+    ))
+    book.sections.append(Section(
+        "conclusion", "conclusion.xhtml", "Conclusión", "Conclusión",
+        [block for block in paragraphs(_text_value(book_content.get("conclusion"))) if block is not None]
+        + _image_nodes(images, "conclusion", "chapter")
+    ))
+
+    bibliography = book_content.get("bibliography", [])
+    if isinstance(bibliography, str):
+        bibliography = [line for line in bibliography.splitlines() if line.strip()]
+    book.sections.append(Section(
+        "bibliography", "bibliography.xhtml", "Bibliografía", "Bibliografía",
+        [Paragraph(f"{n}. {reference}", "bibliography-item") for n, reference in enumerate(bibliography, 1)]
+    ))
+    return book
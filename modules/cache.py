@@ -0,0 +1,251 @@
+"""
+Caché en disco de respuestas de la API, direccionada por contenido.
+
+Cada entrada se identifica con el hash de los parámetros de la solicitud
+(modelo, mensajes, temperatura, tamaño, calidad...). Se guarda un sobre JSON
+con la fecha de creación y, para las imágenes, un archivo binario aparte.
+Las entradas caducan tras un TTL y, si el tamaño total supera el máximo,
+se eliminan las usadas hace más tiempo (LRU).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from modules.config import CACHE_DIR, CACHE_MAX_BYTES, CACHE_EVICT_TO, CACHE_TTL_SECONDS, SEARCH_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """
+    Caché de respuestas JSON y bytes de imágenes con expiración y desalojo LRU.
+
+    Args:
+        cache_dir (str): Directorio de la caché
+        max_bytes (int): Tamaño máximo total antes de desalojar entradas
+        ttl (float): Segundos que una entrada se considera válida
+    """
+
+    def __init__(self, cache_dir, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL_SECONDS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._estimated_bytes = None  # Tamaño del último recorrido más lo escrito desde entonces
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(**fields):
+        """Calcula la clave de una solicitud a partir de sus parámetros."""
+        payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key[:2], key)
+        return base + ".json", base + ".bin"
+
+    def _write_atomic(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _remove(self, key):
+        for path in self._paths(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _load_envelope(self, key):
+        envelope_path, _ = self._paths(key)
+        try:
+            with open(envelope_path, "r", encoding="utf-8") as f:
+                envelope = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if time.time() - envelope.get("created", 0) > self.ttl:
+            self._remove(key)
+            return None
+        # Marcar el uso para el desalojo LRU
+        os.utime(envelope_path)
+        return envelope
+
+    def get_json(self, key):
+        """Devuelve los datos guardados para `key` o None si no hay entrada válida."""
+        envelope = self._load_envelope(key)
+        if envelope is None or "data" not in envelope:
+            return None
+        return envelope["data"]
+
+    def put_json(self, key, data):
+        """Guarda datos serializables en JSON bajo `key`."""
+        envelope = {"created": time.time(), "data": data}
+        envelope_path, _ = self._paths(key)
+        payload = json.dumps(envelope, ensure_ascii=False).encode("utf-8")
+        self._write_atomic(envelope_path, payload)
+        self._evict(len(payload))
+
+    def get_bytes(self, key):
+        """Devuelve los bytes guardados para `key` o None si no hay entrada válida."""
+        envelope = self._load_envelope(key)
+        if envelope is None or not envelope.get("blob"):
+            return None
+        _, blob_path = self._paths(key)
+        try:
+            with open(blob_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            self._remove(key)
+            return None
+
+    def put_bytes(self, key, data):
+        """Guarda un bloque binario (p. ej. una imagen) bajo `key`."""
+        envelope_path, blob_path = self._paths(key)
+        self._write_atomic(blob_path, data)
+        envelope = {"created": time.time(), "blob": True, "size": len(data)}
+        payload = json.dumps(envelope).encode("utf-8")
+        self._write_atomic(envelope_path, payload)
+        self._evict(len(data) + len(payload))
+
+    def get_file(self, key, dest_path):
+        """
+        Copia el bloque guardado para `key` a `dest_path` sin cargarlo en memoria.
+
+        Returns:
+            bool: True si había una entrada válida y se copió
+        """
+        envelope = self._load_envelope(key)
+        if envelope is None or not envelope.get("blob"):
+            return False
+        _, blob_path = self._paths(key)
+        tmp_path = f"{dest_path}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(blob_path, tmp_path)
+        except FileNotFoundError:
+            self._remove(key)
+            return False
+        os.replace(tmp_path, dest_path)
+        return True
+
+    def put_file(self, key, path):
+        """Guarda una copia del archivo `path` bajo `key` sin cargarlo en memoria."""
+        envelope_path, blob_path = self._paths(key)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, blob_path)
+        envelope = {"created": time.time(), "blob": True, "size": os.path.getsize(blob_path)}
+        payload = json.dumps(envelope).encode("utf-8")
+        self._write_atomic(envelope_path, payload)
+        self._evict(envelope["size"] + len(payload))
+
+    def _scan(self):
+        """Recorre los subdirectorios de la caché y devuelve {clave: (bytes, último uso)}."""
+        entries = {}
+        with os.scandir(self.cache_dir) as shards:
+            # Solo los subdirectorios de dos caracteres de _paths: cualquier otra cosa no es de esta caché
+            shard_dirs = [entry.path for entry in shards if entry.is_dir() and len(entry.name) == 2]
+        for shard_dir in shard_dirs:
+            try:
+                names = os.listdir(shard_dir)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                key, ext = os.path.splitext(name)
+                if ext not in (".json", ".bin"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(shard_dir, name))
+                except FileNotFoundError:
+                    continue
+                size, last_used = entries.get(key, (0, 0))
+                used = stat.st_mtime if ext == ".json" else last_used
+                entries[key] = (size + stat.st_size, max(last_used, used))
+        return entries
+
+    def _evict(self, added=0):
+        """
+        Elimina las entradas menos usadas hasta respetar el tamaño máximo.
+
+        El tamaño se estima en memoria sumando lo escrito al resultado del
+        último recorrido; el directorio solo se vuelve a recorrer cuando la
+        estimación supera `max_bytes` (o la primera vez). Entonces se desaloja
+        hasta CACHE_EVICT_TO del máximo, para que las escrituras siguientes no
+        vuelvan a recorrerlo enseguida.
+
+        Args:
+            added (int): Bytes que acaba de escribir la entrada nueva
+        """
+        with self._lock:
+            if self._estimated_bytes is not None:
+                self._estimated_bytes += added
+                if self._estimated_bytes <= self.max_bytes:
+                    return
+
+            entries = self._scan()
+            total = sum(size for size, _ in entries.values())
+            if total > self.max_bytes:
+                for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+                    self._remove(key)
+                    total -= size
+                    if total <= self.max_bytes * CACHE_EVICT_TO:
+                        break
+                logger.info(f"🧹 Caché reducida a {total / (1024 * 1024):.1f} MB")
+            self._estimated_bytes = total
+
+_cache = None
+_search_cache = None
+_cache_enabled = True
+_cache_dir = CACHE_DIR
+_cache_lock = threading.Lock()
+
+
+def configure_cache(cache_dir=None, enabled=True):
+    """
+    Configura la caché compartida del proceso.
+
+    Args:
+        cache_dir (str, optional): Directorio de la caché (por defecto CACHE_DIR)
+        enabled (bool): Si es False, las llamadas a la API no consultan la caché
+    """
+    global _cache, _search_cache, _cache_enabled, _cache_dir
+    with _cache_lock:
+        _cache_enabled = enabled
+        _cache_dir = cache_dir or CACHE_DIR
+        _cache = None
+        _search_cache = None
+
+
+def get_cache():
+    """Devuelve la caché compartida, o None si está desactivada."""
+    global _cache
+    with _cache_lock:
+        if not _cache_enabled:
+            return None
+        if _cache is None:
+            _cache = ResponseCache(_cache_dir)
+        return _cache
+
+
+def get_search_cache():
+    """
+    Devuelve la caché de búsquedas web, o None si la caché está desactivada.
+
+    Vive en un directorio hermano del de la caché compartida (`<cache_dir>_search`)
+    con un TTL propio, más corto que el de las respuestas del modelo; dentro
+    del otro, el desalojo de la caché compartida contaría sus archivos sin
+    poder borrarlos.
+    """
+    global _search_cache
+    with _cache_lock:
+        if not _cache_enabled:
+            return None
+        if _search_cache is None:
+            _search_cache = ResponseCache(os.path.normpath(_cache_dir) + "_search", ttl=SEARCH_CACHE_TTL)
+        return _search_cache
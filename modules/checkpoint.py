@@ -0,0 +1,115 @@
+"""
+Puntos de control de la generación de un libro.
+
+El manifiesto (`manifest.json` en el directorio de salida) registra qué etapas
+y qué imágenes de capítulos están completas, junto con el hash de cada archivo,
+para que una ejecución con --resume solo regenere lo que falte o no sea válido.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+
+
+def file_sha256(path):
+    """Calcula el SHA-256 de un archivo leyéndolo por bloques."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def params_sha256(book_params):
+    """Calcula el hash de los parámetros del libro."""
+    payload = json.dumps(book_params, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationManifest:
+    """
+    Manifiesto de etapas completadas en un directorio de salida.
+
+    Args:
+        output_dir (str): Directorio de salida del libro
+        book_params (dict): Parámetros del libro; un cambio invalida el manifiesto
+    """
+
+    def __init__(self, output_dir, book_params):
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.params_hash = params_sha256(book_params)
+        self._lock = threading.Lock()
+        self.data = {"params_hash": self.params_hash, "stages": {}, "images": {}}
+
+    def load(self):
+        """Carga el manifiesto existente si corresponde a los mismos parámetros."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self
+        except json.JSONDecodeError:
+            logger.warning(f"⚠️ Manifiesto ilegible, se empieza de cero: {self.path}")
+            return self
+
+        if data.get("params_hash") != self.params_hash:
+            logger.warning("⚠️ Los parámetros del libro han cambiado, se ignora el manifiesto anterior")
+            return self
+
+        data.setdefault("stages", {})
+        data.setdefault("images", {})
+        self.data = data
+        return self
+
+    def save(self):
+        """Escribe el manifiesto de forma atómica."""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def _valid_file(self, entry):
+        path = entry.get("path")
+        if not path or not os.path.exists(path):
+            return False
+        return file_sha256(path) == entry.get("sha256")
+
+    def mark_stage(self, name, path):
+        """Registra una etapa completa cuyo resultado es el archivo `path`."""
+        with self._lock:
+            self.data["stages"][name] = {"path": path, "sha256": file_sha256(path)}
+        self.save()
+
+    def stage_done(self, name):
+        """Indica si la etapa está completa y su archivo sigue siendo válido."""
+        entry = self.data["stages"].get(name)
+        return bool(entry) and self._valid_file(entry)
+
+    def mark_images(self, key, images):
+        """Registra las imágenes completas de una clave (p. ej. "cover", "chapter_3")."""
+        entries = [dict(info, sha256=file_sha256(info["path"])) for info in images]
+        with self._lock:
+            self.data["images"][key] = entries
+        self.save()
+
+    def valid_images(self):
+        """
+        Devuelve las imágenes registradas cuyos archivos existen y no han cambiado.
+
+        Returns:
+            dict: Imágenes por clave, con el mismo formato que generate_book_images
+        """
+        valid = {}
+        for key, entries in self.data["images"].items():
+            if entries and all(self._valid_file(entry) for entry in entries):
+                valid[key] = [{k: v for k, v in entry.items() if k != "sha256"} for entry in entries]
+            else:
+                logger.info(f"🔁 Imagen pendiente o inválida: {key}")
+        return valid
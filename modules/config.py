@@ -11,24 +11,113 @@ OUTPUT_DIR = os.path.join(BASE_DIR, "output")
 TEMP_DIR = os.path.join(BASE_DIR, "temp")
 IMAGES_DIR = os.path.join(TEMP_DIR, "images")
 
-# Crear directorios si no existen
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-os.makedirs(TEMP_DIR, exist_ok=True)
-os.makedirs(IMAGES_DIR, exist_ok=True)
+
+def ensure_dirs():
+    """Crea los directorios de trabajo si no existen (no se hace al importar)."""
+    for path in (OUTPUT_DIR, TEMP_DIR, IMAGES_DIR):
+        os.makedirs(path, exist_ok=True)
 
 # Configuración API
 OPENAI_API_MODEL = "gpt-4o"  # Modelo para generación de contenido
 OPENAI_IMAGE_MODEL = "dall-e-3"  # Modelo para generación de imágenes
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")  # None = API oficial; p. ej. el servidor de benchmarks/openai_stub.py
 IMAGE_SIZE = "1024x1024"  # Tamaño de las imágenes generadas
 IMAGE_QUALITY = "standard"  # Calidad de las imágenes: "standard" o "hd"
 
+# Optimización de imágenes antes de empaquetar el EPUB, por rol de la imagen.
+# Formatos admitidos: "JPEG", "WEBP" o "PNG" (cuantizado a `colors` colores).
+IMAGE_OPTIMIZATION = {
+    "cover": {"max_size": (1200, 1200), "format": "JPEG", "quality": 85},
+    "chapter": {"max_size": (800, 800), "format": "JPEG", "quality": 78},
+}
+
 # Límites y parámetros
 MAX_CHAPTERS = 10  # Número máximo de capítulos
 MAX_IMAGES = 15  # Número máximo de imágenes a generar
 MIN_CONTENT_LENGTH = 500  # Longitud mínima de contenido por capítulo
 MAX_CONTENT_LENGTH = 5000  # Longitud máxima de contenido por capítulo
 
+# Concurrencia y límites de tasa
+IMAGE_MAX_WORKERS = 4  # Imágenes que se generan y descargan a la vez
+IMAGE_REQUESTS_PER_MINUTE = 15  # Ritmo sostenido permitido para DALL-E
+IMAGE_RATE_BURST = 2  # Solicitudes de imagen que pueden salir de golpe
+CONTENT_MAX_WORKERS = 6  # Capítulos que se redactan a la vez
+CHAT_REQUESTS_PER_MINUTE = 60  # Ritmo sostenido permitido para el modelo de texto
+CHAT_RATE_BURST = 6  # Solicitudes de texto que pueden salir de golpe
+OUTLINE_MAX_TOKENS = 4000  # Tokens máximos para el esquema del libro
+CHAPTER_MAX_TOKENS = 4000  # Tokens máximos para cada capítulo
+CHAT_STREAM = True  # Recibir el esquema por streaming y empezar los capítulos en cuanto se conocen
+CHAT_MAX_CONCURRENCY = 6  # Solicitudes de texto en vuelo a la vez (se reduce ante un 429)
+IMAGE_MAX_CONCURRENCY = 4  # Solicitudes de imagen en vuelo a la vez (se reduce ante un 429)
+API_MAX_RETRIES = 5  # Reintentos ante 429, 5xx o errores de conexión
+API_BACKOFF_BASE = 1.0  # Espera base (segundos) del reintento, se duplica en cada uno
+API_BACKOFF_MAX = 60.0  # Espera máxima entre reintentos
+HEDGE_ENABLED = False  # Duplicar las llamadas lentas para recortar la latencia de cola (--hedge)
+HEDGE_PERCENTILE = 0.95  # Percentil de la latencia reciente a partir del cual se lanza el duplicado
+HEDGE_MAX_FRACTION = 0.1  # Fracción máxima de llamadas duplicadas en la ventana reciente
+HEDGE_MIN_SAMPLES = 20  # Latencias observadas antes de empezar a duplicar
+HEDGE_WINDOW = 200  # Llamadas recientes que se usan para el percentil y la fracción
+HEDGE_MAX_WORKERS = 32  # Hilos para las llamadas con duplicado en curso
+BATCH_MAX_WORKERS = 2  # Libros que se generan a la vez en modo lote
+IMAGE_PROCESS_WORKERS = None  # Procesos para recodificar imágenes (None = uno por núcleo, 1 = en serie)
+
+# Cliente de la API compartido por todo el proceso
+API_POOL_SIZE = (CHAT_MAX_CONCURRENCY + IMAGE_MAX_CONCURRENCY) * BATCH_MAX_WORKERS  # Conexiones persistentes
+API_ENDPOINTS = {  # Tiempos de espera (segundos) y reintentos por tipo de llamada
+    "chat": {"connect_timeout": 5.0, "read_timeout": 120.0, "retries": API_MAX_RETRIES},
+    "image": {"connect_timeout": 5.0, "read_timeout": 180.0, "retries": 3},
+}
+CIRCUIT_FAILURE_THRESHOLD = 5  # Fallos seguidos (5xx o de conexión) que abren el circuito
+CIRCUIT_RESET_TIMEOUT = 30.0  # Segundos con el circuito abierto antes de dejar pasar una prueba
+
+# Descargas de imágenes
+DOWNLOAD_POOL_SIZE = 10  # Conexiones persistentes por host
+DOWNLOAD_TIMEOUT = 60  # Segundos de espera de conexión y lectura
+DOWNLOAD_RETRIES = 3  # Reintentos ante fallos transitorios
+DOWNLOAD_BACKOFF = 1.0  # Espera base (segundos) entre reintentos, se duplica en cada uno
+DOWNLOAD_CHUNK_SIZE = 64 * 1024  # Tamaño de los bloques escritos en disco
+
+# Modo borrador (--draft): sin llamadas a la API, ilustraciones y contenido generados en local
+DRAFT_IMAGE_SIZE = {"cover": (600, 800), "chapter": (480, 320)}  # Ancho y alto en píxeles por rol
+DRAFT_IMAGE_QUALITY = 70  # Calidad JPEG de las ilustraciones de borrador
+DRAFT_SUFFIX = "_borrador"  # Se añade al nombre de los archivos de salida para no pisar el libro definitivo
+
+# Caché de respuestas de la API
+CACHE_DIR = os.path.join(TEMP_DIR, "cache")  # Directorio por defecto de la caché
+CACHE_MAX_BYTES = 500 * 1024 * 1024  # Tamaño máximo antes de desalojar entradas
+CACHE_EVICT_TO = 0.9  # Al desalojar se baja hasta esta fracción del máximo, para no repetirlo en cada escritura
+CACHE_TTL_SECONDS = 7 * 24 * 3600  # Validez de cada entrada
+
+# Investigación previa en la web (--research)
+RESEARCH_ENABLED = False  # Añadir a los prompts un resumen de búsquedas sobre el tema y cada capítulo
+SEARCH_PROVIDER = "duckduckgo"  # Proveedor de búsqueda registrado en web_search.PROVIDERS
+DUCKDUCKGO_SEARCH_URL = os.environ.get(
+    "DUCKDUCKGO_SEARCH_URL", "https://api.duckduckgo.com/?q={}&format=json&no_html=1&skip_disambig=1"
+)
+SEARCH_TIMEOUT = (0.5, 1.5)  # Segundos de conexión y lectura de cada búsqueda
+SEARCH_MAX_RESULTS = 8  # Fragmentos que se toman de cada búsqueda
+SEARCH_CACHE_TTL = 24 * 3600  # Validez de una búsqueda en la caché
+RESEARCH_MAX_WORKERS = 8  # Búsquedas simultáneas
+RESEARCH_DEADLINE = 1.0  # Segundos que un prompt espera como mucho a su búsqueda
+RESEARCH_DIGEST_CHARS = 1500  # Longitud máxima del resumen que se añade a cada prompt
+
+# Instrumentación
+RUN_REPORT_NAME = "run_report.json"  # Informe de cada ejecución, junto a book_content.json
+METRICS_TEXTFILE = None  # Ruta .prom para el textfile collector de node_exporter (None = no se escribe)
+
+# Formatos de salida por defecto ("epub", "pdf")
+EXPORT_FORMATS = ["epub"]
+
+# Configuración PDF
+PDF_MARGIN = 72  # Margen de página en puntos (1 pulgada)
+FONT_SIZE_TITLE = 28  # Título del libro en la portada
+FONT_SIZE_HEADING = 20  # Título de cada sección o capítulo
+FONT_SIZE_SUBHEADING = 15  # Subtítulos y ejercicios
+FONT_SIZE_BODY = 11  # Texto de los párrafos
+PDF_IMAGE_MAX_HEIGHT = 300  # Alto máximo de las ilustraciones en puntos
+
 # Configuración EPUB
+EPUB_WRITER = "streaming"  # "streaming" (imágenes copiadas desde disco) o "ebooklib"
 EPUB_STYLESHEET = """
 body {
     font-family: "Helvetica", "Arial", sans-serif;
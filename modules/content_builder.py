@@ -1,112 +1,474 @@
-import os
 import json
 import logging
-import openai
-from user_prompt import USER_PROMPT_TEMPLATE
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from modules.user_prompt import (
+    OUTLINE_PROMPT_TEMPLATE, CHAPTER_PROMPT_TEMPLATE, RESEARCH_PROMPT_TEMPLATE,
+    OUTLINE_CONTINUATION_TEMPLATE, OUTLINE_CONTINUATION_CHAPTERS_NOTE
+)
+from modules.config import (
+    OPENAI_API_MODEL, CONTENT_MAX_WORKERS, CHAT_REQUESTS_PER_MINUTE,
+    CHAT_RATE_BURST, CHAT_MAX_CONCURRENCY, OUTLINE_MAX_TOKENS, CHAPTER_MAX_TOKENS, CHAT_STREAM,
+    MAX_CHAPTERS, MIN_CONTENT_LENGTH, MAX_CONTENT_LENGTH
+)
+from modules.rate_limiter import get_rate_limiter
+from modules.openai_api import call_api
+from modules.api_client import CircuitOpenError, abort_on_cancel, get_client
+from modules.cache import ResponseCache, get_cache
+from modules.progress import GenerationCancelled
+from modules.metrics import RunMetrics
+from modules.web_search import Researcher
+from modules.json_stream import JsonStreamParser, salvage_json
 
 logger = logging.getLogger(__name__)
 
-def generate_book_content(book_params):
+SYSTEM_PROMPT = "Eres un experto generador de libros educativos detallados y profesionales."
+
+# Campos necesarios para ensamblar el libro
+REQUIRED_FIELDS = ["title", "description", "toc", "introduction", "chapters", "exercises", "conclusion", "bibliography"]
+
+# Frases de relleno del contenido de borrador
+DRAFT_SENTENCES = [
+    "Este párrafo es texto de borrador para comprobar la maquetación del libro.",
+    "La versión definitiva sustituirá estas líneas por el contenido redactado.",
+    "Los párrafos tienen una longitud parecida a la de un capítulo real.",
+    "Así se pueden revisar márgenes, tipografía, imágenes y saltos de página.",
+    "Ninguna parte de este texto se ha generado con la API.",
+]
+
+def _request_json(client, prompt, max_tokens, progress=None, metrics=None, on_element=None):
+    """
+    Envía un prompt al modelo de texto y devuelve la respuesta como diccionario.
+
+    La llamada pasa por el limitador adaptativo del modelo (ver call_api).
+    Con `metrics` se registran la espera del limitador, la duración de la
+    llamada, los reintentos, los tokens de `response.usage` y los aciertos de caché.
+    Con `on_element` la respuesta se pide por streaming y cada campo y
+    elemento de lista se entrega en cuanto se cierra (ver JsonStreamParser),
+    también si la respuesta viene de la caché.
+
+    Raises:
+        json.JSONDecodeError: Si la respuesta no es un JSON válido
+        GenerationCancelled: Si se canceló la generación
+    """
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    request = {
+        "model": OPENAI_API_MODEL,
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": max_tokens,
+        "response_format": {"type": "json_object"}
+    }
+
+    # Consultar la caché antes de llamar a la API
+    cache = get_cache()
+    cache_key = ResponseCache.make_key(kind="chat", **request) if cache else None
+    cached = cache.get_json(cache_key) if cache else None
+    metrics = metrics or RunMetrics()
+    if cached is not None:
+        logger.info("♻️ Respuesta de texto recuperada de la caché")
+        metrics.incr("chat_cache_hits")
+        if on_element:
+            parser = JsonStreamParser(on_element)
+            parser.feed(cached["content"])
+            return parser.close()
+        return json.loads(cached["content"])
+
+    cancel_token = progress.cancel_token if progress else None
+    if cancel_token:
+        cancel_token.check()
+    limiter = get_rate_limiter(OPENAI_API_MODEL, CHAT_REQUESTS_PER_MINUTE, CHAT_RATE_BURST, CHAT_MAX_CONCURRENCY)
+    # Coste estimado en tokens: ~4 caracteres por token más la respuesta máxima
+    cost = sum(len(m["content"]) for m in messages) // 4 + max_tokens
+    if on_element:
+        stream = call_api(client, "chat.completions.create",
+                          dict(request, stream=True, stream_options={"include_usage": True}), limiter, "chat",
+                          cost=cost, cancel_token=cancel_token, metrics=metrics)
+        parser = JsonStreamParser(on_element)
+        try:
+            # Las lecturas del stream se hacen aquí: también deben abortarse al cancelar
+            with metrics.timer("chat_stream"), abort_on_cancel(cancel_token):
+                for chunk in stream:
+                    if chunk.usage:
+                        metrics.add_usage(OPENAI_API_MODEL, chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parser.feed(chunk.choices[0].delta.content)
+        finally:
+            stream.close()
+        content_text = parser.text
+        parse = parser.close
+    else:
+        response = call_api(client, "chat.completions.create", request, limiter, "chat",
+                            cost=cost, cancel_token=cancel_token, metrics=metrics)
+        metrics.add_usage(OPENAI_API_MODEL, getattr(response, "usage", None))
+        content_text = response.choices[0].message.content
+        parse = lambda: json.loads(content_text)
+
+    logger.debug(f"📥 Respuesta recibida: {len(content_text)} caracteres")
+    try:
+        data = parse()
+    except json.JSONDecodeError:
+        logger.debug(f"Contenido que causó el error: {content_text}")
+        raise
+
+    # Solo se guardan en caché las respuestas válidas
+    if cache:
+        cache.put_json(cache_key, {"content": content_text})
+    return data
+
+def _prompt_fields(book_params):
+    """Extrae los parámetros del libro que usan las plantillas de prompt."""
+    return {
+        "title": book_params["title"],
+        "tema": book_params["tema"],
+        "publico": book_params["publico"],
+        "edad": book_params["edad"],
+        "nivel_academico": book_params["nivel_academico"],
+        "enfoque": book_params["enfoque"],
+        "formato_idioma": book_params["formato_idioma"],
+        "paginas_deseadas": book_params["paginas_deseadas"],
+        "profundidad": book_params["profundidad"]
+    }
+
+def _fallback_book(book_params):
+    """Estructura mínima del libro para evitar fallos completos."""
+    return {
+        "title": book_params["title"],
+        "description": f"Libro sobre {book_params['tema']} para {book_params['publico']} de {book_params['edad']} años.",
+        "tema": book_params["tema"],
+        "publico": book_params["publico"],
+        "edad": book_params["edad"],
+        "nivel_academico": book_params["nivel_academico"],
+        "enfoque": book_params["enfoque"],
+        "formato_idioma": book_params["formato_idioma"],
+        "profundidad": book_params["profundidad"],
+        "toc": {"Capítulo 1": "página 3"},
+        "introduction": "Introducción por defecto debido a un error en la generación.",
+        "chapters": [{"title": "Capítulo 1", "content": "Contenido por defecto debido a un error en la generación."}],
+        "exercises": [{"title": "Ejercicio 1", "description": "Descripción por defecto."}],
+        "conclusion": "Conclusión por defecto.",
+        "bibliography": ["Referencia por defecto"]
+    }
+
+def _draft_paragraphs(rng, length):
+    """Párrafos de relleno que suman unos `length` caracteres."""
+    paragraphs, total = [], 0
+    while total < length:
+        paragraph = " ".join(rng.choice(DRAFT_SENTENCES) for _ in range(rng.randint(3, 6)))
+        paragraphs.append(paragraph)
+        total += len(paragraph)
+    return "\n\n".join(paragraphs)
+
+def generate_draft_content(book_params):
+    """
+    Contenido de relleno con la estructura completa del libro, generado en local (modo borrador).
+
+    El número de capítulos y su longitud se ajustan a las páginas pedidas para
+    que la maquetación se parezca a la del libro definitivo.
+
+    Args:
+        book_params (dict): Parámetros del libro
+
+    Returns:
+        dict: Contenido del libro con el mismo formato que generate_book_content
+    """
+    pages = int("".join(c for c in str(book_params.get("paginas_deseadas", "")) if c.isdigit()) or 20)
+    chapters = max(3, min(MAX_CHAPTERS, round(pages * 0.8 / 5)))
+    chapter_length = max(MIN_CONTENT_LENGTH, min(MAX_CONTENT_LENGTH, int(pages * 0.8 / chapters * 1800)))
+    rng = random.Random(book_params["title"])
+    logger.info(f"📝 Contenido de borrador: {chapters} capítulos de ~{chapter_length} caracteres")
+
+    content = _fallback_book(book_params)
+    content.update({
+        "description": f"Borrador de maquetación del libro sobre {book_params['tema']}.",
+        "toc": {f"Capítulo {n}": f"página {3 + (n - 1) * 5}" for n in range(1, chapters + 1)},
+        "introduction": _draft_paragraphs(rng, 1500),
+        "chapters": [{"title": f"Capítulo {n}: {book_params['tema']}", "content": _draft_paragraphs(rng, chapter_length)}
+                     for n in range(1, chapters + 1)],
+        "exercises": [{"title": f"Ejercicio {n}", "description": _draft_paragraphs(rng, 300)} for n in range(1, 4)],
+        "conclusion": _draft_paragraphs(rng, 1500),
+        "bibliography": [f"Referencia de borrador {n}" for n in range(1, 4)],
+    })
+    return content
+
+def _complete_fields(book_content, book_params):
+    """Rellena los campos que falten para que el EPUB pueda ensamblarse."""
+    for field in REQUIRED_FIELDS:
+        if field not in book_content:
+            logger.warning(f"⚠️ Campo faltante en el contenido: {field}")
+            if field == "chapters":
+                book_content[field] = [{"title": "Capítulo por defecto", "content": "Contenido por defecto."}]
+            elif field == "exercises":
+                book_content[field] = [{"title": "Ejercicio por defecto", "description": "Descripción por defecto."}]
+            elif field == "bibliography":
+                book_content[field] = ["Referencia por defecto"]
+            else:
+                book_content[field] = "Contenido por defecto para " + field
+
+    # Verificar campos adicionales específicos para EPUB
+    additional_fields = ["tema", "publico", "edad", "nivel_academico", "enfoque", "formato_idioma", "profundidad"]
+    for field in additional_fields:
+        if field not in book_content and field in book_params:
+            book_content[field] = book_params[field]
+
+    return book_content
+
+def generate_book_outline(client, book_params, progress=None, metrics=None, on_element=None):
+    """
+    Genera el esquema del libro: metadatos, índice, títulos de capítulos y secciones cortas.
+
+    Args:
+        client (openai.OpenAI): Cliente de la API
+        book_params (dict): Parámetros del libro
+        progress (ProgressTracker, optional): Progreso y cancelación
+        metrics (RunMetrics, optional): Métricas de la ejecución
+        on_element (callable, optional): Pide el esquema por streaming y recibe
+            (ruta, valor) de cada campo y elemento en cuanto se cierra
+
+    Returns:
+        dict: Esquema del libro con los capítulos aún sin contenido
+    """
+    prompt = OUTLINE_PROMPT_TEMPLATE.format(**_prompt_fields(book_params))
+    logger.debug(f"📝 Prompt de esquema generado: {prompt[:100]}...")
+    outline = _request_json(client, prompt, OUTLINE_MAX_TOKENS, progress, metrics, on_element)
+    logger.info(f"🗺️ Esquema generado con {len(outline.get('chapters', []))} capítulos")
+    return outline
+
+def continue_outline(client, book_params, partial, open_lists=(), progress=None, metrics=None):
+    """
+    Completa un esquema truncado pidiendo al modelo solo las partes que faltan.
+
+    Args:
+        client (openai.OpenAI): Cliente de la API
+        book_params (dict): Parámetros del libro
+        partial (dict): Campos recuperados del esquema truncado (ver salvage_json)
+        open_lists (set): Listas que quedaron cortadas; de "chapters" se piden
+            solo los capítulos siguientes al último completo
+        progress (ProgressTracker, optional): Progreso y cancelación
+        metrics (RunMetrics, optional): Métricas de la ejecución
+
+    Returns:
+        dict: Esquema con lo recuperado más lo recibido en la continuación
+    """
+    missing = [field for field in REQUIRED_FIELDS if field not in partial or field in open_lists]
+    if not missing:
+        return partial
+    received = [field for field in partial if field not in open_lists]
+    chapters = partial.get("chapters") if "chapters" in open_lists else None
+    chapters_note = ""
+    if chapters:
+        received.append(f"capítulos 1 a {len(chapters)}")
+        chapters_note = OUTLINE_CONTINUATION_CHAPTERS_NOTE.format(
+            chapter_list="\n".join(f"{i}. {c.get('title', '')}" for i, c in enumerate(chapters, 1)),
+            next_chapter=len(chapters) + 1
+        )
+    logger.warning(f"🩹 Esquema truncado: se conservan {', '.join(received) or 'ninguna parte'} "
+                   f"y se piden solo {', '.join(missing)}")
+    if metrics:
+        metrics.incr("outline_continuations")
+
+    prompt = OUTLINE_PROMPT_TEMPLATE.format(**_prompt_fields(book_params)) + OUTLINE_CONTINUATION_TEMPLATE.format(
+        received=", ".join(received) or "ninguna", missing=", ".join(missing), chapters_note=chapters_note
+    )
+    try:
+        rest = _request_json(client, prompt, OUTLINE_MAX_TOKENS, progress, metrics)
+    except json.JSONDecodeError as e:
+        # También la continuación puede cortarse: se aprovecha lo que haya llegado
+        rest, _ = salvage_json(e.doc)
+
+    outline = dict(partial)
+    for field, value in rest.items():
+        if field == "chapters" and chapters and isinstance(value, list):
+            outline["chapters"] = chapters + value
+        elif field not in outline or field in open_lists:
+            outline[field] = value
+    return outline
+
+def generate_chapter_content(client, book_params, outline, chapter_number, progress=None, metrics=None,
+                             researcher=None):
+    """
+    Redacta el contenido de un capítulo del esquema en una solicitud propia.
+
+    Args:
+        client (openai.OpenAI): Cliente de la API
+        book_params (dict): Parámetros del libro
+        outline (dict): Esquema generado por generate_book_outline
+        chapter_number (int): Número del capítulo (empezando en 1)
+        progress (ProgressTracker, optional): Progreso y cancelación
+        metrics (RunMetrics, optional): Métricas de la ejecución
+        researcher (Researcher, optional): Búsquedas en curso; su resumen se
+            añade al prompt del capítulo
+
+    Returns:
+        dict: Capítulo con las claves "title" y "content"
+    """
+    chapters = outline["chapters"]
+    chapter = chapters[chapter_number - 1]
+    chapter_list = "\n".join(f"{i}. {c.get('title', '')}" for i, c in enumerate(chapters, 1))
+    prompt = CHAPTER_PROMPT_TEMPLATE.format(
+        chapter_list=chapter_list,
+        chapter_number=chapter_number,
+        chapter_title=chapter.get("title", f"Capítulo {chapter_number}"),
+        chapter_summary=chapter.get("summary", ""),
+        **_prompt_fields(book_params)
+    )
+    digest = researcher.digest(chapter_number) if researcher else ""
+    if digest:
+        prompt += RESEARCH_PROMPT_TEMPLATE.format(digest=digest)
+
+    title = chapter.get("title", f"Capítulo {chapter_number}")
+    try:
+        data = _request_json(client, prompt, CHAPTER_MAX_TOKENS, progress, metrics)
+        content = data.get("content")
+        if not isinstance(content, str) or not content.strip():
+            raise ValueError("la respuesta no incluye el contenido del capítulo")
+        logger.info(f"✍️ Capítulo {chapter_number}/{len(chapters)} redactado")
+    except GenerationCancelled:
+        raise
+    except Exception as e:
+        # Una solicitud abortada por la cancelación no es un fallo del capítulo
+        if progress:
+            progress.check()
+        # Un capítulo fallido no debe arrastrar al resto del libro
+        logger.error(f"❌ Error al redactar el capítulo {chapter_number}: {str(e)}")
+        if metrics:
+            metrics.incr("chapter_fallbacks")
+        content = chapter.get("summary") or "Contenido por defecto debido a un error en la generación."
+
+    return {"title": title, "content": content}
+
+def generate_book_content(book_params, max_workers=None, on_outline=None, on_chapter=None, progress=None, metrics=None,
+                          research=False, stream=CHAT_STREAM):
     """
     Genera el contenido del libro utilizando la API de OpenAI basado en los parámetros proporcionados.
-    
+
+    Primero se genera el esquema del libro y después cada capítulo se redacta
+    en una solicitud independiente, en paralelo y con un límite de concurrencia.
+    Con `stream` el esquema llega por streaming: los capítulos empiezan a
+    redactarse en cuanto se cierra la lista "chapters", mientras el modelo
+    aún escribe la introducción, los ejercicios y el resto del esquema.
+
     Args:
         book_params (dict): Parámetros del libro (título, tema, público, edad, etc.)
-        
+        max_workers (int, optional): Capítulos simultáneos (por defecto CONTENT_MAX_WORKERS)
+        on_outline (callable, optional): Se llama con el esquema en cuanto se
+            conocen sus capítulos (con `stream`, antes de que termine el resto)
+        on_chapter (callable, optional): Se llama con (número, capítulo) a medida que
+            termina cada capítulo, en orden de llegada
+        progress (ProgressTracker, optional): Progreso y cancelación; al
+            cancelar se abortan las solicitudes en curso de esta generación
+        metrics (RunMetrics, optional): Métricas de la ejecución (tiempos,
+            tokens, capítulos de respaldo y tiempo hasta el primer capítulo)
+        research (bool): Documentar cada capítulo con búsquedas web; la del
+            tema se hace mientras se genera el esquema y las de los capítulos
+            en paralelo en cuanto se conocen sus títulos
+        stream (bool): Pedir el esquema por streaming (por defecto CHAT_STREAM)
+
     Returns:
         dict: Contenido estructurado del libro en formato JSON
     """
+    metrics = metrics or RunMetrics()
+    started = metrics.clock()
+    researcher = Researcher(book_params, metrics=metrics) if research else None
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers or CONTENT_MAX_WORKERS))
+    futures = {}
     try:
+        if researcher:
+            researcher.start_book()
         logger.info("🤖 Conectando con la API para generar contenido...")
-        
-        # Verificar que tenemos la clave API
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("No se encontró la clave API de OpenAI en las variables de entorno")
-        
-        client = openai.OpenAI(api_key=api_key)
-        
-        # Preparar el prompt para la API
-        prompt = USER_PROMPT_TEMPLATE.format(
-            title=book_params["title"],
-            tema=book_params["tema"],
-            publico=book_params["publico"],
-            edad=book_params["edad"],
-            nivel_academico=book_params["nivel_academico"],
-            enfoque=book_params["enfoque"],
-            formato_idioma=book_params["formato_idioma"],
-            paginas_deseadas=book_params["paginas_deseadas"],
-            profundidad=book_params["profundidad"]
-        )
-        
-        logger.debug(f"📝 Prompt generado: {prompt[:100]}...")
-        
-        # Llamar a la API de OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o",  # Usar el modelo más avanzado disponible
-            messages=[
-                {"role": "system", "content": "Eres un experto generador de libros educativos detallados y profesionales."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=4000,
-            response_format={"type": "json_object"}
-        )
-        
-        # Extraer el contenido JSON de la respuesta
-        content_text = response.choices[0].message.content
-        logger.debug(f"📥 Respuesta recibida: {len(content_text)} caracteres")
-        
-        # Parsear el JSON
+        client = get_client()
+
+        def start_chapters(outline):
+            """Avisa del esquema y lanza la redacción de todos sus capítulos."""
+            if on_outline:
+                on_outline(outline)
+            if researcher:
+                researcher.start_chapters(outline)
+            for number in range(1, len(outline["chapters"]) + 1):
+                future = executor.submit(generate_chapter_content, client, book_params, outline, number,
+                                         progress, metrics, researcher)
+                futures[future] = number
+
+        outline_fields = {}
+
+        def on_element(path, value):
+            if len(path) == 2 and path[0] == "chapters" and researcher and isinstance(value, dict):
+                researcher.start_chapter(path[1] + 1, value)
+            if len(path) != 1:
+                return
+            outline_fields[path[0]] = value
+            if path[0] == "chapters" and isinstance(value, list) and value and not futures:
+                metrics.observe("outline_chapters", metrics.clock() - started)
+                logger.info(f"🗺️ {len(value)} capítulos recibidos, se empiezan a redactar")
+                # El título puede no haber llegado aún: hasta entonces se usa el pedido
+                start_chapters({"title": book_params["title"], **outline_fields})
+
+        # Fase 1: esquema del libro
         try:
-            book_content = json.loads(content_text)
-            logger.info("✅ Contenido del libro generado y procesado exitosamente")
-            
-            # Verificar que todos los campos necesarios estén presentes
-            required_fields = ["title", "description", "toc", "introduction", "chapters", "exercises", "conclusion", "bibliography"]
-            for field in required_fields:
-                if field not in book_content:
-                    logger.warning(f"⚠️ Campo faltante en el contenido: {field}")
-                    if field == "chapters":
-                        book_content[field] = [{"title": "Capítulo por defecto", "content": "Contenido por defecto."}]
-                    elif field == "exercises":
-                        book_content[field] = [{"title": "Ejercicio por defecto", "description": "Descripción por defecto."}]
-                    elif field == "bibliography":
-                        book_content[field] = ["Referencia por defecto"]
-                    else:
-                        book_content[field] = "Contenido por defecto para " + field
-            
-            # Verificar campos adicionales específicos para EPUB
-            additional_fields = ["tema", "publico", "edad", "nivel_academico", "enfoque", "formato_idioma", "profundidad"]
-            for field in additional_fields:
-                if field not in book_content and field in book_params:
-                    book_content[field] = book_params[field]
-            
-            return book_content
-            
+            with metrics.timer("outline"):
+                book_content = generate_book_outline(client, book_params, progress, metrics,
+                                                     on_element if stream else None)
         except json.JSONDecodeError as e:
+            # Respuesta truncada (p. ej. por max_tokens): se conserva lo completo y se pide el resto
             logger.error(f"❌ Error al parsear JSON: {str(e)}")
-            logger.debug(f"Contenido que causó el error: {content_text}")
-            
-            # Crear una estructura mínima para evitar fallos completos
-            return {
-                "title": book_params["title"],
-                "description": f"Libro sobre {book_params['tema']} para {book_params['publico']} de {book_params['edad']} años.",
-                "tema": book_params["tema"],
-                "publico": book_params["publico"],
-                "edad": book_params["edad"],
-                "nivel_academico": book_params["nivel_academico"],
-                "enfoque": book_params["enfoque"],
-                "formato_idioma": book_params["formato_idioma"],
-                "profundidad": book_params["profundidad"],
-                "toc": {"Capítulo 1": "página 3"},
-                "introduction": "Introducción por defecto debido a un error en la generación.",
-                "chapters": [{"title": "Capítulo 1", "content": "Contenido por defecto debido a un error en la generación."}],
-                "exercises": [{"title": "Ejercicio 1", "description": "Descripción por defecto."}],
-                "conclusion": "Conclusión por defecto.",
-                "bibliography": ["Referencia por defecto"]
-            }
-    
+            partial, open_lists = salvage_json(e.doc)
+            try:
+                with metrics.timer("outline_continuation"):
+                    book_content = continue_outline(client, book_params, partial, open_lists, progress, metrics)
+            except GenerationCancelled:
+                raise
+            except Exception as e:
+                if progress:
+                    progress.check()
+                if not partial.get("chapters"):
+                    logger.error(f"❌ No se pudo completar el esquema: {str(e)}")
+                    metrics.incr("book_fallbacks")
+                    return _fallback_book(book_params)
+                logger.error(f"❌ No se pudo completar el esquema, se usa lo recuperado: {str(e)}")
+                book_content = partial
+        except CircuitOpenError as e:
+            logger.error(f"❌ {str(e)}: se usa el libro por defecto")
+            metrics.incr("book_fallbacks")
+            return _fallback_book(book_params)
+
+        outline_chapters = book_content.get("chapters")
+        if not isinstance(outline_chapters, list) or not outline_chapters:
+            return _complete_fields(book_content, book_params)
+        if not futures:
+            start_chapters(book_content)
+
+        # Fase 2: capítulos en paralelo, conservando el orden del esquema
+        chapters = [None] * len(outline_chapters)
+        try:
+            for future in as_completed(futures):
+                number = futures[future]
+                chapters[number - 1] = future.result()
+                if chapters.count(None) == len(chapters) - 1:
+                    metrics.observe("first_chapter", metrics.clock() - started)
+                if on_chapter:
+                    on_chapter(number, chapters[number - 1])
+        except GenerationCancelled:
+            # No empezar los capítulos que aún estaban en cola
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+
+        book_content["chapters"] = chapters
+        logger.info("✅ Contenido del libro generado y procesado exitosamente")
+        return _complete_fields(book_content, book_params)
+
+    except GenerationCancelled:
+        raise
     except Exception as e:
+        # Una solicitud abortada al cancelar se notifica como cancelación
+        if progress:
+            progress.check()
         logger.exception(f"❌ Error al generar contenido: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+    finally:
+        # Sin esperar: tras un esquema inválido los capítulos ya lanzados se descartan
+        executor.shutdown(wait=False, cancel_futures=True)
+        if researcher:
+            researcher.close()
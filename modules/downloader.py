@@ -0,0 +1,121 @@
+"""
+Descarga de imágenes con conexiones reutilizadas y escritura atómica.
+
+Todas las descargas comparten una `requests.Session` con un pool de
+conexiones. El cuerpo se vuelca por bloques a un archivo temporal en el mismo
+directorio, se verifica con Pillow y solo entonces se renombra al destino,
+de modo que nunca queda un PNG truncado que assemble_epub pudiera empaquetar.
+"""
+
+import logging
+import os
+import random
+import tempfile
+import threading
+from modules.config import (
+    DOWNLOAD_POOL_SIZE, DOWNLOAD_TIMEOUT, DOWNLOAD_RETRIES,
+    DOWNLOAD_BACKOFF, DOWNLOAD_CHUNK_SIZE
+)
+from modules.rate_limiter import sleep
+
+logger = logging.getLogger(__name__)
+
+# Códigos HTTP que justifican reintentar la descarga
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """Error definitivo al descargar una imagen."""
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Devuelve la sesión HTTP compartida, con un pool de conexiones persistentes."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_POOL_SIZE, pool_maxsize=DOWNLOAD_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def _verify_image(path):
+    """Comprueba que el archivo es una imagen completa y legible."""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        img.verify()
+
+
+def download_image(url, dest_path, retries=DOWNLOAD_RETRIES, timeout=DOWNLOAD_TIMEOUT, cancel_token=None,
+                   metrics=None):
+    """
+    Descarga una imagen en `dest_path` por streaming, con reintentos y verificación.
+
+    Args:
+        url (str): URL de la imagen
+        dest_path (str): Ruta final de la imagen
+        retries (int): Reintentos ante fallos transitorios
+        timeout (float): Segundos de espera de conexión y lectura
+        cancel_token (CancellationToken, optional): Interrumpe la descarga entre
+            bloques y la espera entre reintentos
+        metrics (RunMetrics, optional): Recibe los bytes descargados y los reintentos
+
+    Returns:
+        int: Bytes escritos
+
+    Raises:
+        DownloadError: Si la descarga no se completa tras los reintentos
+    """
+    import requests
+
+    dest_dir = os.path.dirname(dest_path) or "."
+    os.makedirs(dest_dir, exist_ok=True)
+    session = get_session()
+
+    for attempt in range(retries + 1):
+        fd, tmp_path = tempfile.mkstemp(dir=dest_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                with session.get(url, stream=True, timeout=timeout) as response:
+                    if response.status_code in RETRYABLE_STATUS:
+                        raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+                    if response.status_code >= 400:
+                        raise DownloadError(f"HTTP {response.status_code} al descargar {url}")
+                    written = 0
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        if cancel_token:
+                            cancel_token.check()
+                        f.write(chunk)
+                        written += len(chunk)
+
+            _verify_image(tmp_path)
+            os.replace(tmp_path, dest_path)
+            if metrics:
+                metrics.add_bytes("in", written)
+            return written
+
+        except DownloadError:
+            raise
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError,
+                requests.exceptions.ChunkedEncodingError, OSError, SyntaxError, ValueError) as e:
+            # SyntaxError, OSError y ValueError: Pillow no reconoce la imagen (descarga incompleta)
+            if attempt >= retries:
+                raise DownloadError(f"No se pudo descargar {url}: {str(e)}") from e
+            wait = DOWNLOAD_BACKOFF * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"⚠️ Descarga fallida ({str(e)}), reintento {attempt + 1}/{retries} en {wait:.1f} s")
+            if metrics:
+                metrics.incr("download_retries")
+            sleep(wait, cancel_token)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,132 @@
+"""
+Ilustraciones de borrador generadas en local con Pillow (modo --draft).
+
+Sustituyen a DALL-E cuando solo se quiere comprobar la maquetación: cada
+imagen lleva el título del capítulo (o del libro, en la portada) sobre un
+fondo degradado del color del tema y unas formas geométricas sencillas. El
+color y las formas salen de un hash del texto, así que el mismo capítulo
+produce siempre la misma imagen, y se guardan como JPEG pequeños de
+DRAFT_IMAGE_SIZE sin tocar la red.
+"""
+
+import colorsys
+import hashlib
+import logging
+import os
+import random
+import textwrap
+from modules.config import DRAFT_IMAGE_SIZE, DRAFT_IMAGE_QUALITY
+
+logger = logging.getLogger(__name__)
+
+
+def theme_color(text, saturation=0.45, value=0.85):
+    """Color RGB estable derivado del texto (el tono sale de su hash)."""
+    hue = hashlib.sha256(text.encode("utf-8")).digest()[0] / 255
+    return tuple(int(c * 255) for c in colorsys.hsv_to_rgb(hue, saturation, value))
+
+
+def _font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:  # Pillow < 10.1: solo la fuente de mapa de bits, de tamaño fijo
+        return ImageFont.load_default()
+
+
+def _wrap(draw, text, font, max_width):
+    """Parte el texto en líneas que quepan en `max_width` píxeles."""
+    char_width = max(1.0, draw.textlength("abcdefghij", font=font) / 10)
+    return "\n".join(textwrap.wrap(text, width=max(8, int(max_width / char_width)))[:4])
+
+
+def _draw_shapes(draw, rng, seed, width, height):
+    side = min(width, height)
+    for _ in range(rng.randint(5, 9)):
+        color = theme_color(f"{seed}:{rng.random()}", saturation=0.6, value=rng.uniform(0.5, 0.95))
+        fill = color + (rng.randint(70, 150),)
+        x, y = rng.randrange(width), rng.randrange(height)
+        r = rng.randint(side // 12, side // 4)
+        shape = rng.choice(("ellipse", "rectangle", "triangle"))
+        if shape == "ellipse":
+            draw.ellipse((x - r, y - r, x + r, y + r), fill=fill)
+        elif shape == "rectangle":
+            draw.rectangle((x - r, y - r // 2, x + r, y + r // 2), fill=fill)
+        else:
+            draw.polygon([(x, y - r), (x + r, y + r), (x - r, y + r)], fill=fill)
+
+
+def render_draft_image(path, title, label="", role="chapter", seed=None):
+    """
+    Dibuja una ilustración de borrador y la guarda en `path` como JPEG.
+
+    Args:
+        path (str): Ruta de la imagen
+        title (str): Texto principal (título del capítulo o del libro)
+        label (str): Texto pequeño sobre el título, p. ej. "Capítulo 3"
+        role (str): "cover" o "chapter" (tamaño según DRAFT_IMAGE_SIZE)
+        seed (str, optional): Texto del que salen el color y las formas (por
+            defecto el título)
+
+    Returns:
+        int: Bytes escritos
+    """
+    from PIL import Image, ImageDraw
+
+    seed = seed or title
+    width, height = DRAFT_IMAGE_SIZE[role]
+    rng = random.Random(hashlib.sha256(seed.encode("utf-8")).hexdigest())
+    base = theme_color(seed)
+    light = tuple(c + (255 - c) * 2 // 3 for c in base)
+
+    # Fondo degradado del color del tema
+    img = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(img)
+    for y in range(height):
+        t = y / max(1, height - 1)
+        draw.line([(0, y), (width, y)], fill=tuple(int(a + (b - a) * t) for a, b in zip(light, base)))
+
+    overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    overlay_draw = ImageDraw.Draw(overlay)
+    _draw_shapes(overlay_draw, rng, seed, width, height)
+
+    # Título sobre una banda oscura para que se lea sobre cualquier fondo
+    font = _font(max(14, width // (12 if role == "cover" else 18)))
+    small = _font(max(10, width // 32))
+    text = _wrap(overlay_draw, title, font, width * 0.85)
+    left, top, right, bottom = overlay_draw.multiline_textbbox((0, 0), text, font=font, align="center")
+    text_x = (width - (right - left)) / 2 - left
+    text_y = (height - (bottom - top)) / 2 - top
+    padding = max(10, height // 20)
+    dark = tuple(c // 3 for c in base)
+    overlay_draw.rectangle((0, text_y + top - padding * 2, width, text_y + bottom + padding), fill=dark + (170,))
+    img = Image.alpha_composite(img.convert("RGBA"), overlay).convert("RGB")
+
+    draw = ImageDraw.Draw(img)
+    draw.multiline_text((text_x, text_y), text, font=font, fill=(255, 255, 255), align="center")
+    if label:
+        label_width = draw.textlength(label, font=small)
+        draw.text(((width - label_width) / 2, text_y + top - padding * 2 + padding // 3), label, font=small,
+                  fill=light)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    img.save(tmp_path, "JPEG", quality=DRAFT_IMAGE_QUALITY, optimize=True)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def generate_draft_image(key, title, label, images_dir, metrics=None):
+    """
+    Genera la ilustración de borrador de una clave de imágenes ("cover", "chapter_3"...).
+
+    Returns:
+        list: Información de la imagen, con el mismo formato que generate_images_dalle
+    """
+    path = os.path.join(images_dir, f"{key}.jpg")
+    render_draft_image(path, title, label, role="cover" if key == "cover" else "chapter", seed=f"{key}:{title}")
+    if metrics:
+        metrics.incr("draft_images")
+    logger.info(f"🖌️ Ilustración de borrador guardada en: {path}")
+    return [{"index": 1, "path": path, "prompt": title, "description": f"Ilustración de borrador: {title}"}]
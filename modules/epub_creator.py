@@ -1,9 +1,10 @@
 import os
 import logging
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
 from datetime import datetime
+from modules.config import EPUB_WRITER
+from modules.epub_writer import StreamingEpubWriter
+from modules.book_model import build_book
+from modules.xhtml_renderer import render_page, render_section_body
 
 logger = logging.getLogger(__name__)
 
@@ -76,161 +77,118 @@ img {
 }
 """
 
-def clean_html(html_content):
-    """Limpia y formatea HTML para usar en EPUB."""
-    soup = BeautifulSoup(html_content, 'lxml')
-    return str(soup)
+def _media_type(img_path):
+    """Determina el tipo de contenido basado en la extensión."""
+    lower = img_path.lower()
+    if lower.endswith('.jpg') or lower.endswith('.jpeg'):
+        return 'image/jpeg'
+    elif lower.endswith('.png'):
+        return 'image/png'
+    elif lower.endswith('.webp'):
+        return 'image/webp'
+    elif lower.endswith('.svg'):
+        return 'image/svg+xml'
+    return 'image/jpeg'  # Por defecto
 
-def create_cover_html(book_content):
-    """Crea la página de portada HTML."""
-    html = f"""<!DOCTYPE html>
-    <html>
-    <head>
-        <title>{book_content["title"]}</title>
-        <link rel="stylesheet" type="text/css" href="style.css" />
-    </head>
-    <body>
-        <div class="cover">
-            <h1>{book_content["title"]}</h1>
-            <p>{book_content["description"]}</p>
-        </div>
-    </body>
-    </html>"""
-    return clean_html(html)
+def _collect_images(book):
+    """Devuelve (nombre, ruta, tipo) de las imágenes que existen en disco."""
+    return [
+        (image.file_name, image.path, _media_type(image.path))
+        for image in book.images()
+        if os.path.exists(image.path)
+    ]
 
-def create_toc_html(book_content):
-    """Crea la página del índice HTML."""
-    toc_items = ""
-    for chapter_number, (chapter_title, page) in enumerate(book_content["toc"].items(), 1):
-        toc_items += f'<div class="toc-entry">{chapter_number}. {chapter_title} - {page}</div>\n'
-    
-    html = f"""<!DOCTYPE html>
-    <html>
-    <head>
-        <title>Índice - {book_content["title"]}</title>
-        <link rel="stylesheet" type="text/css" href="style.css" />
-    </head>
-    <body>
-        <h1 class="toc-title">Índice</h1>
-        {toc_items}
-    </body>
-    </html>"""
-    return clean_html(html)
+def _collect_pages(book, rendered_chapters):
+    """Devuelve (archivo, título, cuerpo XHTML) de cada página en orden de lectura."""
+    pages = []
+    for section in book.sections:
+        if section.kind == "chapter" and rendered_chapters and section.number in rendered_chapters:
+            body = rendered_chapters[section.number]
+        else:
+            body = render_section_body(section)
+        pages.append((section.file_name, section.title, body))
+    return pages
 
-def create_introduction_html(book_content):
-    """Crea la página de introducción HTML."""
-    html = f"""<!DOCTYPE html>
-    <html>
-    <head>
-        <title>Introducción - {book_content["title"]}</title>
-        <link rel="stylesheet" type="text/css" href="style.css" />
-    </head>
-    <body>
-        <h1>Introducción</h1>
-        <div>{book_content["introduction"]}</div>
-    </body>
-    </html>"""
-    return clean_html(html)
+def _write_epub_streaming(book, image_files, pages, output_path, identifier):
+    """Escribe el EPUB elemento a elemento, copiando las imágenes desde disco."""
+    writer = StreamingEpubWriter(output_path, identifier, book.title, 'es', book.metadata)
+    try:
+        writer.add_item("style.css", DEFAULT_CSS, "text/css")
+        for img_name, img_path, media_type in image_files:
+            writer.add_file(img_name, img_path, media_type)
+        for file_name, title, body in pages:
+            writer.add_page(file_name, title, body)
+    except Exception:
+        writer.abort()
+        raise
+    return writer.close([(title, file_name) for file_name, title, _ in pages])
 
-def create_chapter_html(chapter, chapter_number, book_title, images=None):
-    """Crea la página HTML para un capítulo."""
-    content = chapter["content"]
+def _write_epub_ebooklib(book_model, image_files, pages, output_path, identifier):
+    """Escribe el EPUB con ebooklib, que mantiene todo el libro en memoria."""
+    from ebooklib import epub
     
-    # Si hay imágenes disponibles, insertar en el contenido
-    if images and f"chapter_{chapter_number}" in images:
-        chapter_images = images[f"chapter_{chapter_number}"]
-        for img_idx, img_info in enumerate(chapter_images):
-            img_tag = f'<img src="{os.path.basename(img_info["path"])}" alt="{img_info["description"]}" />'
-            # Insertar la imagen después de un párrafo apropiado
-            paragraphs = content.split('\n\n')
-            if len(paragraphs) > (img_idx + 1) * 2:  # Asegurar que hay suficientes párrafos
-                insert_point = (img_idx + 1) * 2  # Insertar después de cada segundo párrafo
-                paragraphs.insert(insert_point, img_tag)
-            else:
-                paragraphs.append(img_tag)  # Añadir al final si no hay suficientes párrafos
-            content = '\n\n'.join(paragraphs)
+    # Crear un nuevo libro EPUB
+    book = epub.EpubBook()
     
-    html = f"""<!DOCTYPE html>
-    <html>
-    <head>
-        <title>Capítulo {chapter_number} - {book_title}</title>
-        <link rel="stylesheet" type="text/css" href="style.css" />
-    </head>
-    <body>
-        <h1>{chapter["title"]}</h1>
-        <div>{content}</div>
-    </body>
-    </html>"""
-    return clean_html(html)
-
-def create_exercises_html(book_content):
-    """Crea la página HTML para ejercicios."""
-    exercises_html = ""
-    for idx, exercise in enumerate(book_content["exercises"], 1):
-        exercises_html += f"""
-        <div class="exercise">
-            <h3>Ejercicio {idx}: {exercise["title"]}</h3>
-            <p>{exercise["description"]}</p>
-        </div>
-        """
+    # Establecer metadatos
+    book.set_identifier(identifier)
+    book.set_title(book_model.title)
+    book.set_language('es')
     
-    html = f"""<!DOCTYPE html>
-    <html>
-    <head>
-        <title>Ejercicios - {book_content["title"]}</title>
-        <link rel="stylesheet" type="text/css" href="style.css" />
-    </head>
-    <body>
-        <h1>Ejercicios y Actividades</h1>
-        {exercises_html}
-    </body>
-    </html>"""
-    return clean_html(html)
-
-def create_conclusion_html(book_content):
-    """Crea la página HTML para la conclusión."""
-    html = f"""<!DOCTYPE html>
-    <html>
-    <head>
-        <title>Conclusión - {book_content["title"]}</title>
-        <link rel="stylesheet" type="text/css" href="style.css" />
-    </head>
-    <body>
-        <h1>Conclusión</h1>
-        <div>{book_content["conclusion"]}</div>
-    </body>
-    </html>"""
-    return clean_html(html)
-
-def create_bibliography_html(book_content):
-    """Crea la página HTML para la bibliografía."""
-    references = ""
-    for idx, reference in enumerate(book_content["bibliography"], 1):
-        references += f'<p class="bibliography-item">{idx}. {reference}</p>\n'
+    # Añadir información adicional de metadatos
+    for name, value in book_model.metadata:
+        book.add_metadata('DC', name, value)
+    
+    # Añadir el archivo CSS
+    style = epub.EpubItem(
+        uid="style_default",
+        file_name="style.css",
+        media_type="text/css",
+        content=DEFAULT_CSS
+    )
+    book.add_item(style)
+    
+    # Añadir imágenes al libro
+    for img_name, img_path, media_type in image_files:
+        with open(img_path, 'rb') as img_file:
+            img_content = img_file.read()
+        book.add_item(epub.EpubItem(file_name=img_name, media_type=media_type, content=img_content))
     
-    html = f"""<!DOCTYPE html>
-    <html>
-    <head>
-        <title>Bibliografía - {book_content["title"]}</title>
-        <link rel="stylesheet" type="text/css" href="style.css" />
-    </head>
-    <body>
-        <h1>Bibliografía</h1>
-        <div class="bibliography">
-            {references}
-        </div>
-    </body>
-    </html>"""
-    return clean_html(html)
+    # Crear páginas
+    chapters = []
+    for file_name, title, body in pages:
+        page = epub.EpubHtml(title=title, file_name=file_name, lang='es')
+        page.content = render_page(title, body)
+        book.add_item(page)
+        chapters.append(page)
+    
+    # Definir el orden de lectura
+    book.spine = ['nav'] + chapters
+    
+    # Añadir tabla de contenidos en formato NCX y HTML
+    book.toc = ((epub.Section('Libro'), tuple(chapters)),)
+    
+    # Añadir navegación de tabla de contenidos
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    
+    # Escribir el archivo EPUB
+    epub.write_epub(output_path, book, {})
+    return output_path
 
-def assemble_epub(book_content, images, output_path):
+def assemble_epub(book_content, images, output_path, rendered_chapters=None, writer=EPUB_WRITER):
     """
     Crea un archivo EPUB a partir del contenido del libro e imágenes.
     
     Args:
         book_content (dict): Contenido del libro en formato JSON
-        images (dict): Información sobre las imágenes generadas
+        images (dict | list): Información sobre las imágenes generadas
         output_path (str): Ruta donde guardar el archivo EPUB
+        rendered_chapters (dict, optional): Cuerpo XHTML ya generado por
+            capítulo (número -> XHTML), p. ej. por el pipeline; el resto se
+            genera aquí
+        writer (str): "streaming" copia las imágenes desde disco al ZIP sin
+            cargarlas en memoria; "ebooklib" usa la biblioteca ebooklib
         
     Returns:
         str: Ruta del archivo EPUB generado
@@ -238,130 +196,19 @@ def assemble_epub(book_content, images, output_path):
     try:
         logger.info("📚 Creando estructura del EPUB...")
         
-        # Crear un nuevo libro EPUB
-        book = epub.EpubBook()
-        
-        # Establecer metadatos
-        book.set_identifier(f"id-{datetime.now().strftime('%Y%m%d%H%M%S')}")
-        book.set_title(book_content["title"])
-        book.set_language('es')
-        
-        # Añadir información adicional de metadatos
-        if "publico" in book_content:
-            book.add_metadata('DC', 'audience', book_content["publico"])
-        if "tema" in book_content:
-            book.add_metadata('DC', 'subject', book_content["tema"])
-        
-        # Añadir el archivo CSS
-        style = epub.EpubItem(
-            uid="style_default",
-            file_name="style.css",
-            media_type="text/css",
-            content=DEFAULT_CSS
-        )
-        book.add_item(style)
-        
-        # Añadir imágenes al libro
-        all_image_files = []
-        for chapter_images in images.values():
-            for img_info in chapter_images:
-                img_path = img_info["path"]
-                if os.path.exists(img_path):
-                    img_name = os.path.basename(img_path)
-                    with open(img_path, 'rb') as img_file:
-                        img_content = img_file.read()
-                    
-                    # Determinar el tipo de contenido basado en la extensión
-                    if img_path.lower().endswith('.jpg') or img_path.lower().endswith('.jpeg'):
-                        media_type = 'image/jpeg'
-                    elif img_path.lower().endswith('.png'):
-                        media_type = 'image/png'
-                    elif img_path.lower().endswith('.svg'):
-                        media_type = 'image/svg+xml'
-                    else:
-                        media_type = 'image/jpeg'  # Por defecto
-                    
-                    # Añadir la imagen al EPUB
-                    epub_image = epub.EpubItem(
-                        file_name=img_name,
-                        media_type=media_type,
-                        content=img_content
-                    )
-                    book.add_item(epub_image)
-                    all_image_files.append(img_name)
-        
-        # Crear capítulos
-        chapters = []
-        
-        # Portada
-        cover = epub.EpubHtml(title='Portada', file_name='cover.xhtml', lang='es')
-        cover.content = create_cover_html(book_content)
-        book.add_item(cover)
-        chapters.append(cover)
-        
-        # Índice
-        toc_page = epub.EpubHtml(title='Índice', file_name='toc.xhtml', lang='es')
-        toc_page.content = create_toc_html(book_content)
-        book.add_item(toc_page)
-        chapters.append(toc_page)
-        
-        # Introducción
-        intro = epub.EpubHtml(title='Introducción', file_name='introduction.xhtml', lang='es')
-        intro.content = create_introduction_html(book_content)
-        book.add_item(intro)
-        chapters.append(intro)
-        
-        # Capítulos del libro
-        for idx, chapter in enumerate(book_content["chapters"], 1):
-            chapter_content = create_chapter_html(chapter, idx, book_content["title"], images)
-            chapter_file = epub.EpubHtml(
-                title=chapter["title"],
-                file_name=f'chapter_{idx}.xhtml',
-                lang='es'
-            )
-            chapter_file.content = chapter_content
-            book.add_item(chapter_file)
-            chapters.append(chapter_file)
-        
-        # Ejercicios
-        exercises = epub.EpubHtml(title='Ejercicios', file_name='exercises.xhtml', lang='es')
-        exercises.content = create_exercises_html(book_content)
-        book.add_item(exercises)
-        chapters.append(exercises)
-        
-        # Conclusión
-        conclusion = epub.EpubHtml(title='Conclusión', file_name='conclusion.xhtml', lang='es')
-        conclusion.content = create_conclusion_html(book_content)
-        book.add_item(conclusion)
-        chapters.append(conclusion)
-        
-        # Bibliografía
-        bibliography = epub.EpubHtml(title='Bibliografía', file_name='bibliography.xhtml', lang='es')
-        bibliography.content = create_bibliography_html(book_content)
-        book.add_item(bibliography)
-        chapters.append(bibliography)
-        
-        # Definir el orden de lectura
-        book.spine = ['nav'] + chapters
-        
-        # Añadir tabla de contenidos en formato NCX y HTML
-        book.toc = (
-            (epub.Section('Libro'),
-             (cover, toc_page, intro, *[chapters[i] for i in range(3, 3 + len(book_content["chapters"]))], 
-              exercises, conclusion, bibliography)
-            ),
-        )
-        
-        # Añadir navegación de tabla de contenidos
-        book.add_item(epub.EpubNcx())
-        book.add_item(epub.EpubNav())
+        identifier = f"id-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        book = build_book(book_content, images)
+        image_files = _collect_images(book)
+        pages = _collect_pages(book, rendered_chapters)
         
-        # Escribir el archivo EPUB
-        epub.write_epub(output_path, book, {})
+        if writer == "ebooklib":
+            _write_epub_ebooklib(book, image_files, pages, output_path, identifier)
+        else:
+            _write_epub_streaming(book, image_files, pages, output_path, identifier)
         
         logger.info(f"📙 Archivo EPUB creado: {output_path}")
         return output_path
         
     except Exception as e:
         logger.exception(f"❌ Error al crear el EPUB: {str(e)}")
-        raise
\ No newline at end of file
+        raise
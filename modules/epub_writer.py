@@ -0,0 +1,249 @@
+"""
+Escritor de EPUB en streaming.
+
+A diferencia de `ebooklib`, que mantiene todo el libro en memoria hasta
+`write_epub`, este escritor vuelca cada elemento al contenedor ZIP en cuanto
+se añade: las páginas se escriben comprimidas y las imágenes se copian desde
+disco por bloques, sin comprimir (ya lo están). El archivo `mimetype` va el
+primero y sin comprimir, como exige el formato. El resultado reproduce la
+estructura que genera ebooklib (EPUB/content.opf, toc.ncx, nav.xhtml...), así
+que el consumo de memoria no crece con el número de ilustraciones.
+"""
+
+import logging
+import os
+import shutil
+import zipfile
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape, quoteattr
+
+logger = logging.getLogger(__name__)
+
+FOLDER_NAME = "EPUB"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Tipos de archivo que ya vienen comprimidos y se guardan tal cual
+STORED_MEDIA_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif"}
+
+CONTAINER_XML = """<?xml version="1.0" encoding="utf-8"?>
+<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container" version="1.0">
+  <rootfiles>
+    <rootfile media-type="application/oebps-package+xml" full-path="EPUB/content.opf"/>
+  </rootfiles>
+</container>
+"""
+
+PAGE_XHTML = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" epub:prefix="z3998: http://www.daisy.org/z3998/2012/vocab/structure/#" lang={lang} xml:lang={lang}>
+  <head>
+    <title>{title}</title>
+{links}  </head>
+  <body>{body}</body>
+</html>
+"""
+
+
+class StreamingEpubWriter:
+    """
+    Escribe un EPUB 3 elemento a elemento.
+
+    Uso:
+        writer = StreamingEpubWriter(path, identifier, title)
+        writer.add_item("style.css", css, "text/css")
+        writer.add_page("cover.xhtml", "Portada", body_xhtml)
+        writer.add_file("cover.png", "/ruta/cover.png", "image/png")
+        writer.close(toc)
+
+    El archivo se escribe primero con extensión temporal y se renombra al
+    cerrar, de modo que nunca queda un EPUB a medias en la ruta final.
+    """
+
+    def __init__(self, output_path, identifier, title, language="es", metadata=None):
+        self.output_path = output_path
+        self.identifier = identifier
+        self.title = title
+        self.language = language
+        self.metadata = metadata or []
+        self.stylesheets = []
+        self._manifest = []
+        self._spine = []
+        self._ids = {"nav", "ncx", "id"}
+        self._page_ids = {}
+        self._tmp_path = output_path + ".part"
+        self._zip = zipfile.ZipFile(self._tmp_path, "w", zipfile.ZIP_DEFLATED)
+        # mimetype debe ser la primera entrada y sin comprimir
+        self._zip.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+
+    def _item_id(self, file_name):
+        """Convierte un nombre de archivo en un id XML válido y único."""
+        item_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in file_name)
+        if not item_id[:1].isalpha():
+            item_id = "item_" + item_id
+        candidate, n = item_id, 1
+        while candidate in self._ids:
+            n += 1
+            candidate = f"{item_id}_{n}"
+        self._ids.add(candidate)
+        return candidate
+
+    def add_item(self, file_name, content, media_type):
+        """Añade un elemento pequeño generado en memoria (CSS, etc.)."""
+        if media_type == "text/css":
+            self.stylesheets.append(file_name)
+        data = content.encode("utf-8") if isinstance(content, str) else content
+        self._zip.writestr(f"{FOLDER_NAME}/{file_name}", data)
+        self._manifest.append({"id": self._item_id(file_name), "href": file_name, "media-type": media_type})
+
+    def add_page(self, file_name, title, body, linear=True):
+        """
+        Añade una página XHTML al libro y al orden de lectura.
+
+        Args:
+            file_name (str): Nombre del archivo dentro del EPUB
+            title (str): Título de la página
+            body (str): Contenido XHTML bien formado del <body>
+            linear (bool): Si la página forma parte de la lectura lineal
+        """
+        links = "".join(
+            f"    <link href={quoteattr(href)} rel=\"stylesheet\" type=\"text/css\"/>\n"
+            for href in self.stylesheets
+        )
+        page = PAGE_XHTML.format(lang=quoteattr(self.language), title=escape(title), links=links, body=body)
+        self._zip.writestr(f"{FOLDER_NAME}/{file_name}", page.encode("utf-8"))
+        item_id = self._item_id(file_name)
+        self._page_ids[file_name] = item_id
+        self._manifest.append({"id": item_id, "href": file_name, "media-type": "application/xhtml+xml"})
+        self._spine.append((item_id, linear))
+
+    def add_file(self, file_name, path, media_type):
+        """Copia un archivo desde disco al EPUB por bloques, sin cargarlo en memoria."""
+        info = zipfile.ZipInfo(f"{FOLDER_NAME}/{file_name}", date_time=datetime.now().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_STORED if media_type in STORED_MEDIA_TYPES else zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        # ZIP64 solo si hace falta (mismo margen que zipfile): algunos lectores rechazan sus cabeceras
+        zip64 = os.path.getsize(path) * 1.05 > zipfile.ZIP64_LIMIT
+        with open(path, "rb") as src, self._zip.open(info, "w", force_zip64=zip64) as dest:
+            shutil.copyfileobj(src, dest, COPY_CHUNK_SIZE)
+        self._manifest.append({"id": self._item_id(file_name), "href": file_name, "media-type": media_type})
+
+    def _nav_xhtml(self, toc_title, toc):
+        items = "\n".join(
+            f"            <li><a href={quoteattr(href)}>{escape(title)}</a></li>" for title, href in toc
+        )
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" lang={quoteattr(self.language)} xml:lang={quoteattr(self.language)}>
+  <head>
+    <title>{escape(self.title)}</title>
+  </head>
+  <body>
+    <nav epub:type="toc" id="id" role="doc-toc">
+      <h2>{escape(self.title)}</h2>
+      <ol>
+        <li>
+          <span>{escape(toc_title)}</span>
+          <ol>
+{items}
+          </ol>
+        </li>
+      </ol>
+    </nav>
+  </body>
+</html>
+"""
+
+    def _toc_ncx(self, toc_title, toc):
+        points = "\n".join(
+            f"""      <navPoint id={quoteattr(self._page_ids.get(href, href))}>
+        <navLabel>
+          <text>{escape(title)}</text>
+        </navLabel>
+        <content src={quoteattr(href)}/>
+      </navPoint>""" for title, href in toc
+        )
+        first = toc[0][1] if toc else ""
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<ncx xmlns="http://www.daisy.org/z3986/2005/ncx/" version="2005-1">
+  <head>
+    <meta content={quoteattr(self.identifier)} name="dtb:uid"/>
+    <meta content="0" name="dtb:depth"/>
+    <meta content="0" name="dtb:totalPageCount"/>
+    <meta content="0" name="dtb:maxPageNumber"/>
+  </head>
+  <docTitle>
+    <text>{escape(self.title)}</text>
+  </docTitle>
+  <navMap>
+    <navPoint id="sep_0">
+      <navLabel>
+        <text>{escape(toc_title)}</text>
+      </navLabel>
+      <content src={quoteattr(first)}/>
+{points}
+    </navPoint>
+  </navMap>
+</ncx>
+"""
+
+    def _content_opf(self):
+        modified = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        metadata = "".join(
+            f"    <dc:{name}>{escape(value)}</dc:{name}>\n" for name, value in self.metadata
+        )
+        manifest = "".join(
+            "    <item " + " ".join(f"{key}={quoteattr(value)}" for key, value in item.items()) + "/>\n"
+            for item in self._manifest
+        )
+        spine = "".join(
+            f"    <itemref idref={quoteattr(item_id)}" + ("" if linear else ' linear="no"') + "/>\n"
+            for item_id, linear in self._spine
+        )
+        return f"""<?xml version='1.0' encoding='utf-8'?>
+<package xmlns="http://www.idpf.org/2007/opf" unique-identifier="id" version="3.0" prefix="rendition: http://www.idpf.org/vocab/rendition/#">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:opf="http://www.idpf.org/2007/opf">
+    <meta property="dcterms:modified">{modified}</meta>
+    <dc:identifier id="id">{escape(self.identifier)}</dc:identifier>
+    <dc:title>{escape(self.title)}</dc:title>
+    <dc:language>{escape(self.language)}</dc:language>
+{metadata}  </metadata>
+  <manifest>
+{manifest}  </manifest>
+  <spine toc="ncx">
+{spine}  </spine>
+</package>
+"""
+
+    def close(self, toc, toc_title="Libro"):
+        """
+        Escribe la navegación, el paquete OPF y el contenedor, y cierra el EPUB.
+
+        Args:
+            toc (list): Entradas (título, archivo) de la tabla de contenidos
+            toc_title (str): Título de la sección que agrupa las entradas
+
+        Returns:
+            str: Ruta del EPUB escrito
+        """
+        try:
+            self._zip.writestr(f"{FOLDER_NAME}/nav.xhtml", self._nav_xhtml(toc_title, toc).encode("utf-8"))
+            self._manifest.append({"id": "nav", "href": "nav.xhtml", "media-type": "application/xhtml+xml", "properties": "nav"})
+            self._spine.insert(0, ("nav", True))
+            self._zip.writestr(f"{FOLDER_NAME}/toc.ncx", self._toc_ncx(toc_title, toc).encode("utf-8"))
+            self._manifest.append({"id": "ncx", "href": "toc.ncx", "media-type": "application/x-dtbncx+xml"})
+            self._zip.writestr(f"{FOLDER_NAME}/content.opf", self._content_opf().encode("utf-8"))
+            self._zip.writestr("META-INF/container.xml", CONTAINER_XML)
+            self._zip.close()
+            os.replace(self._tmp_path, self.output_path)
+        except Exception:
+            self.abort()
+            raise
+        return self.output_path
+
+    def abort(self):
+        """Descarta el EPUB a medio escribir."""
+        try:
+            self._zip.close()
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
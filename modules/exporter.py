@@ -0,0 +1,163 @@
+"""
+Exportación del libro a varios formatos a partir de una sola generación.
+
+Cada formato pedido (EPUB, PDF) se renderiza en su propio proceso con el
+mismo contenido e imágenes, así que exportar ambos cuesta aproximadamente lo
+que el renderizador más lento. Cada archivo se escribe primero con un nombre
+temporal en el mismo directorio y se renombra al terminar, de modo que nunca
+queda un libro a medias en la ruta final.
+"""
+
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from modules.config import EXPORT_FORMATS
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = ("epub", "pdf")
+
+
+def parse_formats(value):
+    """
+    Interpreta una lista de formatos como "epub,pdf".
+
+    Args:
+        value (str | list | None): Formatos separados por comas o lista
+
+    Returns:
+        list: Formatos en minúsculas, sin repetir y en el orden indicado
+
+    Raises:
+        ValueError: Si algún formato no está soportado
+    """
+    if value is None:
+        return list(EXPORT_FORMATS)
+    if isinstance(value, str):
+        value = value.split(",")
+    formats = []
+    for fmt in value:
+        fmt = fmt.strip().lower().lstrip(".")
+        if not fmt:
+            continue
+        if fmt not in SUPPORTED_FORMATS:
+            raise ValueError(f"Formato no soportado: {fmt} (admitidos: {', '.join(SUPPORTED_FORMATS)})")
+        if fmt not in formats:
+            formats.append(fmt)
+    if not formats:
+        raise ValueError("No se indicó ningún formato de salida")
+    return formats
+
+
+def output_paths(base_path, formats):
+    """Devuelve la ruta de salida de cada formato a partir de una ruta base."""
+    stem = os.path.splitext(base_path)[0]
+    return {fmt: f"{stem}.{fmt}" for fmt in formats}
+
+
+def render_format(fmt, book_content, images, output_path, rendered_chapters=None):
+    """
+    Renderiza un formato y lo mueve a su ruta final de forma atómica.
+
+    Se ejecuta en un proceso aparte, por eso importa el renderizador aquí y
+    recibe solo datos serializables.
+
+    Returns:
+        str: Ruta del archivo generado
+    """
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        if fmt == "epub":
+            from modules.epub_creator import assemble_epub
+            assemble_epub(book_content, images, tmp_path, rendered_chapters)
+        elif fmt == "pdf":
+            from modules.pdf_creator import assemble_pdf
+            assemble_pdf(book_content, images, tmp_path)
+        else:
+            raise ValueError(f"Formato no soportado: {fmt}")
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+
+def _render_timed(fmt, book_content, images, output_path, rendered_chapters=None):
+    """Como render_format, pero devuelve también los segundos de renderizado."""
+    started = time.perf_counter()
+    path = render_format(fmt, book_content, images, output_path, rendered_chapters)
+    return path, time.perf_counter() - started
+
+
+def _record(metrics, fmt, path, seconds):
+    if metrics:
+        metrics.observe(f"export_{fmt}", seconds)
+        metrics.add_bytes("out", os.path.getsize(path))
+    return path
+
+
+def _render_inline(formats, paths, book_content, images, rendered_chapters, metrics):
+    return {
+        fmt: _record(metrics, fmt, *_render_timed(fmt, book_content, images, paths[fmt], rendered_chapters))
+        for fmt in formats
+    }
+
+
+def export_book(book_content, images, base_path, formats=None, rendered_chapters=None, metrics=None):
+    """
+    Exporta el libro a todos los formatos pedidos, uno por proceso.
+
+    Args:
+        book_content (dict): Contenido del libro en formato JSON
+        images (dict): Información sobre las imágenes generadas
+        base_path (str): Ruta de salida; la extensión se sustituye por la de
+            cada formato
+        formats (str | list, optional): Formatos a generar (por defecto EXPORT_FORMATS)
+        rendered_chapters (dict, optional): Cuerpo XHTML ya generado por capítulo
+        metrics (RunMetrics, optional): Recibe la duración de cada formato
+            (medida dentro de su proceso) y los bytes escritos
+
+    Returns:
+        dict: Formato -> ruta del archivo generado
+
+    Raises:
+        Exception: El primer error de renderizado, tras esperar al resto de formatos
+    """
+    formats = parse_formats(formats)
+    paths = output_paths(base_path, formats)
+    os.makedirs(os.path.dirname(os.path.abspath(base_path)), exist_ok=True)
+
+    if len(formats) == 1:
+        return _render_inline(formats, paths, book_content, images, rendered_chapters, metrics)
+
+    logger.info(f"📦 Exportando {', '.join(f.upper() for f in formats)} en paralelo...")
+    results, errors, pool_error = {}, {}, None
+    try:
+        with ProcessPoolExecutor(max_workers=len(formats)) as executor:
+            futures = {
+                fmt: executor.submit(_render_timed, fmt, book_content, images, paths[fmt], rendered_chapters)
+                for fmt in formats
+            }
+            for fmt, future in futures.items():
+                try:
+                    results[fmt] = _record(metrics, fmt, *future.result())
+                except BrokenProcessPool as e:
+                    pool_error = e
+                except Exception as e:
+                    logger.error(f"❌ Error al generar el {fmt.upper()}: {str(e)}")
+                    errors[fmt] = e
+    except (OSError, NotImplementedError, BrokenProcessPool) as e:
+        pool_error = e
+
+    # Solo se repiten en serie los formatos que el pool no llegó a terminar
+    pending = [fmt for fmt in formats if fmt not in results and fmt not in errors]
+    if pending:
+        logger.warning(f"⚠️ No se pudo usar el pool de procesos, se exporta en serie "
+                       f"{', '.join(f.upper() for f in pending)}: {str(pool_error)}")
+        results.update(_render_inline(pending, paths, book_content, images, rendered_chapters, metrics))
+
+    if errors:
+        raise next(iter(errors.values()))
+    return {fmt: results[fmt] for fmt in formats}
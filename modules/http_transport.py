@@ -0,0 +1,122 @@
+"""
+Transporte httpx cuyas solicitudes en curso se pueden abortar una a una.
+
+Cerrar un cliente httpx no despierta una lectura bloqueada en otro hilo, y
+además cortaría las conexiones de todos los que comparten el cliente. Este
+transporte usa un `httpcore.ConnectionPool` con un backend de red propio: cada
+conexión, al leer o escribir, se apunta en la solicitud en curso del hilo que
+la usa (ver api_client.abort_on_cancel). Abortar esa solicitud corta con
+shutdown solo sus conexiones; las demás solicitudes del pool siguen igual.
+"""
+
+import socket
+from contextlib import contextmanager
+import httpcore
+import httpx
+from modules.api_client import current_abort_scope
+
+# Excepciones de httpcore que se traducen a la de httpx del mismo nombre
+_HTTPCORE_ERRORS = (httpcore.TimeoutException, httpcore.NetworkError, httpcore.ProtocolError,
+                    httpcore.ProxyError, httpcore.UnsupportedProtocol)
+
+
+@contextmanager
+def _httpx_errors():
+    """Traduce las excepciones de httpcore a las de httpx, que son las que entiende openai."""
+    try:
+        yield
+    except _HTTPCORE_ERRORS as e:
+        raise getattr(httpx, type(e).__name__, httpx.TransportError)(str(e)) from e
+
+
+class ScopedStream(httpcore.NetworkStream):
+    """Conexión que se apunta en la solicitud en curso del hilo que la usa."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def _enter(self):
+        scope = current_abort_scope()
+        if scope is not None and not scope.track(self):
+            raise httpcore.ReadError("Solicitud cancelada")
+
+    def read(self, max_bytes, timeout=None):
+        self._enter()
+        return self._stream.read(max_bytes, timeout)
+
+    def write(self, buffer, timeout=None):
+        self._enter()
+        self._stream.write(buffer, timeout)
+
+    def close(self):
+        self._stream.close()
+
+    def start_tls(self, ssl_context, server_hostname=None, timeout=None):
+        return ScopedStream(self._stream.start_tls(ssl_context, server_hostname, timeout))
+
+    def get_extra_info(self, info):
+        return self._stream.get_extra_info(info)
+
+    def shutdown(self):
+        """Corta la conexión, despertando la lectura que la esté esperando en otro hilo."""
+        sock = self._stream.get_extra_info("socket")
+        try:
+            # Se llama al método de socket también con SSLSocket para no tocar su estado TLS
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except (OSError, TypeError):
+            pass  # Conexión ya cerrada
+
+
+class ScopedBackend(httpcore.SyncBackend):
+    """Backend de red que envuelve cada conexión nueva en un ScopedStream."""
+
+    def connect_tcp(self, *args, **kwargs):
+        return ScopedStream(super().connect_tcp(*args, **kwargs))
+
+
+class _ResponseStream(httpx.SyncByteStream):
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __iter__(self):
+        with _httpx_errors():
+            yield from self._stream
+
+    def close(self):
+        if hasattr(self._stream, "close"):
+            self._stream.close()
+
+
+class AbortableTransport(httpx.BaseTransport):
+    """
+    Transporte HTTP/1.1 con pool de conexiones y solicitudes abortables.
+
+    Args:
+        limits (httpx.Limits): Límites del pool de conexiones
+    """
+
+    def __init__(self, limits):
+        self._pool = httpcore.ConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            network_backend=ScopedBackend()
+        )
+
+    def handle_request(self, request):
+        core_request = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(scheme=request.url.raw_scheme, host=request.url.raw_host,
+                             port=request.url.port, target=request.url.raw_path),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions
+        )
+        with _httpx_errors():
+            response = self._pool.handle_request(core_request)
+        return httpx.Response(status_code=response.status, headers=response.headers,
+                              stream=_ResponseStream(response.stream), extensions=response.extensions)
+
+    def close(self):
+        self._pool.close()
@@ -1,10 +1,18 @@
 import os
 import json
 import logging
-import requests
-import time
-import openai
-from user_prompt import IMAGE_PROMPT_TEMPLATE
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from modules.user_prompt import IMAGE_PROMPT_TEMPLATE
+from modules.config import (
+    OPENAI_IMAGE_MODEL, IMAGE_SIZE, IMAGE_MAX_WORKERS,
+    IMAGE_REQUESTS_PER_MINUTE, IMAGE_RATE_BURST, IMAGE_MAX_CONCURRENCY
+)
+from modules.rate_limiter import get_rate_limiter
+from modules.openai_api import call_api
+from modules.api_client import CircuitOpenError, get_client
+from modules.cache import ResponseCache, get_cache
+from modules.downloader import download_image
+from modules.metrics import RunMetrics
 
 logger = logging.getLogger(__name__)
 
@@ -49,71 +57,149 @@ def generate_image_prompt(book_params, description):
     
     return prompt
 
-def generate_images_dalle(prompts, images_dir, quality="standard"):
+def _generate_single_image(client, prompt, image_path, quality, limiter, cancel_token, metrics):
+    """Genera una imagen con DALL-E y la descarga en `image_path`."""
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    request = {
+        "model": OPENAI_IMAGE_MODEL,
+        "prompt": prompt,
+        "size": IMAGE_SIZE,
+        "quality": quality,
+        "n": 1,
+    }
+
+    # Consultar la caché antes de llamar a la API
+    cache = get_cache()
+    cache_key = ResponseCache.make_key(kind="image", **request) if cache else None
+    if cache and cache.get_file(cache_key, image_path):
+        logger.info(f"♻️ Imagen recuperada de la caché: {image_path}")
+        metrics.incr("image_cache_hits")
+        return
+
+    response = call_api(client, "images.generate", request, limiter, "image",
+                        cancel_token=cancel_token, metrics=metrics)
+
+    image_url = response.data[0].url
+
+    # Descargar la imagen (streaming, verificada y con escritura atómica)
+    with metrics.timer("download"):
+        download_image(image_url, image_path, cancel_token=cancel_token, metrics=metrics)
+
+    if cache:
+        cache.put_file(cache_key, image_path)
+
+def generate_images_dalle(prompts, images_dir, quality="standard", file_names=None, max_workers=None,
+                          cancel_token=None, metrics=None):
     """
     Genera imágenes utilizando DALL-E de OpenAI.
     
+    Las generaciones y descargas se ejecutan en paralelo con un número máximo
+    de hilos, y un limitador de tasa compartido que se ajusta con las cabeceras
+    de cuota de la API sustituye a la espera fija entre solicitudes. Si el
+    circuito de la API de imágenes se abre, las imágenes que faltan se
+    obtienen con generate_images_fallback. El resultado conserva el orden de
+    `prompts`.
+    
     Args:
         prompts (list): Lista de prompts para generar imágenes
         images_dir (str): Directorio donde guardar las imágenes
         quality (str): Calidad de las imágenes ('standard' o 'hd')
+        file_names (list, optional): Nombres de archivo para cada prompt
+        max_workers (int, optional): Imágenes simultáneas (por defecto IMAGE_MAX_WORKERS)
+        cancel_token (CancellationToken, optional): Al cancelar se abortan las
+            llamadas en curso y no se piden más imágenes
+        metrics (RunMetrics, optional): Métricas de la ejecución (duración de
+            cada imagen y descarga, bytes recibidos y errores)
         
     Returns:
-        list: Información sobre las imágenes generadas
+        list: Información sobre las imágenes generadas, en el orden de los prompts
     """
     image_info = []
+    if not prompts:
+        return image_info
+    metrics = metrics or RunMetrics()
     
     try:
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            raise ValueError("No se encontró la clave API de OpenAI en las variables de entorno")
+        client = get_client()
+        limiter = get_rate_limiter(OPENAI_IMAGE_MODEL, IMAGE_REQUESTS_PER_MINUTE, IMAGE_RATE_BURST,
+                                   IMAGE_MAX_CONCURRENCY)
         
-        client = openai.OpenAI(api_key=api_key)
+        if file_names is None:
+            file_names = [f"image_{i+1}.png" for i in range(len(prompts))]
+        workers = max(1, min(max_workers or IMAGE_MAX_WORKERS, len(prompts)))
+        results = [None] * len(prompts)
+        circuit_open = []
         
-        for i, prompt in enumerate(prompts):
-            try:
-                logger.info(f"🎨 Generando imagen {i+1}/{len(prompts)}")
-                
-                response = client.images.generate(
-                    model="dall-e-3",  # Usar el modelo más avanzado disponible
-                    prompt=prompt,
-                    size="1024x1024",
-                    quality=quality,
-                    n=1,
-                )
-                
-                image_url = response.data[0].url
-                
-                # Descargar la imagen
-                image_path = os.path.join(images_dir, f"image_{i+1}.png")
-                os.makedirs(os.path.dirname(image_path), exist_ok=True)
-                
-                response = requests.get(image_url)
-                with open(image_path, "wb") as f:
-                    f.write(response.content)
-                
-                # Registrar información de la imagen
-                image_info.append({
-                    "path": image_path,
-                    "prompt": prompt,
-                    "description": f"Imagen {i+1} para el libro"
-                })
-                
-                logger.info(f"✅ Imagen {i+1} guardada en: {image_path}")
-                
-                # Esperar un poco entre solicitudes para evitar límites de tasa
-                time.sleep(2)
-                
-            except Exception as e:
-                logger.error(f"❌ Error al generar imagen {i+1}: {str(e)}")
-                continue
+        def generar(i, prompt):
+            logger.info(f"🎨 Generando imagen {i+1}/{len(prompts)}")
+            image_path = os.path.join(images_dir, file_names[i])
+            with metrics.timer("image"):
+                _generate_single_image(client, prompt, image_path, quality, limiter, cancel_token, metrics)
+            logger.info(f"✅ Imagen {i+1} guardada en: {image_path}")
+            
+            # Registrar información de la imagen
+            return {
+                "index": i + 1,
+                "path": image_path,
+                "prompt": prompt,
+                "description": f"Imagen {i+1} para el libro"
+            }
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(generar, i, prompt): i for i, prompt in enumerate(prompts)}
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except CircuitOpenError:
+                    circuit_open.append(i)
+                except Exception as e:
+                    if cancel_token and cancel_token.is_set():
+                        continue
+                    logger.error(f"❌ Error al generar imagen {i+1}: {str(e)}")
+                    metrics.incr("image_errors")
+        
+        if circuit_open and not (cancel_token and cancel_token.is_set()):
+            # API caída: no esperar a cada reintento, pasar al método alternativo
+            circuit_open.sort()
+            logger.warning(f"🔄 API de imágenes no disponible, {len(circuit_open)} imágenes con el método alternativo")
+            metrics.incr("image_fallbacks", len(circuit_open))
+            fallback = generate_images_fallback([prompts[i] for i in circuit_open], images_dir,
+                                                file_names=[file_names[i] for i in circuit_open])
+            for info in fallback:
+                i = circuit_open[info["index"] - 1]
+                results[i] = {**info, "index": i + 1, "prompt": prompts[i]}
+        
+        image_info = [info for info in results if info is not None]
     
     except Exception as e:
         logger.exception(f"❌ Error general en la generación de imágenes: {str(e)}")
     
     return image_info
 
-def generate_images_fallback(descriptions, images_dir):
+def build_cover_prompt(book_content, book_params):
+    """Crea el prompt de la imagen de portada."""
+    return generate_image_prompt(
+        book_params, 
+        f"Portada del libro '{book_content.get('title', book_params['title'])}'. Representación visual del tema principal: {book_params['tema']}"
+    )
+
+def build_chapter_prompt(chapter, book_params):
+    """Crea el prompt de la ilustración de un capítulo a partir de su contenido."""
+    # Extraer conceptos clave del capítulo
+    chapter_text = chapter["content"]
+    chapter_title = chapter["title"]
+    
+    # Limitar a 500 caracteres para el prompt
+    short_content = chapter_text[:500] + "..." if len(chapter_text) > 500 else chapter_text
+    
+    # Crear un prompt específico para este capítulo
+    return generate_image_prompt(
+        book_params,
+        f"Ilustración para el capítulo '{chapter_title}'. Contenido: {short_content}"
+    )
+
+def generate_images_fallback(descriptions, images_dir, file_names=None):
     """
     Método alternativo para obtener imágenes cuando no se puede usar DALL-E.
     Usa imágenes de placeholder o imágenes libres de derechos.
@@ -121,6 +207,7 @@ def generate_images_fallback(descriptions, images_dir):
     Args:
         descriptions (list): Lista de descripciones para las imágenes
         images_dir (str): Directorio donde guardar las imágenes
+        file_names (list, optional): Nombres de archivo para cada descripción
         
     Returns:
         list: Información sobre las imágenes generadas
@@ -143,15 +230,14 @@ def generate_images_fallback(descriptions, images_dir):
         for i, (url, desc) in enumerate(zip(urls_to_use, descriptions)):
             try:
                 # Descargar la imagen
-                image_path = os.path.join(images_dir, f"image_{i+1}.png")
+                image_path = os.path.join(images_dir, file_names[i] if file_names else f"image_{i+1}.png")
                 os.makedirs(os.path.dirname(image_path), exist_ok=True)
                 
-                response = requests.get(url)
-                with open(image_path, "wb") as f:
-                    f.write(response.content)
+                download_image(url, image_path)
                 
                 # Registrar información de la imagen
                 image_info.append({
+                    "index": i + 1,
                     "path": image_path,
                     "description": desc
                 })
@@ -186,46 +272,30 @@ def generate_book_images(book_content, book_params, images_dir):
         images_info = {}
         
         # Generar imagen de portada
-        cover_prompt = generate_image_prompt(
-            book_params, 
-            f"Portada del libro '{book_content['title']}'. Representación visual del tema principal: {book_params['tema']}"
-        )
-        cover_prompts = [cover_prompt]
+        cover_prompts = [build_cover_prompt(book_content, book_params)]
         
         # Generar prompts para imágenes de capítulos
         chapter_prompts = []
         chapter_descriptions = []
         
-        for i, chapter in enumerate(book_content["chapters"], 1):
-            # Extraer conceptos clave del capítulo
-            chapter_text = chapter["content"]
-            chapter_title = chapter["title"]
-            
-            # Limitar a 500 caracteres para el prompt
-            short_content = chapter_text[:500] + "..." if len(chapter_text) > 500 else chapter_text
-            
-            # Crear un prompt específico para este capítulo
-            chapter_prompt = generate_image_prompt(
-                book_params,
-                f"Ilustración para el capítulo '{chapter_title}'. Contenido: {short_content}"
-            )
-            
-            chapter_prompts.append(chapter_prompt)
-            chapter_descriptions.append(f"Ilustración del capítulo: {chapter_title}")
+        for chapter in book_content["chapters"]:
+            chapter_prompts.append(build_chapter_prompt(chapter, book_params))
+            chapter_descriptions.append(f"Ilustración del capítulo: {chapter['title']}")
         
         # Intentar generar imágenes con DALL-E
         try:
             # Primero la portada
-            cover_images = generate_images_dalle(cover_prompts, images_dir, quality="hd")
+            cover_images = generate_images_dalle(cover_prompts, images_dir, quality="hd", file_names=["cover.png"])
             if cover_images:
                 images_info["cover"] = cover_images
             
             # Luego los capítulos
-            chapter_images = generate_images_dalle(chapter_prompts, images_dir)
+            chapter_files = [f"chapter_{i}.png" for i in range(1, len(chapter_prompts) + 1)]
+            chapter_images = generate_images_dalle(chapter_prompts, images_dir, file_names=chapter_files)
             
-            # Organizar las imágenes por capítulos
-            for i, img_info in enumerate(chapter_images):
-                chapter_key = f"chapter_{i+1}"
+            # Organizar las imágenes por capítulos (el índice sobrevive a los fallos)
+            for img_info in chapter_images:
+                chapter_key = f"chapter_{img_info['index']}"
                 if chapter_key not in images_info:
                     images_info[chapter_key] = []
                 images_info[chapter_key].append(img_info)
@@ -0,0 +1,141 @@
+"""
+Optimización de las ilustraciones antes de empaquetarlas en el EPUB.
+
+Las imágenes de DALL-E llegan como PNG de 1024x1024 y 1,6-2,1 MB. Aquí se
+redimensionan según su rol (portada o capítulo) y se recodifican a JPEG,
+WebP o PNG cuantizado. Los resultados se guardan con el hash del original y
+de los ajustes en el nombre, de modo que una imagen ya optimizada no se
+vuelve a procesar.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from modules.config import IMAGE_OPTIMIZATION
+from modules.image_service import get_image_service
+
+logger = logging.getLogger(__name__)
+
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "WEBP": ".webp", "PNG": ".png"}
+
+
+def image_role(key):
+    """Devuelve el rol de optimización de una clave de imágenes ("cover" o "chapter")."""
+    return "cover" if key == "cover" else "chapter"
+
+
+def _optimized_name(src_path, settings):
+    digest = hashlib.sha256()
+    with open(src_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    digest.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    return f"{stem}_{digest.hexdigest()[:16]}{FORMAT_EXTENSIONS[settings['format']]}"
+
+
+def transcode_image(src_path, dest_path, settings):
+    """
+    Redimensiona y recodifica una imagen según los ajustes indicados.
+
+    Args:
+        src_path (str): Imagen original
+        dest_path (str): Ruta de la imagen optimizada
+        settings (dict): Ajustes con "max_size", "format" y "quality" o "colors"
+    """
+    from PIL import Image
+
+    with Image.open(src_path) as img:
+        img.load()
+        img.thumbnail(tuple(settings["max_size"]), Image.LANCZOS)
+        fmt = settings["format"]
+
+        tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+        if fmt == "PNG":
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
+            img = img.quantize(colors=settings.get("colors", 256), method=Image.FASTOCTREE)
+            img.save(tmp_path, "PNG", optimize=True)
+        else:
+            if img.mode in ("RGBA", "LA", "P"):
+                # JPEG no admite transparencia: componer sobre fondo blanco
+                rgba = img.convert("RGBA")
+                background = Image.new("RGB", rgba.size, (255, 255, 255))
+                background.paste(rgba, mask=rgba.split()[-1])
+                img = background
+            elif img.mode != "RGB":
+                img = img.convert("RGB")
+            if fmt == "JPEG":
+                img.save(tmp_path, "JPEG", quality=settings.get("quality", 80), optimize=True, progressive=True)
+            else:
+                img.save(tmp_path, "WEBP", quality=settings.get("quality", 80), method=6)
+        os.replace(tmp_path, dest_path)
+
+
+def _plan_optimization(img_info, role, dest_dir, settings):
+    """Calcula la ruta optimizada de una imagen e indica si hay que recodificarla."""
+    role_settings = (settings or IMAGE_OPTIMIZATION)[role]
+    os.makedirs(dest_dir, exist_ok=True)
+    dest_path = os.path.join(dest_dir, _optimized_name(img_info["path"], role_settings))
+    return dest_path, role_settings, not os.path.exists(dest_path)
+
+
+def _optimized_info(img_info, dest_path):
+    optimized = dict(img_info)
+    optimized["path"] = dest_path
+    optimized["original_path"] = img_info["path"]
+    optimized["original_bytes"] = os.path.getsize(img_info["path"])
+    optimized["bytes"] = os.path.getsize(dest_path)
+    return optimized
+
+
+def optimize_image_info(img_info, role, dest_dir, settings=None):
+    """
+    Optimiza una imagen descrita por `img_info` y devuelve su nueva descripción.
+
+    La recodificación se envía al servicio de imágenes compartido, de modo
+    que varias llamadas simultáneas aprovechan varios núcleos.
+
+    Args:
+        img_info (dict): Información de la imagen (con "path")
+        role (str): "cover" o "chapter"
+        dest_dir (str): Directorio de las imágenes optimizadas
+        settings (dict, optional): Ajustes por rol (por defecto IMAGE_OPTIMIZATION)
+
+    Returns:
+        dict: Copia de `img_info` apuntando a la imagen optimizada, con
+        "original_path", "original_bytes" y "bytes"
+    """
+    dest_path, role_settings, pending = _plan_optimization(img_info, role, dest_dir, settings)
+    if pending:
+        get_image_service().run(transcode_image, img_info["path"], dest_path, role_settings)
+    else:
+        logger.debug(f"♻️ Imagen optimizada reutilizada: {dest_path}")
+    return _optimized_info(img_info, dest_path)
+
+
+def summarize_savings(images):
+    """
+    Resume el ahorro de bytes de un diccionario de imágenes optimizadas.
+
+    Returns:
+        dict: Número de imágenes, bytes antes, bytes después y bytes ahorrados
+    """
+    optimized = [info for infos in images.values() for info in infos if "original_bytes" in info]
+    before = sum(info["original_bytes"] for info in optimized)
+    after = sum(info["bytes"] for info in optimized)
+    return {"images": len(optimized), "bytes_before": before, "bytes_after": after, "bytes_saved": before - after}
+
+
+def log_savings(report):
+    """Registra en el log el ahorro obtenido por la optimización."""
+    if not report["images"]:
+        return
+    ratio = report["bytes_before"] / report["bytes_after"] if report["bytes_after"] else 0
+    logger.info(
+        f"🗜️ {report['images']} imágenes optimizadas: "
+        f"{report['bytes_before'] / (1024 * 1024):.1f} MB -> {report['bytes_after'] / (1024 * 1024):.1f} MB "
+        f"({ratio:.1f}x más pequeñas)"
+    )
+
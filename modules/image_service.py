@@ -0,0 +1,125 @@
+"""
+Servicio compartido de procesamiento de imágenes en varios procesos.
+
+Recodificar imágenes con Pillow consume CPU, así que el trabajo se reparte en
+un `ProcessPoolExecutor`. Cualquier consumidor de `images_info` (optimización
+para el EPUB, miniaturas, el PDF...) puede enviar tareas con `submit`. Con un
+solo trabajador, o si el pool no puede crearse, las tareas se ejecutan en el
+proceso actual.
+
+Las funciones enviadas deben poder serializarse con pickle (funciones de
+nivel de módulo con argumentos simples).
+"""
+
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from modules.config import IMAGE_PROCESS_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class ImageProcessingService:
+    """
+    Ejecuta tareas de imagen en un pool de procesos, con respaldo en serie.
+
+    Args:
+        workers (int, optional): Procesos del pool (por defecto, uno por núcleo);
+            con 1 o menos, todo se ejecuta en serie en el proceso actual
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers if workers is not None else (os.cpu_count() or 1)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.serial = self.workers <= 1
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None and not self.serial:
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                except (OSError, NotImplementedError) as e:
+                    logger.warning(f"⚠️ No se pudo crear el pool de procesos, se procesa en serie: {str(e)}")
+                    self.serial = True
+            return self._executor
+
+    @staticmethod
+    def _run_inline(fn, args, kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Envía una tarea al servicio.
+
+        Returns:
+            concurrent.futures.Future: Resultado de la tarea
+        """
+        executor = self._get_executor()
+        if executor is None:
+            return self._run_inline(fn, args, kwargs)
+        try:
+            return executor.submit(fn, *args, **kwargs)
+        except (BrokenProcessPool, RuntimeError) as e:
+            self._fall_back(executor, e)
+            return self._run_inline(fn, args, kwargs)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Ejecuta una tarea y espera su resultado.
+
+        Si un proceso del pool muere durante la tarea, se repite en el proceso
+        actual y el servicio pasa a trabajar en serie.
+        """
+        return self._result(self.submit(fn, *args, **kwargs), fn, args, kwargs)
+
+    def map(self, fn, *iterables):
+        """Aplica `fn` a cada elemento y devuelve los resultados en orden."""
+        tasks = [(self.submit(fn, *args), args) for args in zip(*iterables)]
+        return [self._result(future, fn, args, {}) for future, args in tasks]
+
+    def _result(self, future, fn, args, kwargs):
+        try:
+            return future.result()
+        except BrokenProcessPool as e:
+            self._fall_back(self._executor, e)
+            return fn(*args, **kwargs)
+
+    def _fall_back(self, executor, error):
+        """Descarta el pool roto y pasa a procesar en serie."""
+        with self._lock:
+            if self._executor is not executor or executor is None:
+                return  # Otro hilo ya lo descartó
+            logger.warning(f"⚠️ Pool de procesos no disponible, se procesa en serie: {str(error)}")
+            self.serial = True
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        """Cierra el pool de procesos si se llegó a crear."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_image_service():
+    """Devuelve el servicio de imágenes compartido por todo el proceso."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ImageProcessingService(IMAGE_PROCESS_WORKERS)
+            atexit.register(_service.shutdown)
+        return _service
@@ -0,0 +1,184 @@
+"""
+Análisis incremental de un objeto JSON que llega por trozos (respuestas con stream=True).
+
+`JsonStreamParser` recibe el texto a medida que lo envía el modelo y avisa en
+cuanto se cierra cada campo del objeto raíz y cada elemento de sus listas,
+sin esperar al final de la respuesta:
+
+    ("title",)        -> "El ciclo del agua"
+    ("chapters", 0)   -> {"title": "...", "summary": "..."}
+    ("chapters", 1)   -> {...}
+    ("chapters",)     -> [{...}, {...}]
+    ("introduction",) -> "..."
+
+Solo sigue la estructura (cadenas, escapes y anidamiento); cada valor cerrado
+se interpreta con json.loads, así que el resultado es idéntico al de analizar
+la respuesta completa. Por lo mismo sirve para recuperar lo aprovechable de
+una respuesta truncada (ver salvage_json).
+"""
+
+import json
+
+_WHITESPACE = " \t\r\n"
+
+
+class _Frame:
+    """Objeto o lista abierta durante el análisis."""
+
+    __slots__ = ("kind", "key", "index", "expect", "start")
+
+    def __init__(self, kind):
+        self.kind = kind  # "{" o "["
+        self.key = None  # Clave del valor en curso (objetos)
+        self.index = 0  # Posición del valor en curso (listas)
+        self.expect = "key" if kind == "{" else "value"
+        self.start = None  # Posición en el texto donde empezó el valor en curso
+
+
+class JsonStreamParser:
+    """
+    Analizador incremental que emite los campos del objeto raíz y los elementos de sus listas.
+
+    Args:
+        on_element (callable): Se llama con (ruta, valor) al cerrarse cada
+            campo del objeto raíz, ruta (clave,), y cada elemento de una lista
+            del objeto raíz, ruta (clave, índice)
+    """
+
+    def __init__(self, on_element):
+        self.on_element = on_element
+        self._chunks = []
+        self._length = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._is_key = False
+        self._scalar = False
+
+    @property
+    def text(self):
+        """Texto recibido hasta ahora."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk):
+        """Procesa un trozo de texto y emite los valores que se cierren en él."""
+        offset = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        for i, char in enumerate(chunk):
+            self._consume(char, offset + i)
+
+    def close(self):
+        """
+        Termina el análisis y devuelve el objeto completo.
+
+        Raises:
+            json.JSONDecodeError: Si el texto recibido no es un JSON válido (p. ej. truncado)
+        """
+        if self._scalar:
+            self._end_value(self._length)
+        return json.loads(self.text)
+
+    def _consume(self, char, pos):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if self._is_key:
+                    frame = self._stack[-1]
+                    frame.key = json.loads(self._slice(self._string_start, pos + 1))
+                    frame.expect = "colon"
+                else:
+                    self._end_value(pos + 1)
+            return
+
+        if self._scalar and (char in _WHITESPACE or char in ",]}"):
+            self._end_value(pos)
+        if char in _WHITESPACE:
+            return
+
+        frame = self._stack[-1] if self._stack else None
+        if char in "{[":
+            self._start_value(pos)
+            self._stack.append(_Frame(char))
+        elif char in "}]":
+            self._stack.pop()
+            self._end_value(pos + 1)
+        elif char == '"':
+            self._in_string = True
+            self._string_start = pos
+            self._is_key = frame is not None and frame.kind == "{" and frame.expect == "key"
+            if not self._is_key:
+                self._start_value(pos)
+        elif char == ":":
+            frame.expect = "value"
+        elif char == ",":
+            if frame.kind == "{":
+                frame.expect = "key"
+            else:
+                frame.index += 1
+        elif not self._scalar:
+            # Número, true, false o null
+            self._start_value(pos)
+            self._scalar = True
+
+    def _start_value(self, pos):
+        if self._stack:
+            self._stack[-1].start = pos
+
+    def _end_value(self, end):
+        self._scalar = False
+        depth = len(self._stack)
+        if depth == 0 or self._stack[0].kind != "{":
+            return
+        if depth == 1:
+            frame = self._stack[0]
+            path = (frame.key,)
+        elif depth == 2 and self._stack[1].kind == "[":
+            frame = self._stack[1]
+            path = (self._stack[0].key, frame.index)
+        else:
+            return
+        self.on_element(path, json.loads(self._slice(frame.start, end)))
+
+    def _slice(self, start, end):
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0][start:end]
+
+
+def salvage_json(text):
+    """
+    Recupera de un objeto JSON truncado los campos completos y los elementos completos.
+
+    Un campo cortado a medias se descarta; de una lista cortada a medias se
+    conservan los elementos que llegaron a cerrarse. Si el texto deja de ser
+    JSON válido en algún punto, se devuelve lo recuperado hasta ahí.
+
+    Args:
+        text (str): Texto recibido, p. ej. una respuesta cortada por max_tokens
+
+    Returns:
+        tuple: (diccionario con lo recuperado, conjunto de claves de las listas
+            que quedaron sin cerrar)
+    """
+    fields, items = {}, {}
+
+    def collect(path, value):
+        if len(path) == 1:
+            fields[path[0]] = value
+        else:
+            items.setdefault(path[0], []).append(value)
+
+    try:
+        JsonStreamParser(collect).feed(text)
+    except (ValueError, AttributeError, IndexError):
+        pass  # Texto que no es JSON a partir de algún punto: se conserva lo anterior
+    open_lists = {key for key in items if key not in fields}
+    for key in open_lists:
+        fields[key] = items[key]
+    return fields, open_lists
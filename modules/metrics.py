@@ -0,0 +1,200 @@
+"""
+Instrumentación de una generación: tiempos por etapa, tokens, bytes y reintentos.
+
+Cada generación crea un `RunMetrics` que recorre el pipeline junto al
+contenido. Las etapas registran su duración con `timer()`, las llamadas al
+modelo de texto suman los tokens de `response.usage`, las descargas cuentan
+los bytes recibidos y los reintentos se acumulan como contadores. Al terminar
+se escribe un informe JSON (run_report.json junto a book_content.json) y,
+opcionalmente, un archivo de texto en formato Prometheus para el "textfile
+collector" de node_exporter. Como ese archivo refleja siempre la última
+ejecución, los percentiles entre ejecuciones se obtienen en Prometheus, p. ej.:
+
+    quantile_over_time(0.95, tei_book_duration_seconds[7d])
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Límites (segundos) del histograma de duraciones por llamada en Prometheus
+PROMETHEUS_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _percentile(values, q):
+    """Percentil por rango más cercano de una lista ya ordenada."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(q * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class RunMetrics:
+    """
+    Acumula las métricas de una generación; es seguro entre hilos.
+
+    Args:
+        clock (callable): Reloj monótono (se puede sustituir en pruebas)
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.started = clock()
+        self.started_at = datetime.now(timezone.utc)
+        self.info = {}
+        self._durations = {}
+        self._tokens = {}
+        self._bytes = {"in": 0, "out": 0}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage):
+        """Mide la duración del bloque y la suma a `stage`, también si falla."""
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(stage, self.clock() - started)
+
+    def observe(self, stage, seconds):
+        """Registra una duración de `stage` medida externamente."""
+        with self._lock:
+            self._durations.setdefault(stage, []).append(seconds)
+
+    def add_usage(self, model, usage):
+        """Suma los tokens de `response.usage` (u objeto equivalente) del modelo."""
+        if usage is None:
+            return
+        with self._lock:
+            totals = self._tokens.setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
+            for field in totals:
+                totals[field] += getattr(usage, field, None) or 0
+
+    def add_bytes(self, direction, count):
+        """Suma bytes recibidos ("in") o escritos ("out")."""
+        with self._lock:
+            self._bytes[direction] = self._bytes.get(direction, 0) + count
+
+    def incr(self, name, count=1):
+        """Incrementa un contador (reintentos, aciertos de caché, errores...)."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + count
+
+    def set_info(self, **fields):
+        """Añade datos descriptivos al informe (título, estado, rutas...)."""
+        with self._lock:
+            self.info.update(fields)
+
+    def to_dict(self):
+        """
+        Devuelve el informe de la ejecución.
+
+        Returns:
+            dict: Datos descriptivos, duración total y, por etapa, número de
+                llamadas, segundos acumulados, p50, p95 y máximo
+        """
+        with self._lock:
+            stages = {}
+            for stage, durations in self._durations.items():
+                ordered = sorted(durations)
+                stages[stage] = {
+                    "calls": len(ordered),
+                    "seconds": round(sum(ordered), 4),
+                    "p50": round(_percentile(ordered, 0.5), 4),
+                    "p95": round(_percentile(ordered, 0.95), 4),
+                    "max": round(ordered[-1], 4),
+                }
+            return {
+                **self.info,
+                "started_at": self.started_at.isoformat(timespec="seconds"),
+                "duration_seconds": round(self.clock() - self.started, 4),
+                "stages": stages,
+                "tokens": {model: dict(totals) for model, totals in self._tokens.items()},
+                "bytes": dict(self._bytes),
+                "counters": dict(self._counters),
+            }
+
+    def write_report(self, path):
+        """Escribe el informe JSON de forma atómica y devuelve su ruta."""
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"📊 Informe de la ejecución guardado en: {path}")
+        return path
+
+    def prometheus_text(self, prefix="tei"):
+        """Devuelve las métricas en el formato de exposición de texto de Prometheus."""
+        report = self.to_dict()
+        with self._lock:
+            durations = {stage: list(values) for stage, values in self._durations.items()}
+        status = _escape_label(report.get("status", "unknown"))
+        lines = [
+            f"# HELP {prefix}_book_duration_seconds Duración total de la última generación.",
+            f"# TYPE {prefix}_book_duration_seconds gauge",
+            f'{prefix}_book_duration_seconds{{status="{status}"}} {report["duration_seconds"]}',
+            f"# HELP {prefix}_book_last_run_timestamp_seconds Fin de la última generación.",
+            f"# TYPE {prefix}_book_last_run_timestamp_seconds gauge",
+            f"{prefix}_book_last_run_timestamp_seconds {time.time():.0f}",
+            f"# HELP {prefix}_stage_seconds Duración de cada llamada por etapa en la última generación.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        for stage, values in sorted(durations.items()):
+            label = _escape_label(stage)
+            for bucket in PROMETHEUS_BUCKETS:
+                count = sum(1 for v in values if v <= bucket)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{label}",le="{bucket}"}} {count}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{label}",le="+Inf"}} {len(values)}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{label}"}} {sum(values):.4f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{label}"}} {len(values)}')
+
+        lines += [
+            f"# HELP {prefix}_tokens Tokens consumidos por modelo en la última generación.",
+            f"# TYPE {prefix}_tokens gauge",
+        ]
+        for model, totals in sorted(report["tokens"].items()):
+            for field in ("prompt_tokens", "completion_tokens"):
+                kind = field.split("_")[0]
+                lines.append(f'{prefix}_tokens{{model="{_escape_label(model)}",kind="{kind}"}} {totals[field]}')
+
+        lines += [
+            f"# HELP {prefix}_bytes Bytes recibidos (in) y escritos (out) en la última generación.",
+            f"# TYPE {prefix}_bytes gauge",
+        ]
+        for direction, count in sorted(report["bytes"].items()):
+            lines.append(f'{prefix}_bytes{{direction="{_escape_label(direction)}"}} {count}')
+
+        lines += [
+            f"# HELP {prefix}_events Reintentos, aciertos de caché y errores en la última generación.",
+            f"# TYPE {prefix}_events gauge",
+        ]
+        for name, count in sorted(report["counters"].items()):
+            lines.append(f'{prefix}_events{{name="{_escape_label(name)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """
+        Escribe el archivo para el textfile collector de node_exporter.
+
+        Se escribe en un temporal y se renombra, como exige el collector para
+        no leer nunca un archivo a medias.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+        logger.info(f"📈 Métricas Prometheus guardadas en: {path}")
+        return path
@@ -0,0 +1,328 @@
+"""
+Llamadas a la API de OpenAI con limitación adaptativa y reintentos.
+
+Cada llamada pasa por el limitador compartido del modelo, se hace con
+`with_raw_response` para leer las cabeceras de cuota y, ante un 429, un 5xx o
+un error de conexión, se reintenta con espera exponencial con "jitter"
+respetando `retry-after`. Los clientes se crean con `max_retries=0` para que
+los reintentos solo ocurran aquí y queden registrados en las métricas. Los
+tiempos de espera y el número de reintentos dependen del tipo de llamada
+(API_ENDPOINTS), y el cortacircuitos de api_client hace fallar al instante
+las llamadas mientras el servicio está caído.
+
+Con `configure_hedging(True)` (opción --hedge) cada intento que tarda más que
+el percentil HEDGE_PERCENTILE de las latencias recientes se duplica: gana la
+primera respuesta correcta y la copia perdedora se aborta cortando solo su
+conexión del pool compartido. La fracción de llamadas duplicadas está
+limitada por HEDGE_MAX_FRACTION para no multiplicar el coste ni el consumo de
+cuota.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import nullcontext
+from modules.config import (
+    API_BACKOFF_BASE, API_BACKOFF_MAX, HEDGE_ENABLED, HEDGE_PERCENTILE,
+    HEDGE_MAX_FRACTION, HEDGE_MIN_SAMPLES, HEDGE_WINDOW, HEDGE_MAX_WORKERS, API_ENDPOINTS
+)
+from modules.api_client import CircuitOpenError, abort_on_cancel, endpoint_timeout, get_circuit_breaker
+from modules.progress import CancellationToken
+from modules.rate_limiter import parse_retry_after, sleep
+
+logger = logging.getLogger(__name__)
+
+# Códigos HTTP que justifican reintentar la llamada
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _timer(metrics, stage):
+    return metrics.timer(stage) if metrics else nullcontext()
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Espera antes del reintento `attempt` (0, 1, 2...): exponencial con jitter completo.
+
+    Si el servidor indicó `retry-after`, nunca se espera menos que eso.
+    """
+    delay = random.uniform(0, min(API_BACKOFF_MAX, API_BACKOFF_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _retry_info(error):
+    """
+    Clasifica un error de la API.
+
+    Returns:
+        tuple: (reintentable, código HTTP o None, cabeceras o None)
+    """
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS, error.status_code, error.response.headers
+    if isinstance(error, openai.APIConnectionError):  # Incluye APITimeoutError
+        return True, None, None
+    return False, None, None
+
+
+class HedgePolicy:
+    """
+    Decide cuándo duplicar una llamada a partir de las latencias recientes.
+
+    Args:
+        percentile (float): Percentil (0-1) de la latencia a partir del cual se duplica
+        max_fraction (float): Fracción máxima de llamadas duplicadas en la ventana
+        min_samples (int): Latencias necesarias antes de duplicar nada
+        window (int): Llamadas recientes que se tienen en cuenta
+    """
+
+    def __init__(self, percentile=HEDGE_PERCENTILE, max_fraction=HEDGE_MAX_FRACTION,
+                 min_samples=HEDGE_MIN_SAMPLES, window=HEDGE_WINDOW):
+        self.percentile = percentile
+        self.max_fraction = max_fraction
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._hedged = deque(maxlen=window)  # Un booleano por llamada terminada
+        self._in_flight = 0  # Duplicados lanzados cuya llamada aún no ha terminado
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Registra la latencia de un intento correcto."""
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def delay(self):
+        """Segundos tras los que se duplica un intento, o None si aún no hay datos suficientes."""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(self.percentile * len(ordered)))]
+
+    def try_hedge(self):
+        """Reserva un duplicado si no se supera la fracción máxima; devuelve si se concedió."""
+        with self._lock:
+            hedged = sum(self._hedged) + self._in_flight + 1
+            if hedged > self.max_fraction * (len(self._hedged) + 1):
+                return False
+            self._in_flight += 1
+            return True
+
+    def record(self, hedged):
+        """Registra el final de una llamada y si se duplicó."""
+        with self._lock:
+            if hedged:
+                self._in_flight -= 1
+            self._hedged.append(hedged)
+
+
+_hedge_lock = threading.Lock()
+_hedge_enabled = HEDGE_ENABLED
+_hedge_options = {}
+_hedge_policies = {}
+_hedge_executor = None
+
+
+def configure_hedging(enabled=True, **options):
+    """
+    Activa o desactiva las llamadas duplicadas en todo el proceso.
+
+    Args:
+        enabled (bool): Si es False, cada intento espera solo a su respuesta
+        **options: Parámetros de HedgePolicy (percentile, max_fraction...)
+    """
+    global _hedge_enabled, _hedge_options
+    with _hedge_lock:
+        _hedge_enabled = enabled
+        _hedge_options = options
+        _hedge_policies.clear()
+
+
+def get_hedge_policy(name):
+    """Devuelve la política compartida de las llamadas `name`, o None si no se duplican."""
+    global _hedge_executor
+    with _hedge_lock:
+        if not _hedge_enabled:
+            return None
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+        if name not in _hedge_policies:
+            _hedge_policies[name] = HedgePolicy(**_hedge_options)
+        return _hedge_policies[name]
+
+
+def _endpoint(client, endpoint):
+    """Resuelve "chat.completions.create" en `client` a través de `with_raw_response`."""
+    *path, method = endpoint.split(".")
+    resource = client
+    for attr in path:
+        resource = getattr(resource, attr)
+    return getattr(resource.with_raw_response, method)
+
+
+def _attempt(client, endpoint, request, limiter, name, cost, cancel_token, metrics, policy):
+    """Un intento: espera al limitador, llama a la API y actualiza el limitador con las cabeceras."""
+    with _timer(metrics, f"{name}_rate_wait"):
+        limiter.reserve(cost, cancel_token)
+    try:
+        started = time.perf_counter()
+        with _timer(metrics, f"{name}_request"), abort_on_cancel(cancel_token):
+            raw = _endpoint(client, endpoint)(**request)
+    finally:
+        limiter.release()
+    if policy:
+        policy.observe(time.perf_counter() - started)
+    limiter.update_from_headers(raw.headers)
+    limiter.on_success()
+    return raw.parse()
+
+
+def _hedged_attempt(client, endpoint, request, limiter, name, cost, cancel_token, metrics, policy):
+    """
+    Un intento que se duplica si no responde antes del percentil de latencia de `policy`.
+
+    El original y el duplicado usan el cliente compartido desde hilos aparte,
+    cada uno con su propio token: al llegar la primera respuesta correcta se
+    cancela el token de la otra copia, lo que corta solo su conexión (ver
+    abort_on_cancel) y libera su hueco del limitador. Si la primera en
+    terminar falla, se espera a la otra.
+    """
+    delay = policy.delay()
+    if delay is None:
+        result = _attempt(client, endpoint, request, limiter, name, cost, cancel_token, metrics, policy)
+        policy.record(False)
+        return result
+
+    copies = {}  # Futuro -> token de cada copia
+
+    def launch(copy_policy):
+        token = CancellationToken()
+        future = _hedge_executor.submit(_attempt, client, endpoint, request, limiter, name, cost, token,
+                                        metrics, copy_policy)
+        copies[future] = token
+        return future
+
+    def cancel_copies():
+        for token in list(copies.values()):
+            token.cancel()
+
+    winner = None
+    hedged = False
+    try:
+        primary = launch(policy)
+        if cancel_token:
+            cancel_token.on_cancel(cancel_copies)
+        done, _ = wait([primary], timeout=delay)
+        if done or not policy.try_hedge():
+            winner = primary
+            return primary.result()
+
+        hedged = True
+        if cancel_token:
+            cancel_token.check()
+        hedge = launch(None)
+        if metrics:
+            metrics.incr(f"{name}_hedged")
+        logger.debug(f"Llamada {name} sin respuesta tras {delay:.2f} s, se lanza un duplicado")
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    winner = future
+                    if future is hedge and metrics:
+                        metrics.incr(f"{name}_hedge_wins")
+                    return future.result()
+                error = error or future.exception()
+        raise error
+    finally:
+        if cancel_token:
+            cancel_token.remove_callback(cancel_copies)
+        # Abortar la copia perdedora (o ambas si se canceló o fallaron)
+        for future, token in copies.items():
+            if future is not winner:
+                token.cancel()
+        policy.record(hedged)
+
+
+def call_api(client, endpoint, request, limiter, name, cost=0, cancel_token=None, metrics=None,
+             retries=None):
+    """
+    Ejecuta `client.<endpoint>(**request)` bajo el limitador, con reintentos.
+
+    Si las llamadas duplicadas están activas (ver configure_hedging), cada
+    intento lento se duplica según la política compartida de `name`.
+
+    Args:
+        client (openai.OpenAI): Cliente de la API
+        endpoint (str): Ruta del método, p. ej. "chat.completions.create" o "images.generate"
+        request (dict): Parámetros de la solicitud
+        limiter (AdaptiveRateLimiter): Limitador compartido del modelo
+        name (str): Nombre de la llamada en las métricas ("chat", "image")
+        cost (int): Tokens estimados de la solicitud
+        cancel_token (CancellationToken, optional): Interrumpe esperas y reintentos
+        metrics (RunMetrics, optional): Métricas de la ejecución
+        retries (int, optional): Reintentos ante errores transitorios (por
+            defecto los de `name` en API_ENDPOINTS)
+
+    Returns:
+        object: Respuesta ya interpretada (igual que llamar al método directamente)
+
+    Raises:
+        openai.APIError: Si el error no es transitorio o se agotan los reintentos
+        CircuitOpenError: Si el circuito de `name` está abierto
+        GenerationCancelled: Si se canceló la generación
+    """
+    if retries is None:
+        retries = API_ENDPOINTS[name]["retries"]
+    request = dict(request, timeout=endpoint_timeout(name))
+    breaker = get_circuit_breaker(name)
+    # Una respuesta por streaming se lee después de volver: no se puede duplicar
+    policy = None if request.get("stream") else get_hedge_policy(name)
+    attempt_fn = _hedged_attempt if policy else _attempt
+    for attempt in range(retries + 1):
+        if cancel_token:
+            cancel_token.check()
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            if metrics:
+                metrics.incr(f"{name}_circuit_open")
+            raise
+        try:
+            response = attempt_fn(client, endpoint, request, limiter, name, cost, cancel_token, metrics, policy)
+            breaker.record_success()
+            return response
+
+        except Exception as e:
+            retryable, status, headers = _retry_info(e)
+            if cancel_token and cancel_token.is_set():
+                breaker.abandon()
+                cancel_token.check()
+            if retryable and (status is None or status >= 500):
+                breaker.record_failure()
+            elif status is not None:
+                breaker.record_success()  # El servicio responde, aunque rechace la solicitud
+            else:
+                breaker.abandon()
+            if headers is not None:
+                limiter.update_from_headers(headers)
+            retry_after = parse_retry_after(headers)
+            if status == 429:
+                limiter.on_throttle(retry_after)
+                if metrics:
+                    metrics.incr(f"{name}_throttled")
+            if not retryable or attempt >= retries:
+                raise
+            delay = backoff_delay(attempt, retry_after)
+            if metrics:
+                metrics.incr(f"{name}_retries")
+            logger.warning(f"⚠️ Llamada {name} fallida ({status or type(e).__name__}), "
+                           f"reintento {attempt + 1}/{retries} en {delay:.1f} s")
+            sleep(delay, cancel_token)
@@ -5,12 +5,14 @@ from modules.user_prompt import USER_PROMPT_TEMPLATE
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def parse_user_prompt(raw_prompt: str) -> dict:
+def parse_user_prompt(raw_prompt: str, required_fields=None) -> dict:
     """
     Parsea el prompt del usuario en formato JSON y valida los campos requeridos.
     
     Args:
         raw_prompt (str): Prompt del usuario en formato JSON
+        required_fields (list, optional): Campos obligatorios de tipo texto
+            (por defecto 'title', 'audience' y 'age_range')
     
     Returns:
         dict: Diccionario con los parámetros del libro
@@ -18,20 +20,20 @@ def parse_user_prompt(raw_prompt: str) -> dict:
     try:
         # Intentar parsear el JSON
         data = json.loads(raw_prompt)
+        if not isinstance(data, dict):
+            raise TypeError("❌ El prompt debe ser un objeto JSON.")
 
         # Campos requeridos (eliminamos 'pages')
-        required_fields = ['title', 'audience', 'age_range']
+        if required_fields is None:
+            required_fields = ['title', 'audience', 'age_range']
         for field in required_fields:
             if field not in data:
                 raise ValueError(f"❌ El campo obligatorio '{field}' no está presente.")
 
         # Validaciones de tipo
-        if not isinstance(data['title'], str):
-            raise TypeError("❌ El campo 'title' debe ser una cadena de texto.")
-        if not isinstance(data['audience'], str):
-            raise TypeError("❌ El campo 'audience' debe ser una cadena de texto.")
-        if not isinstance(data['age_range'], str):
-            raise TypeError("❌ El campo 'age_range' debe ser una cadena de texto.")
+        for field in required_fields:
+            if not isinstance(data[field], str):
+                raise TypeError(f"❌ El campo '{field}' debe ser una cadena de texto.")
 
         # Eliminamos la validación del número de páginas
 
@@ -1,25 +1,95 @@
 import os
 import logging
+from xml.sax.saxutils import escape
+from reportlab import rl_config
 from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.platypus import Paragraph
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER, TA_JUSTIFY
-from config import (
+from reportlab.lib.utils import ImageReader
+from reportlab.platypus import (
+    BaseDocTemplate, PageTemplate, NextPageTemplate, Frame, Paragraph, Spacer, PageBreak,
+    KeepTogether, Image as PDFImage
+)
+from reportlab.platypus.tableofcontents import TableOfContents
+from modules.config import (
     PDF_MARGIN, FONT_SIZE_TITLE, FONT_SIZE_HEADING,
-    FONT_SIZE_SUBHEADING, FONT_SIZE_BODY
+    FONT_SIZE_SUBHEADING, FONT_SIZE_BODY, PDF_IMAGE_MAX_HEIGHT
 )
+from modules.book_model import build_book, Paragraph as ModelParagraph, Heading, Image, Exercise
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Write binary streams: ASCII85 makes every image 25% larger and, without
+# the C accelerator, dominates the build time
+rl_config.useA85 = 0
+
+# Sections that only make sense in the EPUB (the PDF has its own title page and TOC)
+EPUB_ONLY_SECTIONS = ("cover", "toc")
+
+
+class CachedParagraph(Paragraph):
+    """
+    Paragraph that keeps its line breaking for a given width.
+
+    multiBuild lays the whole story out once per pass and the frame wraps
+    each paragraph more than once per page; the markup is parsed once in
+    __init__ and the line breaks are only recomputed when the width changes.
+    """
+
+    def wrap(self, availWidth, availHeight):
+        layout = getattr(self, "_layout", None)
+        if layout is not None and layout[0] == availWidth:
+            _, self.blPara, self.height = layout
+            self.width = availWidth
+            return self.width, self.height
+        width, height = super().wrap(availWidth, availHeight)
+        self._layout = (availWidth, self.blPara, height)
+        return width, height
+
+
+class SectionHeading(CachedParagraph):
+    """Heading that registers a table of contents entry when it is laid out."""
+
+    def __init__(self, text, style, toc_level=0):
+        super().__init__(text, style)
+        self.toc_level = toc_level
+
+
+class BookDocTemplate(BaseDocTemplate):
+    """Single-frame A4 document with page numbers and TOC notifications."""
+
+    def __init__(self, filename, **kwargs):
+        super().__init__(
+            filename, pagesize=A4,
+            leftMargin=PDF_MARGIN, rightMargin=PDF_MARGIN,
+            topMargin=PDF_MARGIN, bottomMargin=PDF_MARGIN,
+            pageCompression=1, **kwargs
+        )
+        frame = Frame(self.leftMargin, self.bottomMargin, self.width, self.height, id="body")
+        self.addPageTemplates([
+            PageTemplate(id="title", frames=[frame]),
+            PageTemplate(id="body", frames=[frame], onPage=self._draw_page_number),
+        ])
+
+    def _draw_page_number(self, canv, doc):
+        canv.saveState()
+        canv.setFont("Helvetica", 9)
+        canv.drawCentredString(doc.pagesize[0] / 2, PDF_MARGIN / 2, str(doc.page))
+        canv.restoreState()
+
+    def afterFlowable(self, flowable):
+        # Register headings in the TOC with a bookmark so entries are links
+        if isinstance(flowable, SectionHeading):
+            key = f"section-{self.seq.nextf('section')}"
+            self.canv.bookmarkPage(key)
+            self.notify("TOCEntry", (flowable.toc_level, flowable.getPlainText(), self.page, key))
+
+
 class PDFCreator:
     def __init__(self, output_path):
         self.output_path = output_path
-        self.c = canvas.Canvas(output_path, pagesize=A4)
         self.width, self.height = A4
-        self.page_number = 1
-        self.y_position = self.height - PDF_MARGIN
+        self.frame_width = self.width - 2 * PDF_MARGIN
         self.styles = getSampleStyleSheet()
 
         # Define custom styles
@@ -27,6 +97,7 @@ class PDFCreator:
             name='CustomTitle',
             parent=self.styles['Title'],
             fontSize=FONT_SIZE_TITLE,
+            leading=FONT_SIZE_TITLE * 1.2,
             alignment=TA_CENTER,
             spaceAfter=30
         )
@@ -34,151 +105,103 @@ class PDFCreator:
             name='CustomHeading1',
             parent=self.styles['Heading1'],
             fontSize=FONT_SIZE_HEADING,
+            leading=FONT_SIZE_HEADING * 1.2,
             spaceAfter=20
         )
         self.custom_heading2 = ParagraphStyle(
             name='CustomHeading2',
             parent=self.styles['Heading2'],
             fontSize=FONT_SIZE_SUBHEADING,
+            leading=FONT_SIZE_SUBHEADING * 1.2,
             spaceAfter=15
         )
         self.custom_body = ParagraphStyle(
             name='CustomBody',
             parent=self.styles['Normal'],
             fontSize=FONT_SIZE_BODY,
+            leading=FONT_SIZE_BODY * 1.4,
             alignment=TA_JUSTIFY,
             spaceAfter=12
         )
-
-    def add_title_page(self, title, subtitle=None, cover_image_path=None):
-        # Draw title
-        p = Paragraph(title, self.custom_title)
-        w, h = p.wrap(self.width - 2*PDF_MARGIN, self.height)
-        p.drawOn(self.c, PDF_MARGIN, self.height - PDF_MARGIN - h)
-
-        # Draw subtitle
-        if subtitle:
-            sub = Paragraph(subtitle, self.custom_heading2)
-            w2, h2 = sub.wrap(self.width - 2*PDF_MARGIN, self.height)
-            sub.drawOn(self.c, PDF_MARGIN, self.height - PDF_MARGIN - h - h2)
-
-        # Draw cover image
-        if cover_image_path and os.path.exists(cover_image_path):
-            img_width = self.width / 2
-            img_height = img_width * 0.75
-            x = (self.width - img_width) / 2
-            y = self.height/2 - img_height/2
-            self.c.drawImage(cover_image_path, x, y, img_width, img_height)
-
-        self.c.showPage()
-        self.y_position = self.height - PDF_MARGIN
-        self.page_number += 1
-
-    def add_paragraph(self, text, style):
-        # Create and draw paragraph, handle page breaks
-        paragraph = Paragraph(text, style)
-        w, h = paragraph.wrap(self.width - 2*PDF_MARGIN, self.y_position)
-        if self.y_position - h < PDF_MARGIN:
-            self.c.showPage()
-            self.y_position = self.height - PDF_MARGIN
-            self.page_number += 1
-            paragraph = Paragraph(text, style)
-            w, h = paragraph.wrap(self.width - 2*PDF_MARGIN, self.y_position)
-        paragraph.drawOn(self.c, PDF_MARGIN, self.y_position - h)
-        self.y_position -= (h + 10)
-
-    def add_heading1(self, text):
-        self.add_paragraph(text, self.custom_heading1)
-
-    def add_heading2(self, text):
-        self.add_paragraph(text, self.custom_heading2)
-
-    def add_image(self, image_path, width=200, height=200):
-        # Center the image
-        if not os.path.exists(image_path):
-            return
-        if self.y_position - height < PDF_MARGIN:
-            self.c.showPage()
-            self.y_position = self.height - PDF_MARGIN
-            self.page_number += 1
-        x = (self.width - width) / 2
-        y = self.y_position - height
-        self.c.drawImage(image_path, x, y, width, height)
-        self.y_position = y - 20
-
-    def assemble_pdf(self, book_content, images, output_pdf):
-        logger.info("Iniciando ensamblado del PDF...")
-
-        # Title page with optional cover image
-        cover = next((i for i in images if i.get('type') == 'cover'), None)
-        self.add_title_page(
-            book_content.get('title', 'Sin título'),
-            subtitle='Generado por TEI',
-            cover_image_path=cover['path'] if cover else None
+        self.toc_style = ParagraphStyle(
+            name='TOCEntry',
+            parent=self.custom_body,
+            alignment=0,
+            spaceAfter=4
         )
 
-        # Introduction - AQUÍ ESTÁ LA CORRECCIÓN
-        intro = book_content.get('introduction', '')
-        if intro:
-            self.add_heading1('Introducción')
-            if isinstance(intro, dict):
-                self.add_paragraph(intro.get('content', ''), self.custom_body)
-            else:
-                self.add_paragraph(intro, self.custom_body)
-
-        # Chapters
-        chapter_imgs = [i['path'] for i in images if i.get('type') == 'chapter']
-        for idx, chap in enumerate(book_content.get('chapters', [])):
-            self.add_heading1(chap.get('title', ''))
-            # Chapter summary/content
-            content = chap.get('content', '')
-            if content:
-                self.add_paragraph(content, self.custom_body)
-            # Sections
-            for sec in chap.get('sections', []):
-                self.add_heading2(sec.get('title', ''))
-                self.add_paragraph(sec.get('content', ''), self.custom_body)
-            # Chapter image
-            if idx < len(chapter_imgs):
-                self.add_image(chapter_imgs[idx])
-
-        # Exercises
-        exercises_img = next((i for i in images if i.get('type') == 'exercises'), None)
-        exercises = book_content.get('exercises', [])
-        if exercises:
-            self.add_heading1('Ejercicios de Repaso')
-            # If exercises is a list of strings
-            if isinstance(exercises, list):
-                for ex in exercises:
-                    self.add_paragraph(ex, self.custom_body)
-            # Single string
-            else:
-                self.add_paragraph(exercises, self.custom_body)
-            if exercises_img:
-                self.add_image(exercises_img['path'])
-
-        # Conclusion
-        concl_img = next((i for i in images if i.get('type') == 'conclusion'), None)
-        concl = book_content.get('conclusion', '')
-        if concl:
-            self.add_heading1('Conclusión')
-            self.add_paragraph(concl, self.custom_body)
-            if concl_img:
-                self.add_image(concl_img['path'])
-
-        # Bibliography
-        biblio = book_content.get('bibliography', [])
-        if biblio:
-            self.add_heading1('Bibliografía')
-            if isinstance(biblio, list):
-                biblio_text = "\n".join([f"• {ref}" for ref in biblio])
-                self.add_paragraph(biblio_text, self.custom_body)
-            else:
-                self.add_paragraph(biblio, self.custom_body)
-
-        # Save
-        self.c.save()
-        logger.info(f"PDF guardado exitosamente en: {output_pdf}")
+    def image_flowable(self, image_path, max_height=PDF_IMAGE_MAX_HEIGHT):
+        # Scale the image to fit the frame, keeping its aspect ratio
+        if not os.path.exists(image_path):
+            return None
+        img_width, img_height = ImageReader(image_path).getSize()
+        scale = min(self.frame_width / img_width, max_height / img_height, 1.0)
+        flowable = PDFImage(image_path, img_width * scale, img_height * scale)
+        flowable.hAlign = 'CENTER'
+        return flowable
+
+    def block_flowables(self, block):
+        # One flowable (or a small group) per block of the book model
+        if isinstance(block, ModelParagraph):
+            return [CachedParagraph(escape(block.text), self.custom_body)]
+        if isinstance(block, Heading):
+            return [CachedParagraph(escape(block.text), self.custom_heading2)]
+        if isinstance(block, Exercise):
+            title = f"Ejercicio {block.number}: {block.title}" if block.title else f"Ejercicio {block.number}"
+            return [KeepTogether([
+                CachedParagraph(escape(title), self.custom_heading2),
+                CachedParagraph(escape(block.description), self.custom_body),
+            ])]
+        if isinstance(block, Image):
+            flowable = self.image_flowable(block.path)
+            return [flowable, Spacer(1, 12)] if flowable else []
+        return []
+
+    def title_page(self, book):
+        story = [
+            Spacer(1, self.height / 6),
+            CachedParagraph(escape(book.title), self.custom_title),
+            CachedParagraph('Generado por TEI', self.custom_heading2),
+        ]
+        if book.description:
+            story.append(CachedParagraph(escape(book.description), self.custom_body))
+        if book.cover_image:
+            cover = self.image_flowable(book.cover_image.path, max_height=self.height / 2)
+            if cover:
+                story += [Spacer(1, 20), cover]
+        return story
+
+    def build_story(self, book):
+        """Turn the book model into the flowables of the document."""
+        story = self.title_page(book)
+
+        # Table of contents, pre-filled with the titles so it already has its
+        # final height on the first pass and multiBuild settles in two passes
+        sections = [s for s in book.sections if s.kind not in EPUB_ONLY_SECTIONS and s.blocks]
+        toc = TableOfContents(levelStyles=[self.toc_style], dotsMinLevel=0)
+        toc.addEntries([(0, escape(s.heading), 0, None) for s in sections])
+        story += [
+            NextPageTemplate("body"),
+            PageBreak(),
+            CachedParagraph('Índice', self.custom_heading1),
+            toc,
+        ]
+
+        # Sections in reading order, each one starting on a new page
+        for section in sections:
+            story.append(PageBreak())
+            story.append(SectionHeading(escape(section.heading), self.custom_heading1))
+            for block in section.blocks:
+                story.extend(self.block_flowables(block))
+        return story
+
+    def assemble_pdf(self, book, output_pdf):
+        logger.info("📄 Iniciando ensamblado del PDF...")
+
+        doc = BookDocTemplate(output_pdf, title=book.title, creator='TEI')
+        passes = doc.multiBuild(self.build_story(book))
+
+        logger.info(f"📕 PDF guardado en: {output_pdf} ({doc.page} páginas, {passes} pasadas)")
         return output_pdf
 
 
@@ -186,14 +209,19 @@ class PDFCreator:
 def assemble_pdf(book_content, images, output_pdf):
     """
     Crea y ensambla un PDF con el contenido del libro y las imágenes proporcionadas.
-    
+
+    Cada párrafo es un flowable independiente, de modo que los capítulos
+    largos se reparten entre páginas, y el índice incluye los números de
+    página reales.
+
     Args:
         book_content (dict): Contenido estructurado del libro
-        images (list): Lista de diccionarios con información de imágenes
+        images (dict | list): Información de imágenes, por clave o como lista
+            de diccionarios {"type", "path"}
         output_pdf (str): Ruta donde se guardará el PDF generado
-        
+
     Returns:
         str: Ruta al archivo PDF generado
     """
     pdf = PDFCreator(output_pdf)
-    return pdf.assemble_pdf(book_content, images, output_pdf)
\ No newline at end of file
+    return pdf.assemble_pdf(build_book(book_content, images), output_pdf)
@@ -0,0 +1,278 @@
+"""
+Pipeline de generación por etapas conectadas con colas.
+
+Cada capítulo avanza por las etapas en cuanto está listo:
+
+    texto del capítulo -> prompt de imagen -> imagen -> XHTML
+
+de modo que la imagen del capítulo 1 se genera mientras se redacta el
+capítulo 10 y el tiempo total se acerca al de la etapa más lenta.
+"""
+
+import logging
+import os
+import queue
+import threading
+from modules.config import IMAGE_MAX_WORKERS
+from modules.content_builder import generate_book_content, generate_draft_content
+from modules.image_generator import build_cover_prompt, build_chapter_prompt, generate_images_dalle
+from modules.draft_images import generate_draft_image
+from modules.book_model import build_chapter_section
+from modules.xhtml_renderer import render_section_body
+from modules.image_optimizer import image_role, optimize_image_info, summarize_savings, log_savings
+from modules.progress import ProgressTracker, GenerationCancelled
+from modules.metrics import RunMetrics
+
+logger = logging.getLogger(__name__)
+
+# Marca de fin de cola
+_FIN = object()
+
+
+class BookPipeline:
+    """
+    Genera contenido, imágenes y XHTML de capítulos con etapas productor/consumidor.
+
+    Args:
+        book_params (dict): Parámetros del libro
+        images_dir (str): Directorio donde guardar las imágenes
+        image_workers (int, optional): Hilos de la etapa de imágenes
+        book_content (dict, optional): Contenido ya generado; se omite la etapa de texto
+        images (dict, optional): Imágenes ya generadas; no se vuelven a pedir
+        on_content (callable, optional): Se llama con el contenido completo del libro
+        on_image (callable, optional): Se llama con (clave, imágenes) al terminar cada imagen
+        optimize_images (bool): Redimensionar y recodificar cada imagen antes de
+            renderizar su capítulo (ver image_optimizer)
+        progress (ProgressTracker, optional): Recibe el avance de cada etapa y
+            permite cancelar la generación
+        metrics (RunMetrics, optional): Acumula tiempos, tokens y bytes de cada etapa
+        research (bool): Documentar los capítulos con búsquedas web (ver web_search)
+        draft (bool): Modo borrador: contenido de relleno e ilustraciones
+            dibujadas en local (ver draft_images), sin ninguna llamada a la API
+    """
+
+    def __init__(self, book_params, images_dir, image_workers=None, book_content=None,
+                 images=None, on_content=None, on_image=None, optimize_images=False, progress=None,
+                 metrics=None, research=False, draft=False):
+        self.book_params = book_params
+        self.images_dir = images_dir
+        self.image_workers = max(1, image_workers or IMAGE_MAX_WORKERS)
+        self.book_content = book_content
+        self.on_content = on_content
+        self.on_image = on_image
+        self.optimize_images = optimize_images
+        self.progress = progress or ProgressTracker()
+        self.metrics = metrics or RunMetrics()
+        self.research = research
+        self.draft = draft
+        self.optimized_dir = os.path.join(os.path.dirname(os.path.abspath(images_dir)), "images_optimized")
+
+        self.images = dict(images or {})
+        self.rendered_chapters = {}
+        self.book_title = book_params["title"]
+
+        self._prompt_queue = queue.Queue()
+        self._image_queue = queue.Queue()
+        self._render_queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._emitted = set()
+        self._cover_queued = False
+        self._errors = []
+
+    # --- Callbacks de la etapa de contenido ---
+
+    def _on_outline(self, outline):
+        self.book_title = outline.get("title", self.book_title)
+        chapters = len(outline.get("chapters", []))
+        self.progress.set_total("content", chapters)
+        self.progress.set_total("images", chapters + 1)
+        self.progress.set_total("render", chapters)
+        self.progress.emit("content", "Esquema del libro listo")
+        # La portada solo necesita el título: puede empezar ya
+        self._cover_queued = True
+        self._image_queue.put(("cover", 0, None, build_cover_prompt(outline, self.book_params)))
+
+    def _on_chapter(self, number, chapter):
+        with self._lock:
+            self._emitted.add(number)
+        self.progress.advance("content", f"Capítulo {number} redactado")
+        self._prompt_queue.put((number, chapter))
+
+    # --- Etapas ---
+
+    def _stage(self, func):
+        """Envuelve una etapa para registrar cualquier error sin bloquear a las demás."""
+        def run():
+            try:
+                func()
+            except GenerationCancelled:
+                logger.info("⏹️ Etapa detenida por cancelación")
+            except Exception as e:
+                logger.exception(f"❌ Error en el pipeline: {str(e)}")
+                with self._lock:
+                    self._errors.append(e)
+        return run
+
+    def _prompt_stage(self):
+        try:
+            while True:
+                item = self._prompt_queue.get()
+                if item is _FIN:
+                    return
+                number, chapter = item
+                prompt = build_chapter_prompt(chapter, self.book_params)
+                self._image_queue.put(("chapter", number, chapter, prompt))
+        finally:
+            # Liberar siempre a la etapa de imágenes, incluso tras un error
+            self._image_queue.put(_FIN)
+
+    def _image_stage(self):
+        while True:
+            item = self._image_queue.get()
+            if item is _FIN:
+                # Reenviar la marca para el resto de hilos de la etapa
+                self._image_queue.put(_FIN)
+                return
+            kind, number, chapter, prompt = item
+            self.progress.check()
+            key = "cover" if kind == "cover" else f"chapter_{number}"
+            cancel_token = self.progress.cancel_token
+            with self._lock:
+                originals = self.images.get(key)
+            if originals is None:
+                if self.draft:
+                    title, label = (self.book_title, "Portada") if kind == "cover" else \
+                        (chapter.get("title", key), f"Capítulo {number}")
+                    generated = generate_draft_image(key, title, label, self.images_dir, metrics=self.metrics)
+                elif kind == "cover":
+                    generated = generate_images_dalle([prompt], self.images_dir, quality="hd",
+                                                      file_names=["cover.png"], max_workers=1,
+                                                      cancel_token=cancel_token, metrics=self.metrics)
+                else:
+                    generated = generate_images_dalle([prompt], self.images_dir,
+                                                      file_names=[f"{key}.png"], max_workers=1,
+                                                      cancel_token=cancel_token, metrics=self.metrics)
+                self.progress.check()
+                if generated:
+                    originals = generated
+                    if self.on_image:
+                        self.on_image(key, generated)
+            if originals:
+                if self.optimize_images:
+                    with self.metrics.timer("optimize"):
+                        packaged = self._optimize(key, originals)
+                else:
+                    packaged = originals
+                with self._lock:
+                    self.images[key] = packaged
+            written = sum(os.path.getsize(info["path"]) for info in originals or [] if os.path.exists(info["path"]))
+            self.progress.advance("images", f"Imagen {key} lista", bytes_written=written)
+            if chapter is not None:
+                self._render_queue.put((number, chapter))
+
+    def _optimize(self, key, infos):
+        """Optimiza las imágenes de una clave; ante un error se empaqueta el original."""
+        optimized = []
+        for info in infos:
+            if "original_path" in info:
+                optimized.append(info)
+                continue
+            try:
+                optimized.append(optimize_image_info(info, image_role(key), self.optimized_dir))
+            except Exception as e:
+                logger.error(f"❌ Error al optimizar {info.get('path')}: {str(e)}")
+                optimized.append(info)
+        return optimized
+
+    def _render_stage(self):
+        while True:
+            item = self._render_queue.get()
+            if item is _FIN:
+                return
+            number, chapter = item
+            with self._lock:
+                images = dict(self.images)
+            with self.metrics.timer("render"):
+                self.rendered_chapters[number] = render_section_body(build_chapter_section(chapter, number, images))
+            logger.info(f"📄 Capítulo {number} renderizado")
+            self.progress.advance("render", f"Capítulo {number} maquetado")
+
+    def run(self):
+        """
+        Ejecuta el pipeline completo.
+
+        Returns:
+            tuple: (book_content, images, rendered_chapters)
+        """
+        prompt_thread = threading.Thread(target=self._stage(self._prompt_stage), name="pipeline-prompts")
+        image_threads = [
+            threading.Thread(target=self._stage(self._image_stage), name=f"pipeline-images-{i}")
+            for i in range(self.image_workers)
+        ]
+        render_thread = threading.Thread(target=self._stage(self._render_stage), name="pipeline-render")
+        for thread in [prompt_thread, *image_threads, render_thread]:
+            thread.daemon = True
+            thread.start()
+
+        book_content = self.book_content
+        try:
+            if book_content is None and self.draft:
+                with self.metrics.timer("content"):
+                    book_content = generate_draft_content(self.book_params)
+                if self.on_content:
+                    self.on_content(book_content)
+            elif book_content is None:
+                with self.metrics.timer("content"):
+                    book_content = generate_book_content(
+                        self.book_params,
+                        on_outline=self._on_outline,
+                        on_chapter=self._on_chapter,
+                        progress=self.progress,
+                        metrics=self.metrics,
+                        research=self.research
+                    )
+                if self.on_content:
+                    self.on_content(book_content)
+            else:
+                logger.info("⏭️ Contenido ya generado, se reutiliza")
+            self.book_title = book_content["title"]
+
+            # Capítulos que no pasaron por los callbacks (contenido reutilizado o de respaldo)
+            if not self._cover_queued:
+                self._on_outline(book_content)
+            for number, chapter in enumerate(book_content["chapters"], 1):
+                if number not in self._emitted:
+                    self._on_chapter(number, chapter)
+        finally:
+            self._prompt_queue.put(_FIN)
+            prompt_thread.join()
+            for thread in image_threads:
+                thread.join()
+            self._render_queue.put(_FIN)
+            render_thread.join()
+
+        self.progress.check()
+        if self._errors:
+            raise self._errors[0]
+
+        logger.info(f"🖼️ Total de imágenes generadas: {sum(len(imgs) for imgs in self.images.values())}")
+        if self.optimize_images:
+            log_savings(summarize_savings(self.images))
+        return book_content, self.images, self.rendered_chapters
+
+
+def run_book_pipeline(book_params, images_dir, image_workers=None, **kwargs):
+    """
+    Genera el contenido, las imágenes y el XHTML de los capítulos solapando las etapas.
+
+    Args:
+        book_params (dict): Parámetros del libro
+        images_dir (str): Directorio donde guardar las imágenes
+        image_workers (int, optional): Hilos de la etapa de imágenes
+        **kwargs: Opciones adicionales de BookPipeline (contenido o imágenes
+            ya generados y callbacks de punto de control)
+
+    Returns:
+        tuple: (book_content, images, rendered_chapters) listos para assemble_epub
+    """
+    return BookPipeline(book_params, images_dir, image_workers, **kwargs).run()
@@ -0,0 +1,127 @@
+"""
+Progreso y cancelación de una generación.
+
+`ProgressTracker` recibe los avances de cada etapa (contenido, imágenes,
+renderizado, exportación) y los envía como eventos a un callback, p. ej. la
+cola que consulta la interfaz gráfica. Cada evento es un diccionario:
+
+    {"stage": "images", "done": 3, "total": 11, "eta": 42.0,
+     "bytes": 1843200, "message": "Imagen chapter_2 lista"}
+
+`CancellationToken` permite detener la generación desde otro hilo: al
+cancelar se ejecutan los cierres registrados (por ejemplo, cortar las
+conexiones de las llamadas a la API en curso, ver api_client.abort_on_cancel)
+y las etapas lanzan `GenerationCancelled` en su siguiente comprobación. La
+exportación que ya haya empezado termina su archivo.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationCancelled(Exception):
+    """La generación se canceló a petición del usuario."""
+
+
+class CancellationToken:
+    """Señal de cancelación compartida entre hilos."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Marca la cancelación y ejecuta los cierres registrados."""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Error al cerrar un recurso tras cancelar: {str(e)}")
+
+    def is_set(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Espera hasta `timeout` segundos; devuelve True si se canceló."""
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback):
+        """Registra una función que se llamará al cancelar (o ya, si está cancelado)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        """Retira una función registrada con on_cancel que ya no hace falta."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def check(self):
+        """Lanza GenerationCancelled si se ha cancelado."""
+        if self._event.is_set():
+            raise GenerationCancelled("Generación cancelada")
+
+
+class ProgressTracker:
+    """
+    Lleva la cuenta de cada etapa y emite eventos de progreso.
+
+    Args:
+        callback (callable, optional): Recibe cada evento (diccionario)
+        cancel_token (CancellationToken, optional): Señal de cancelación
+    """
+
+    def __init__(self, callback=None, cancel_token=None):
+        self.callback = callback
+        self.cancel_token = cancel_token or CancellationToken()
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def _stage(self, stage):
+        return self._stages.setdefault(stage, {"done": 0, "total": None, "bytes": 0, "started": time.monotonic()})
+
+    def check(self):
+        """Lanza GenerationCancelled si se ha cancelado."""
+        self.cancel_token.check()
+
+    def set_total(self, stage, total):
+        """Fija el número de pasos de una etapa."""
+        with self._lock:
+            self._stage(stage)["total"] = total
+
+    def emit(self, stage, message=None, **fields):
+        """Envía un evento de la etapa con su estado actual."""
+        with self._lock:
+            info = self._stage(stage)
+            done, total = info["done"], info["total"]
+            eta = None
+            if total and 0 < done < total:
+                elapsed = time.monotonic() - info["started"]
+                eta = elapsed / done * (total - done)
+            event = {"stage": stage, "done": done, "total": total, "eta": eta,
+                     "bytes": info["bytes"], "message": message, **fields}
+        if self.callback:
+            try:
+                self.callback(event)
+            except Exception as e:
+                logger.debug(f"Error en el callback de progreso: {str(e)}")
+
+    def advance(self, stage, message=None, bytes_written=0, **fields):
+        """Cuenta un paso completado de la etapa y emite el evento."""
+        with self._lock:
+            info = self._stage(stage)
+            info["done"] += 1
+            info["bytes"] += bytes_written
+        self.emit(stage, message, **fields)
@@ -0,0 +1,260 @@
+"""
+Limitadores de tasa compartidos para las llamadas a la API de OpenAI.
+
+`TokenBucket` impone un ritmo fijo. `AdaptiveRateLimiter` parte de ese ritmo
+y lo ajusta con las cabeceras que devuelve la API en cada respuesta
+(x-ratelimit-limit-*, x-ratelimit-remaining-*, x-ratelimit-reset-*) y con
+`retry-after` ante un 429, además de limitar las solicitudes simultáneas con
+un esquema de aumento aditivo y reducción multiplicativa.
+"""
+
+import email.utils
+import re
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Limitador de tipo "cubeta de fichas" seguro entre hilos.
+
+    Permite ráfagas de hasta `capacity` solicitudes y un ritmo sostenido
+    de `rate` solicitudes por segundo.
+    """
+
+    def __init__(self, rate, capacity=1):
+        if rate <= 0:
+            raise ValueError("La tasa del limitador debe ser mayor que cero")
+        self.rate = float(rate)
+        self.capacity = float(max(1, capacity))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1, cancel_token=None):
+        """
+        Bloquea hasta que haya fichas disponibles y las consume.
+
+        Args:
+            tokens (int): Fichas a consumir
+            cancel_token (CancellationToken, optional): Interrumpe la espera si
+                se cancela la generación (lanza GenerationCancelled)
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            sleep(wait, cancel_token)
+
+
+def sleep(seconds, cancel_token=None):
+    """Espera `seconds`; con `cancel_token`, la espera se interrumpe al cancelar."""
+    if cancel_token is None:
+        time.sleep(seconds)
+    elif cancel_token.wait(seconds):
+        cancel_token.check()
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset(value):
+    """
+    Convierte un tiempo de reinicio de OpenAI ("20ms", "1s", "6m0s") a segundos.
+
+    Returns:
+        float | None: Segundos, o None si el valor no se reconoce
+    """
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers):
+    """
+    Lee la espera pedida por el servidor (retry-after-ms o retry-after).
+
+    Returns:
+        float | None: Segundos de espera, o None si no hay cabecera válida
+    """
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value) if value else None
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+def _header_number(headers, name):
+    value = headers.get(name)
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """
+    Cubeta de fichas cuyo ritmo y concurrencia siguen a la cuota real de la cuenta.
+
+    - Con x-ratelimit-limit-requests el ritmo máximo pasa a ser la cuota por
+      minuto de la cuenta, y las solicitudes que quedan se reparten hasta el
+      siguiente reinicio (x-ratelimit-remaining/reset-requests).
+    - Con x-ratelimit-remaining-tokens se frenan las solicitudes cuyo coste
+      estimado no cabe en los tokens que quedan hasta el reinicio.
+    - Un 429 detiene a todos los hilos durante `retry-after` y reduce a la
+      mitad las solicitudes simultáneas; cada éxito las vuelve a aumentar.
+
+    Args:
+        rate (float): Solicitudes por segundo iniciales (antes de ver cabeceras)
+        capacity (int): Solicitudes que pueden salir de golpe
+        max_concurrency (int): Solicitudes simultáneas como máximo
+        min_rate (float): Ritmo mínimo, para no quedarse parado ante cabeceras raras
+    """
+
+    def __init__(self, rate, capacity=1, max_concurrency=4, min_rate=0.05):
+        super().__init__(rate, capacity)
+        self.max_rate = float(rate)
+        self.min_rate = min_rate
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = float(self.max_concurrency)
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._token_budget = None
+        self._token_reset_at = 0.0
+        self._slots = threading.Condition(self._lock)
+
+    def _blocked_for(self, cost):
+        """Segundos que hay que esperar por pausa o por tokens (con el bloqueo tomado)."""
+        now = time.monotonic()
+        wait = self._paused_until - now
+        if cost and self._token_budget is not None and cost > self._token_budget and now < self._token_reset_at:
+            wait = max(wait, self._token_reset_at - now)
+        return wait
+
+    def reserve(self, cost=0, cancel_token=None):
+        """
+        Reserva una solicitud: espera la pausa, el ritmo, los tokens y un hueco libre.
+
+        Cada reserva debe liberarse con `release()` cuando termina la solicitud.
+
+        Args:
+            cost (int): Tokens estimados de la solicitud (0 si no se conocen)
+            cancel_token (CancellationToken, optional): Interrumpe la espera
+        """
+        while True:
+            with self._lock:
+                wait = self._blocked_for(cost)
+            if wait <= 0:
+                break
+            sleep(wait, cancel_token)
+
+        self.acquire(cancel_token=cancel_token)
+        with self._slots:
+            while self._in_flight >= int(self.concurrency):
+                self._slots.wait(0.1)
+                if cancel_token:
+                    cancel_token.check()
+            self._in_flight += 1
+            if cost and self._token_budget is not None:
+                self._token_budget -= cost
+
+    def release(self):
+        """Libera el hueco de una solicitud terminada."""
+        with self._slots:
+            self._in_flight -= 1
+            self._slots.notify()
+
+    def update_from_headers(self, headers):
+        """Ajusta ritmo y presupuesto de tokens con las cabeceras x-ratelimit-*."""
+        if not headers:
+            return
+        limit = _header_number(headers, "x-ratelimit-limit-requests")
+        remaining = _header_number(headers, "x-ratelimit-remaining-requests")
+        reset = parse_reset(headers.get("x-ratelimit-reset-requests"))
+        tokens_left = _header_number(headers, "x-ratelimit-remaining-tokens")
+        tokens_reset = parse_reset(headers.get("x-ratelimit-reset-tokens"))
+
+        with self._lock:
+            self._refill()
+            now = time.monotonic()
+            if limit:
+                self.max_rate = limit / 60.0
+            rate = self.max_rate
+            if remaining is not None and reset:
+                if remaining <= 0:
+                    self._paused_until = max(self._paused_until, now + reset)
+                else:
+                    rate = min(rate, remaining / reset)
+            self.rate = max(self.min_rate, rate)
+            if tokens_left is not None:
+                self._token_budget = tokens_left
+                self._token_reset_at = now + (tokens_reset or 0)
+
+    def on_success(self):
+        """Aumento aditivo: recupera una solicitud simultánea tras cada éxito."""
+        with self._slots:
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / max(1, self.concurrency))
+            self._slots.notify()
+
+    def on_throttle(self, retry_after=None):
+        """Reducción multiplicativa y pausa común tras un 429."""
+        with self._lock:
+            self.concurrency = max(1.0, self.concurrency / 2)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self._tokens = 0.0
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name, requests_per_minute, burst=1, max_concurrency=None):
+    """
+    Devuelve el limitador compartido por todo el proceso para `name`.
+
+    Args:
+        name (str): Identificador del recurso limitado (p. ej. el modelo)
+        requests_per_minute (float): Solicitudes sostenidas por minuto hasta
+            que la API informe de la cuota real
+        burst (int): Número de solicitudes que se permiten de golpe
+        max_concurrency (int, optional): Solicitudes simultáneas como máximo
+            (por defecto, `burst`)
+
+    Returns:
+        AdaptiveRateLimiter: Limitador asociado al nombre
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(requests_per_minute / 60.0, burst, max_concurrency or burst)
+            _limiters[name] = limiter
+        return limiter
@@ -53,4 +53,83 @@ Tema: {tema}
 Nivel académico: {nivel_academico}
 Enfoque: {enfoque}
 Estilo: Apropiado para el público objetivo, colorido, educativo y atractivo visualmente.
-"""
\ No newline at end of file
+"""
+OUTLINE_PROMPT_TEMPLATE = """
+Eres un generador de libros educativos. Diseña el esquema de un libro titulado '{title}' para público {publico}, edades {edad}, con {paginas_deseadas} páginas.
+El tema principal es: {tema}
+Nivel académico: {nivel_academico}
+Enfoque: {enfoque}
+Formato de lenguaje: {formato_idioma}
+Nivel de profundidad: {profundidad}
+
+El contenido de cada capítulo se redactará después, capítulo por capítulo, así que aquí solo
+necesitas los títulos de los capítulos y un resumen breve de lo que cubrirá cada uno.
+Redacta completos la introducción (1 página), los ejercicios, la conclusión (1 página) y la bibliografía.
+Reparte los capítulos para que ocupen el 80% de las páginas indicadas.
+
+Devuelve el esquema en formato JSON con la siguiente estructura, con los campos en este orden:
+{{
+  "title": "Título del libro",
+  "description": "Breve descripción",
+  "tema": "Tema principal del libro",
+  "publico": "Público objetivo",
+  "edad": "Rango de edad",
+  "nivel_academico": "Nivel académico",
+  "enfoque": "Enfoque del libro",
+  "formato_idioma": "Formato del lenguaje",
+  "profundidad": "Nivel de profundidad",
+  "chapters": [
+    {{"title": "Título del capítulo 1", "summary": "Qué cubrirá el capítulo 1..."}},
+    ...
+  ],
+  "toc": {{"Capítulo 1": "página 3", ...}},
+  "introduction": "Texto de introducción...",
+  "exercises": [
+    {{"title": "Ejercicio 1", "description": "Descripción del ejercicio 1..."}},
+    ...
+  ],
+  "conclusion": "Texto de conclusión...",
+  "bibliography": ["Referencia 1", "Referencia 2", ...]
+}}
+"""
+
+CHAPTER_PROMPT_TEMPLATE = """
+Estás escribiendo el libro educativo '{title}' para público {publico}, edades {edad}.
+El tema principal es: {tema}
+Nivel académico: {nivel_academico}
+Enfoque: {enfoque}
+Formato de lenguaje: {formato_idioma}
+Nivel de profundidad: {profundidad}
+
+Capítulos del libro:
+{chapter_list}
+
+Redacta ahora el capítulo {chapter_number}: '{chapter_title}'.
+Resumen previsto: {chapter_summary}
+
+Escribe el capítulo completo, con datos precisos, ejemplos claros y un lenguaje apropiado para el
+rango de edad. Separa los párrafos con una línea en blanco y no repitas el contenido de otros capítulos.
+
+Devuelve el capítulo en formato JSON con la siguiente estructura:
+{{
+  "content": "Contenido completo del capítulo..."
+}}
+"""
+
+RESEARCH_PROMPT_TEMPLATE = """
+Información de referencia obtenida de fuentes públicas. Úsala para que los datos sean precisos,
+sin copiarla literalmente ni citar la fuente:
+{digest}
+"""
+
+OUTLINE_CONTINUATION_TEMPLATE = """
+Tu respuesta anterior con este esquema se cortó antes de terminar. Estas partes ya están completas
+y no debes repetirlas: {received}.
+{chapters_note}
+Devuelve solo un objeto JSON con los campos que faltan ({missing}), con la misma estructura que arriba.
+"""
+
+OUTLINE_CONTINUATION_CHAPTERS_NOTE = """Los capítulos recibidos son:
+{chapter_list}
+En "chapters" incluye solo los capítulos que faltan, empezando por el capítulo {next_chapter}.
+"""
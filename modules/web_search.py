@@ -1,73 +1,237 @@
-import requests
+"""
+Búsquedas web para documentar el contenido del libro antes de redactarlo.
+
+Las búsquedas pasan por un proveedor intercambiable (DuckDuckGo por defecto,
+o `StaticProvider` con resultados fijos para pruebas sin red), usan la sesión
+HTTP compartida con tiempos de espera cortos y se guardan en una caché en
+disco con TTL. `Researcher` lanza en paralelo la búsqueda del tema y la de
+cada capítulo, y cada prompt espera como mucho RESEARCH_DEADLINE segundos
+a la suya: la investigación nunca añade N viajes de ida y vuelta seguidos.
+"""
+
 import logging
-from config import DUCKDUCKGO_SEARCH_URL
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from urllib.parse import quote_plus
+from modules.config import (
+    DUCKDUCKGO_SEARCH_URL, SEARCH_PROVIDER, SEARCH_TIMEOUT, SEARCH_MAX_RESULTS,
+    RESEARCH_MAX_WORKERS, RESEARCH_DEADLINE, RESEARCH_DIGEST_CHARS
+)
+from modules.cache import ResponseCache, get_search_cache
+from modules.metrics import RunMetrics
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def search_topic(query: str, max_results: int = 10) -> str:
+
+def parse_duckduckgo(data, max_results):
+    """Extrae los fragmentos de texto de una respuesta de la API de DuckDuckGo."""
+    results = []
+    for field in ("Abstract", "Definition"):
+        if data.get(field):
+            results.append(data[field])
+
+    for topic in data.get("RelatedTopics") or []:
+        # Algunos temas vienen anidados en grupos
+        for item in topic.get("Topics", [topic]):
+            if item.get("Text"):
+                results.append(item["Text"])
+        if len(results) >= max_results:
+            break
+    return results[:max_results]
+
+
+class DuckDuckGoProvider:
+    """Búsqueda con la API instantánea de DuckDuckGo sobre la sesión HTTP compartida."""
+
+    name = "duckduckgo"
+
+    def __init__(self, url_template=DUCKDUCKGO_SEARCH_URL, timeout=SEARCH_TIMEOUT):
+        self.url_template = url_template
+        self.timeout = timeout
+
+    def search(self, query, max_results):
+        from modules.downloader import get_session
+
+        response = get_session().get(self.url_template.format(quote_plus(query)), timeout=self.timeout)
+        response.raise_for_status()
+        return parse_duckduckgo(response.json(), max_results)
+
+
+class StaticProvider:
+    """
+    Proveedor local con resultados fijos, para pruebas y benchmarks sin red.
+
+    Args:
+        results (dict, optional): Consulta -> lista de fragmentos
+        default (list): Fragmentos para las consultas que no están en `results`
+    """
+
+    name = "static"
+
+    def __init__(self, results=None, default=()):
+        self.results = results or {}
+        self.default = list(default)
+
+    def search(self, query, max_results):
+        return list(self.results.get(query, self.default))[:max_results]
+
+
+PROVIDERS = {
+    "duckduckgo": DuckDuckGoProvider,
+    "static": StaticProvider,
+}
+
+
+def get_provider(name=None):
+    """Crea el proveedor de búsqueda `name` (por defecto SEARCH_PROVIDER)."""
+    name = name or SEARCH_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Proveedor de búsqueda desconocido: {name} (disponibles: {', '.join(PROVIDERS)})")
+    return PROVIDERS[name]()
+
+
+def search_snippets(query, max_results=SEARCH_MAX_RESULTS, provider=None, metrics=None):
+    """
+    Busca `query` y devuelve los fragmentos de texto encontrados, con caché.
+
+    Args:
+        query (str): Consulta
+        max_results (int): Fragmentos como máximo
+        provider (optional): Proveedor de búsqueda (por defecto SEARCH_PROVIDER)
+        metrics (RunMetrics, optional): Métricas de la ejecución
+
+    Returns:
+        list: Fragmentos; vacía si la búsqueda falla (los fallos no se guardan)
+    """
+    provider = provider or get_provider()
+    metrics = metrics or RunMetrics()
+    cache = get_search_cache()
+    cache_key = ResponseCache.make_key(kind="search", provider=provider.name, query=query,
+                                       max_results=max_results) if cache else None
+    cached = cache.get_json(cache_key) if cache else None
+    if cached is not None:
+        metrics.incr("search_cache_hits")
+        return cached
+
+    try:
+        with metrics.timer("search"):
+            snippets = provider.search(query, max_results)
+    except Exception as e:
+        logger.warning(f"⚠️ Búsqueda fallida para '{query}': {str(e)}")
+        metrics.incr("search_errors")
+        return []
+
+    if cache:
+        cache.put_json(cache_key, snippets)
+    return snippets
+
+
+def make_digest(snippets, max_chars=RESEARCH_DIGEST_CHARS):
+    """Une los fragmentos en una lista con viñetas de como mucho `max_chars` caracteres."""
+    lines, length = [], 0
+    for snippet in snippets:
+        line = f"- {' '.join(snippet.split())}"
+        if length + len(line) > max_chars:
+            break
+        lines.append(line)
+        length += len(line) + 1
+    return "\n".join(lines)
+
+
+def search_topic(query: str, max_results: int = 10, provider=None) -> str:
     """
-    Busca información sobre un tema utilizando la API de DuckDuckGo y la enriquece para su uso en generación de contenido.
+    Busca información sobre un tema y la enriquece para su uso en generación de contenido.
 
     Args:
         query (str): Tema a buscar
         max_results (int): Número máximo de resultados a procesar
-    
+        provider (optional): Proveedor de búsqueda (por defecto SEARCH_PROVIDER)
+
     Returns:
         str: Información ampliada sobre el tema
     """
-    try:
-        search_url = DUCKDUCKGO_SEARCH_URL.format(query)
-        logger.info(f"Buscando información sobre: {query}")
-        
-        response = requests.get(search_url)
-        if response.status_code != 200:
-            logger.warning(f"Error al buscar información. Código: {response.status_code}")
-            return f"No se encontró información confiable sobre {query}."
+    logger.info(f"🔎 Buscando información sobre: {query}")
+    results = search_snippets(query, max_results, provider)
+    if not results:
+        logger.warning(f"⚠️ No se encontró información para: {query}")
+        return f"Este tema, {query}, es importante pero actualmente no se dispone de suficiente información detallada."
+
+    joined_text = "\n".join(results)
+    return (f"A continuación se presenta un resumen sobre el tema '{query}':\n\n{joined_text}\n\n"
+            f"Esta información sirve como base para desarrollar un contenido más profundo y educativo sobre el tema.")
 
+
+class Researcher:
+    """
+    Lanza en paralelo las búsquedas del libro y de sus capítulos y entrega los resúmenes.
+
+    La búsqueda del tema empieza a la vez que el esquema y la de cada
+    capítulo en cuanto se conoce su título (con el esquema por streaming,
+    antes de que termine de llegar). Cada prompt espera a su
+    búsqueda como mucho `deadline` segundos desde que se lanzó; si no ha
+    llegado, el capítulo se redacta sin ella.
+
+    Args:
+        book_params (dict): Parámetros del libro
+        provider (optional): Proveedor de búsqueda (por defecto SEARCH_PROVIDER)
+        max_workers (int): Búsquedas simultáneas
+        deadline (float): Segundos de espera máxima por búsqueda
+        metrics (RunMetrics, optional): Métricas de la ejecución
+    """
+
+    def __init__(self, book_params, provider=None, max_workers=RESEARCH_MAX_WORKERS,
+                 deadline=RESEARCH_DEADLINE, metrics=None):
+        self.book_params = book_params
+        self.provider = provider or get_provider()
+        self.deadline = deadline
+        self.metrics = metrics or RunMetrics()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="research")
+        self._searches = {}
+        # El callback del esquema lanza búsquedas mientras los hilos de los capítulos las consultan
+        self._lock = threading.Lock()
+
+    def _submit(self, key, query):
+        """Lanza la búsqueda `key` salvo que ya esté en marcha."""
+        with self._lock:
+            if key in self._searches:
+                return
+            future = self._executor.submit(search_snippets, query, SEARCH_MAX_RESULTS, self.provider, self.metrics)
+            self._searches[key] = (future, time.monotonic(), query)
+
+    def start_book(self):
+        """Lanza la búsqueda del tema principal del libro."""
+        self._submit("book", self.book_params["tema"])
+
+    def start_chapter(self, number, chapter):
+        """Lanza la búsqueda de un capítulo, si no estaba ya en marcha."""
+        self._submit(number, f"{self.book_params['tema']} {chapter.get('title', '')}".strip())
+
+    def start_chapters(self, outline):
+        """Lanza a la vez la búsqueda de cada capítulo del esquema."""
+        for number, chapter in enumerate(outline.get("chapters", []), 1):
+            self.start_chapter(number, chapter)
+        logger.info(f"🔎 {len(outline.get('chapters', []))} búsquedas de capítulos en marcha")
+
+    def _snippets(self, key):
+        with self._lock:
+            search = self._searches.get(key)
+        if search is None:
+            return []
+        future, started, query = search
         try:
-            data = response.json()
-        except Exception as e:
-            logger.warning(f"Error al parsear JSON: {str(e)}")
-            return f"No se pudo interpretar la información sobre {query}."
-
-        results = []
-
-        # Abstract
-        if data.get("Abstract"):
-            results.append(f"{data['Abstract']}")
-
-        # Definition
-        if data.get("Definition"):
-            results.append(f"{data['Definition']}")
-
-        # Expandir RelatedTopics
-        if data.get("RelatedTopics"):
-            topics = data["RelatedTopics"]
-            count = 0
-            for topic in topics:
-                if "Text" in topic:
-                    results.append(topic["Text"])
-                    count += 1
-                elif "Topics" in topic:  # algunos vienen anidados
-                    for sub in topic["Topics"]:
-                        if "Text" in sub:
-                            results.append(sub["Text"])
-                            count += 1
-                if count >= max_results:
-                    break
-
-        if not results:
-            logger.warning(f"No se encontró información para: {query}")
-            return f"Este tema, {query}, es importante pero actualmente no se dispone de suficiente información detallada."
-
-        # Unir y expandir contenido
-        joined_text = "\n".join(results)
-        expanded = f"A continuación se presenta un resumen sobre el tema '{query}':\n\n{joined_text}\n\nEsta información sirve como base para desarrollar un contenido más profundo y educativo sobre el tema."
-
-        logger.info(f"Contenido generado de búsqueda para: {query}")
-        return expanded
+            return future.result(timeout=max(0.0, self.deadline - (time.monotonic() - started)))
+        except FutureTimeout:
+            logger.warning(f"⏱️ La búsqueda '{query}' no llegó a tiempo, se continúa sin ella")
+            self.metrics.incr("research_timeouts")
+            return []
 
-    except Exception as e:
-        logger.error(f"Fallo en búsqueda: {str(e)}")
-        return f"Hubo un error al buscar información sobre {query}."
+    def digest(self, chapter_number):
+        """Resumen para el prompt de un capítulo: su búsqueda y la del tema del libro."""
+        snippets = self._snippets(chapter_number) + self._snippets("book")
+        # Quitar duplicados conservando el orden (los temas relacionados se repiten)
+        return make_digest(list(dict.fromkeys(snippets)))
+
+    def close(self):
+        """Descarta las búsquedas pendientes sin esperarlas."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,94 @@
+"""
+Renderizador de XHTML para las páginas del EPUB.
+
+Genera XHTML bien formado en una sola pasada a partir de plantillas
+precompiladas y del modelo intermedio del libro (modules.book_model),
+escapando todo el texto que viene del modelo. Sustituye al antiguo recorrido
+f-string -> BeautifulSoup -> str de cada página.
+
+`render_section_body` devuelve solo el contenido del <body>, que es lo que
+necesita el escritor de EPUB; `render_page` lo envuelve en un documento XHTML
+completo.
+"""
+
+from html import escape
+from string import Template
+from modules.book_model import Paragraph, Heading, Image, Exercise
+
+PAGE_TEMPLATE = Template("""<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" lang="es" xml:lang="es">
+<head>
+<title>$title</title>
+<link rel="stylesheet" type="text/css" href="style.css"/>
+</head>
+<body>$body</body>
+</html>
+""")
+
+COVER_TEMPLATE = Template('<div class="cover"><h1>$heading</h1>$content</div>')
+SECTION_TEMPLATE = Template('<h1$heading_class>$heading</h1>$content')
+IMAGE_TEMPLATE = Template('<img src="$src" alt="$alt"/>')
+EXERCISE_TEMPLATE = Template('<div class="exercise"><h3>$title</h3><p>$description</p></div>\n')
+
+# Clase del encabezado y contenedor de los bloques según el tipo de sección.
+# Contenedor None: los bloques van directamente tras el encabezado.
+SECTION_LAYOUT = {
+    "toc": ("toc-title", None),
+    "exercises": (None, None),
+    "bibliography": (None, "bibliography"),
+}
+DEFAULT_LAYOUT = (None, "")
+
+
+def _text(value):
+    """Escapa un valor de texto para insertarlo en XHTML."""
+    return escape(str(value), quote=True)
+
+
+def _class_attr(css_class):
+    return f' class="{css_class}"' if css_class else ""
+
+
+def render_page(title, body):
+    """Envuelve el cuerpo de una página en un documento XHTML completo."""
+    return PAGE_TEMPLATE.substitute(title=_text(title), body=body)
+
+
+def render_block(block):
+    """Renderiza un bloque del modelo del libro."""
+    if isinstance(block, Paragraph):
+        return f"<p{_class_attr(block.style)}>{_text(block.text)}</p>\n"
+    if isinstance(block, Image):
+        return IMAGE_TEMPLATE.substitute(src=_text(block.file_name), alt=_text(block.description))
+    if isinstance(block, Exercise):
+        title = f"Ejercicio {block.number}: {block.title}" if block.title else f"Ejercicio {block.number}"
+        return EXERCISE_TEMPLATE.substitute(title=_text(title), description=_text(block.description))
+    if isinstance(block, Heading):
+        level = min(block.level + 1, 6)  # h1 se reserva para el título de la sección
+        return f"<h{level}>{_text(block.text)}</h{level}>\n"
+    raise TypeError(f"Bloque desconocido: {type(block).__name__}")
+
+
+def render_section_body(section):
+    """
+    Renderiza el cuerpo XHTML de una sección del libro.
+
+    Args:
+        section (Section): Sección del modelo del libro
+
+    Returns:
+        str: Contenido XHTML del <body>
+    """
+    content = "".join(render_block(block) for block in section.blocks)
+    if section.kind == "cover":
+        return COVER_TEMPLATE.substitute(heading=_text(section.heading), content=content)
+
+    heading_class, container_class = SECTION_LAYOUT.get(section.kind, DEFAULT_LAYOUT)
+    if container_class is not None:
+        content = f"<div{_class_attr(container_class)}>{content}</div>"
+    return SECTION_TEMPLATE.substitute(
+        heading_class=_class_attr(heading_class),
+        heading=_text(section.heading),
+        content=content
+    )